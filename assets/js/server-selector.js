@@ -19,6 +19,8 @@ var cdnString = "http://cdn.dexlabs.systems/ff/big";
 var versionArray;
 var serverArray;
 var cacheSizes;
+var cacheSockets = [];
+var cacheWatcher;
 var defaultHashes;
 var config;
 
@@ -57,6 +59,16 @@ function disableVersionAddButton() {
     $("#of-addversion-button").prop("disabled", true);
 }
 
+function updateCacheCommandButtons() {
+    // pausing, resuming and stopping only make sense while the cache handler runs
+    var running = cacheSockets.length > 0;
+    $.each(["pause", "resume", "cancel"], function (key, command) {
+        var button = $("#of-" + command + "cache-button");
+        button.toggleClass("disabled", !running);
+        button.prop("disabled", !running);
+    });
+}
+
 function disableVersionListButtons() {
     $("#of-editversion-button").addClass("disabled");
     $("#of-editversion-button").prop("disabled", true);
@@ -352,7 +364,12 @@ function editConfig() {
 
     loadConfig();
     // check all offline caches if the offline root changes
-    if (shouldChangeRoot) handleCache("hash-check", null, "offline");
+    // and keep watching them in the new root
+    if (shouldChangeRoot) {
+        handleCache("hash-check", null, "offline", function () {
+            if (cacheWatcher) startCacheWatch();
+        });
+    }
 }
 
 function validateCacheLocation() {
@@ -507,7 +524,7 @@ function getCacheLabelText(sizes) {
 
     var gb = 1 << 30;
     var labelText =
-        (sizes.intact / gb).toFixed(2) +
+        ((sizes.intact + (sizes.downloading || 0)) / gb).toFixed(2) +
         " / " +
         (sizes.total / gb).toFixed(2) +
         " GB";
@@ -517,6 +534,10 @@ function getCacheLabelText(sizes) {
             "<br/>(" + (sizes.altered / gb).toFixed(2) + " GB Altered)";
     }
 
+    if (sizes.min_playable && sizes.intact < sizes.total) {
+        labelText += "<br/>(Playable)";
+    }
+
     return labelText;
 }
 
@@ -696,24 +717,7 @@ function storageLoadingComplete(allSizes) {
                 buttonFix.children[0].setAttribute("class", "fas fa-hammer");
             }
 
-            if (sizes.intact > 0 || sizes.altered > 0) {
-                buttonDelete.removeAttribute("disabled");
-
-                if (cacheMode === "offline") {
-                    buttonDownload.setAttribute("disabled", "");
-
-                    if (sizes.altered > 0 || sizes.intact < sizes.total) {
-                        buttonFix.removeAttribute("disabled");
-                    }
-                }
-            } else {
-                buttonDelete.setAttribute("disabled", "");
-
-                if (cacheMode === "offline") {
-                    buttonDownload.removeAttribute("disabled");
-                    buttonFix.setAttribute("disabled", "");
-                }
-            }
+            updateCacheButtons(versionString, cacheMode, sizes);
         });
     });
 
@@ -721,7 +725,61 @@ function storageLoadingComplete(allSizes) {
     enableVersionAddButton();
 }
 
-function handleCache(operation, versionString, cacheMode, callback) {
+function updateCacheButtons(versionString, cacheMode, sizes) {
+    var buttonDelete = document.getElementById(
+        getCacheButtonID(versionString, cacheMode, "delete")
+    );
+    var buttonDownload = document.getElementById(
+        getCacheButtonID(versionString, cacheMode, "download")
+    );
+    var buttonFix = document.getElementById(
+        getCacheButtonID(versionString, cacheMode, "fix")
+    );
+
+    if (!buttonDelete) return;
+
+    if (sizes.intact > 0 || sizes.altered > 0) {
+        buttonDelete.removeAttribute("disabled");
+
+        if (cacheMode === "offline") {
+            buttonDownload.setAttribute("disabled", "");
+
+            if (sizes.altered > 0 || sizes.intact < sizes.total) {
+                buttonFix.removeAttribute("disabled");
+            } else {
+                buttonFix.setAttribute("disabled", "");
+            }
+        }
+    } else {
+        buttonDelete.setAttribute("disabled", "");
+
+        if (cacheMode === "offline") {
+            buttonDownload.removeAttribute("disabled");
+            buttonFix.setAttribute("disabled", "");
+        }
+    }
+}
+
+function isCacheLoading(versionString, cacheMode) {
+    var buttonDelete = document.getElementById(
+        getCacheButtonID(versionString, cacheMode, "delete")
+    );
+
+    // caches that are being operated on show spinners until the operation completes
+    return (
+        buttonDelete !== null &&
+        buttonDelete.children[0].getAttribute("class").indexOf("fa-spinner") >=
+            0
+    );
+}
+
+function handleCache(
+    operation,
+    versionString,
+    cacheMode,
+    callback,
+    verifyTier
+) {
     // see if any versions match (could be undefined or null)
     var versions = versionArray.filter(function (obj) {
         return obj.name === versionString;
@@ -729,7 +787,22 @@ function handleCache(operation, versionString, cacheMode, callback) {
     // pull version url from the found object, if none found, use the default cdn link
     var cdnRoot = versions.length === 0 ? cdnString : versions[0].url;
 
-    var lastSizes = { intact: 0, altered: 0, total: 0 };
+    // plain hash checks can trust file stats, everything else hashes files fully
+    verifyTier = verifyTier || (operation === "hash-check" ? "stat" : "full");
+
+    // download the files needed to start playing before everything else
+    // only downloads need the order, finding it scans the playable caches
+    var priorityArgs =
+        operation === "download" || operation === "fix"
+            ? [
+                  "--download-order",
+                  "priority",
+                  "--priority-file",
+                  path.join(__dirname, "/defaults/priorities.json"),
+              ]
+            : [];
+
+    var lastSizes = {};
     var buf = "";
 
     // start loading on the given version and mode (could be undefined or null, which means 'all')
@@ -739,6 +812,15 @@ function handleCache(operation, versionString, cacheMode, callback) {
     var server = net.createServer(function (sock) {
         sock.setEncoding("utf8");
 
+        // keep track of the socket so that commands can be sent to the cache handler
+        cacheSockets.push(sock);
+        updateCacheCommandButtons();
+
+        sock.on("close", function () {
+            cacheSockets.splice(cacheSockets.indexOf(sock), 1);
+            updateCacheCommandButtons();
+        });
+
         sock.on("data", function (data) {
             // read data until the next \n, and keep reading
             // sometimes the updates are buffered, so there might be multiple objects
@@ -753,8 +835,12 @@ function handleCache(operation, versionString, cacheMode, callback) {
                 buf = buf.substring(end + 1);
 
                 // run a storage update here
-                lastSizes = JSON.parse(sub);
-                storageLoadingUpdate(lastSizes);
+                // updates only carry the caches that changed, so merge them in
+                var changes = JSON.parse(sub);
+                $.each(changes, function (vKey, vSizes) {
+                    lastSizes[vKey] = $.extend(lastSizes[vKey] || {}, vSizes);
+                });
+                storageLoadingUpdate(changes);
 
                 end = buf.indexOf("\n");
             }
@@ -785,9 +871,21 @@ function handleCache(operation, versionString, cacheMode, callback) {
                 // learn port from the server object and tell the script where to connect
                 "--port",
                 server.address().port,
+                "--verify-tier",
+                verifyTier,
+                // bandwidth limits in KiB/s, 0 means unlimited
+                "--bandwidth-limit",
+                config["bandwidth-limit"] || 0,
+                "--connection-bandwidth-limit",
+                config["connection-bandwidth-limit"] || 0,
+                // stay out of the way of the game and other programs if asked to
+                "--process-priority",
+                config["low-priority-caching"] ? "low" : "normal",
                 // tell the script which versions and caches are official
                 "--official-caches",
-            ].concat(Object.keys(defaultHashes)),
+            ]
+                .concat(Object.keys(defaultHashes))
+                .concat(priorityArgs),
             {
                 stdio: "inherit",
             }
@@ -815,6 +913,83 @@ function handleCache(operation, versionString, cacheMode, callback) {
     });
 }
 
+function sendCacheCommand(command) {
+    // commands are "pause", "resume" and "cancel", one per line
+    $.each(cacheSockets, function (key, sock) {
+        sock.write(command + "\n");
+    });
+}
+
+function startCacheWatch() {
+    // restart the watch if it is already running, e.g. if the offline root changed
+    stopCacheWatch();
+
+    var buf = "";
+
+    // leave the watch out of cacheSockets, pause and cancel are for the operations
+    var server = net.createServer(function (sock) {
+        sock.setEncoding("utf8");
+
+        sock.on("data", function (data) {
+            buf += data;
+
+            var end = buf.indexOf("\n");
+
+            while (end > 0) {
+                var sub = buf.substring(0, end);
+                buf = buf.substring(end + 1);
+
+                // only the caches whose files changed on disk are reported
+                var changes = JSON.parse(sub);
+                storageLoadingUpdate(changes);
+
+                // refresh the buttons, unless an operation will do it once it completes
+                $.each(changes, function (versionString, vSizes) {
+                    $.each(vSizes, function (cacheMode, sizes) {
+                        if (!isCacheLoading(versionString, cacheMode)) {
+                            updateCacheButtons(versionString, cacheMode, sizes);
+                        }
+                    });
+                });
+
+                end = buf.indexOf("\n");
+            }
+        });
+    });
+
+    server.listen(0, "localhost", function () {
+        cacheWatcher = spawn(
+            path.join(__dirname, "lib", "cache_handler.exe"),
+            [
+                "--operation",
+                "watch",
+                "--playable-root",
+                cacheRoot,
+                "--offline-root",
+                offlineRoot,
+                "--user-dir",
+                userData,
+                "--port",
+                server.address().port,
+                "--official-caches",
+            ].concat(Object.keys(defaultHashes)),
+            {
+                stdio: "inherit",
+            }
+        ).on("exit", function () {
+            // when the watch exits, close the server
+            server.close();
+        });
+    });
+}
+
+function stopCacheWatch() {
+    if (cacheWatcher) {
+        cacheWatcher.kill();
+        cacheWatcher = null;
+    }
+}
+
 function performCacheSwap(newVersion) {
     var currentCache = path.join(cacheRoot, "FusionFall");
     var newCache = path.join(cacheRoot, newVersion);
@@ -899,7 +1074,8 @@ function prepGameInfo(serverUUID) {
                 var versionURL =
                     sizes.intact < sizes.total ? versionInfo.url : offlineURL;
                 setGameInfo(serverInfo, versionURL);
-            }
+            },
+            "full"
         );
         return;
     }
@@ -1121,8 +1297,9 @@ $("#of-deleteversionmodal").on("show.bs.modal", function (e) {
 });
 
 // Run the global hash check once and only if the cache modal is ever shown
+// then keep the sizes up to date as the caches change
 $("#of-editcacheconfigmodal").on("show.bs.modal", function (e) {
-    if (!cacheSizes) handleCache("hash-check");
+    if (!cacheSizes) handleCache("hash-check", null, null, startCacheWatch);
 });
 
 // Keep all config values synced on modal show
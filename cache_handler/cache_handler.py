@@ -1,17 +1,51 @@
+import io
+import os
+import sys
+import copy
+import html
 import json
+import time
 import random
 import shutil
 import asyncio
+import tarfile
 import hashlib
-from pathlib import Path
-from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+import itertools
+import email.utils
+import urllib.parse
+from pathlib import Path, PureWindowsPath
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
 from argparse import Namespace, ArgumentParser
 
 import httpx
 import aiofiles
 from bs4 import BeautifulSoup
 
+# faster local digests, if available
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# HTTP/2 support for the download client, if available
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+# filesystem change notifications for the watch operation, if available
+try:
+    import watchdog.observers
+except ImportError:
+    watchdog = None
+
 
 # hack to get pyinstaller 3.5 to work
 if False:
@@ -26,29 +60,125 @@ BUF_SIZE: int = 1 << 16
 Chunk size for both downloading and hash checking.
 """
 
-VMDict = Dict[str, Dict[str, Dict[str, Any]]]
+SEGMENT_THRESHOLD: int = 1 << 23
 """
-Cache Version - Cache Mode are the access keys for the first two steps in these dicts.
+Minimum size of a file, in bytes, for it to be downloaded in multiple segments at once.
+"""
+
+SEGMENT_COUNT: int = 4
+"""
+Number of segments that large files are split into when downloading.
+"""
+
+OBSERVED_PRIORITY_COUNT: int = 32
+"""
+Number of files that the game was observed to access first, which are downloaded
+right after the files of the priority file. Later files are only needed further into
+the game, so they are downloaded in the regular order.
+"""
+
+SAMPLE_COUNT: int = 8
+"""
+Number of `BUF_SIZE` blocks, spread evenly across a file, that make up its sample for
+sampled verification.
+"""
+
+LOCK_POLL_INTERVAL: float = 0.5
+"""
+Seconds to wait between attempts to take a lock that another run of this script holds.
+"""
+
+PROGRESS_INTERVAL: float = 0.5
+"""
+Seconds between updates sent to the client about the bytes of files being downloaded.
+"""
+
+WATCH_SETTLE_DELAY: float = 2.0
+"""
+Seconds without further changes that the watch operation waits for before checking
+the files that changed, so that files being written are checked once they are complete.
+"""
+
+WATCH_POLL_INTERVAL: float = 10.0
+"""
+Seconds between the stat checks of the watch operation, when filesystem change
+notifications are not available.
+"""
+
+KEEPALIVE_EXPIRY: float = 30.0
+"""
+Default number of seconds that an idle connection is kept open for. Longer than the
+default of `httpx`, so that connections outlive the hash checks between downloads.
+"""
+
+WARM_CONNECTIONS: int = 2
+"""
+Default number of connections opened to each host ahead of a download, while the cache
+collections are still being locked and loaded.
+"""
+
+MIRROR_FAILURE_LIMIT: int = 3
+"""
+Number of consecutive failures after which a mirror is only used if no healthy mirror
+is left.
+"""
+
+RETRY_BASE_DELAY: float = 1.0
+"""
+Upper bound of the first delay before retrying a failed download, in seconds. The bound
+doubles with every retry, and the actual delay is picked at random below it.
+"""
+
+RETRY_MAX_DELAY: float = 30.0
+"""
+Largest delay before retrying a failed download, in seconds.
+"""
+
+CIRCUIT_FAILURE_LIMIT: int = 5
+"""
+Number of consecutive transient failures after which no more downloads are attempted
+from a host for a while.
+"""
+
+CIRCUIT_COOLDOWN: float = 30.0
+"""
+Seconds to wait before attempting downloads from a host that failed too many times in
+a row again.
 """
 
-size_dict: VMDict = {}
+RECORD_SUFFIXES: List[str] = ['_sizes', '_validators', '_stats']
 """
-The dictionary that keeps the most up-to-date version of intact, altered and total
-cache sizes. This dictionary will only have the keys that are associated with the
-operation of this script: not all keys might be present at all times!
+Suffixes of the per-file record dictionaries kept next to the hashes of each cache
+mode in `hash_dict`, like `offline_validators` next to `offline`.
 """
 
-hash_dict: VMDict = {}
+ARCHIVE_MANIFEST: str = 'hashes.json'
 """
-The dictionary that keeps the most up-to-date version of the hashes associated with
-the caches. This will contain all the keys that should be present in the `hashes.json`
-file, and its current state might be used to update the `hashes.json` file itself.
+Name of the first member of a version pack archive, which holds the registered sizes
+and hashes of the archived cache collections, in the same layout as `hashes.json`.
 """
 
-hash_dict_updated: bool = False
+LOCAL_DIGEST: str = 'blake3' if blake3 else ('xxh3' if xxhash else 'blake2b')
 """
-Indicates whether the `hash_dict` has been updated and should be used to overwrite
-`hashes.json` at the end of the script.
+Algorithm of the local digests kept in stat records, which only detect local changes
+to files and are much cheaper to calculate than `sha256`. Digests are prefixed with
+the algorithm, so that digests of another algorithm are never compared.
+"""
+
+SNAPSHOT_KEYS: List[str] = ['intact', 'altered', 'total', 'min_playable']
+"""
+Keys of the objects in `size_dict` that are saved into the size snapshot, which leaves
+out the keys that only describe a single run, like `downloading`.
+"""
+
+DEFAULT_CDN_ROOT: str = 'http://cdn.dexlabs.systems/ff/big'
+"""
+The URL that holds every official cache version by name.
+"""
+
+VMDict = Dict[str, Dict[str, Dict[str, Any]]]
+"""
+Cache Version - Cache Mode are the access keys for the first two steps in these dicts.
 """
 
 
@@ -176,6 +306,10 @@ class FileInfoGroup:
     `file_info_list`: `List[FileInfo]`
         The list of files, associated with this group. All `FileInfo` objects in this
         list refer to files with proper `sha256` values.
+    `priority_list`: `List[str] = []`
+        Relative paths of the registered files that should be downloaded before all
+        others, in order. Once all of them are intact, the cache is considered
+        minimally playable. Empty if downloads should not be prioritized.
     """
     version: str
     mode: str
@@ -183,6 +317,7 @@ class FileInfoGroup:
     local_root: Path
     url_root: str
     file_info_list: List[FileInfo]
+    priority_list: List[str] = field(default_factory=list)
 
     def default_file_info(self) -> FileInfo:
         """
@@ -205,671 +340,1022 @@ class FileInfoGroup:
         )
 
 
-# IPC
-
-
-async def send_message(writer: asyncio.StreamWriter) -> None:
+class TokenBucket:
     """
-    Sends the current `size_dict` update over to the client.
+    A token bucket that limits the rate at which bytes can be transferred. Consumers
+    are served in order, and are allowed to run into debt for amounts larger than the
+    capacity of the bucket, in which case they wait until the debt is paid off.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
+    `rate`: `float`
+        The rate at which tokens (bytes) are added to the bucket, per second.
+    `capacity`: `float = 0`
+        The maximum amount of tokens the bucket can hold, which is the maximum burst
+        size. Defaults to a second's worth of tokens.
     """
-    message = (json.dumps(size_dict) + '\n').encode('utf-8')
-    writer.write(message)
-    await writer.drain()
 
+    def __init__(self, rate: float, capacity: float = 0) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.lock = asyncio.Lock()
 
-# Hash Helpers
+    async def consume(self, amount: int) -> None:
+        """
+        Takes the given amount of tokens out of the bucket, waiting for the bucket to
+        refill if there are not enough tokens.
 
+        Parameters
+        ----------
+        `amount`: `int`
+            The amount of tokens (bytes) to consume.
+        """
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
 
-async def get_file_size_and_hash(file_path: Path) -> Tuple[int, str]:
-    """
-    Asynchronously reads a file, calculates its size and `sha256` hash.
+            self.tokens -= amount
+            if self.tokens < 0:
+                await asyncio.sleep(-self.tokens / self.rate)
 
-    Parameters
-    ----------
-    `file_path`: `Path`
-        The local path of the file to calculate size and hash for.
 
-    Returns
-    -------
-    A `Tuple` of file size and the `sha256` hex digest of the file. If there are any
-    errors while reading the file, we just return the size and hash digest accumulated
-    so far.
+class TransferMeter:
     """
-    size = 0
-    sha256 = hashlib.sha256()
-
-    try:
-        async with aiofiles.open(file_path, mode='rb') as rb:
-            while True:
-                data = await rb.read(BUF_SIZE)
-                if not data:
-                    break
-                sha256.update(data)
-                size += len(data)
-    except:
-        pass
-
-    return size, sha256.hexdigest()
-
-
-async def check_file_hash_and_update(
-    file_info: FileInfo,
-    skip_altered_updates: bool = False,
-) -> bool:
+    Counts downloaded bytes, along with the time between the first and the last of
+    them, to measure the overall download throughput of this script.
     """
-    Checks if the file pointed to by a given `FileInfo` object matches the `sha256`
-    hash that it should. The hash information should be available in `hash_dict`
-    beforehand. Also updates the intact or altered size in the associated object in
-    `size_dict`, assuming we are counting up from a size of 0.
 
-    Parameters
-    ----------
-    `file_info`: `FileInfo`
-        An object describing the local path at which we can find the file, and its
-        `sha256` hash hex digest. Should point to a file and not a directory.
-    `skip_altered_updates`: `bool = False`
-        Whether or not to add the size of the file to the `size_dict` for files that
-        are not intact.
+    def __init__(self) -> None:
+        self.size = 0
+        self.started = 0.0
+        self.ended = 0.0
 
-    Returns
-    -------
-    A `bool` indicating whether the hashes matched and the intact size was incremented
-    by the file size (`True`), or the hashes did not match the altered size was
-    incremented by the file size (`False`).
-    """
-    size, hash_str = await get_file_size_and_hash(file_info.current_local_path)
-    file_intact = (hash_str == file_info.sha256)
-    state = 'intact' if file_intact else 'altered'
+    def add(self, size: int) -> None:
+        """
+        Counts a downloaded chunk.
 
-    if skip_altered_updates and not file_intact:
-        return False
+        Parameters
+        ----------
+        `size`: `int`
+            The size of the chunk in bytes.
+        """
+        now = time.monotonic()
+        self.started = self.started or now
+        self.ended = now
+        self.size += size
 
-    size_dict[file_info.version][file_info.mode][state] += size
+    def rate(self) -> float:
+        """
+        Returns the overall download throughput in bytes per second, or 0 if too little
+        was downloaded to tell.
+        """
+        if self.size < (BUF_SIZE << 4) or self.ended <= self.started:
+            return 0.0
 
-    return file_intact
+        return self.size / (self.ended - self.started)
 
 
-async def register_size_and_hash(file_info: FileInfo) -> None:
+class CircuitOpenError(Exception):
+    """
+    Raised instead of attempting a download when the circuit breakers of all hosts
+    that could serve the file are open.
     """
-    Calculates the size and `sha256` hash of a file pointed to by the given `FileInfo`
-    object, then saves it into `size_dict` and `hash_dict`, assuming the file is
-    intact. Triggers a save of the updated `hash_dict` at the end of the script if
-    called.
 
-    Parameters
-    ----------
-    `file_info`: `FileInfo`
-        An object describing the local path at which we can find the file to be
-        registered. Should point to a file and not a directory.
+
+class CircuitBreaker:
+    """
+    Keeps track of the consecutive transient failures of downloads from a single host.
+    After `CIRCUIT_FAILURE_LIMIT` of them, the circuit opens and the host is not used
+    for `CIRCUIT_COOLDOWN` seconds. After that, downloads are attempted again, but a
+    single failure opens the circuit again, until a download succeeds.
     """
-    global hash_dict_updated
 
-    size, hash_str = await get_file_size_and_hash(file_info.current_local_path)
+    def __init__(self) -> None:
+        self.failures = 0
+        self.opened = 0.0
+
+    def is_open(self) -> bool:
+        """
+        Returns whether downloads from the host should not be attempted right now.
+        """
+        return (self.failures >= CIRCUIT_FAILURE_LIMIT and
+                time.monotonic() - self.opened < CIRCUIT_COOLDOWN)
 
-    size_dict[file_info.version][file_info.mode]['intact'] += size
-    size_dict[file_info.version][file_info.mode]['total'] += size
+    def report(self, ok: bool) -> None:
+        """
+        Updates the state of the circuit after a download.
 
-    hash_dict[file_info.version][file_info.mode + '_size'] += size
-    hash_dict[file_info.version][file_info.mode][file_info.relative_path()] = hash_str
+        Parameters
+        ----------
+        `ok`: `bool`
+            Whether the host responded properly, even if with a permanent error like
+            `404`.
+        """
+        if ok:
+            self.failures = 0
+            return
 
-    hash_dict_updated = True
+        self.failures += 1
+        if self.failures >= CIRCUIT_FAILURE_LIMIT:
+            self.opened = time.monotonic()
 
 
-async def unregister_all_size_and_hash(file_info: FileInfo) -> None:
+class MirrorPool:
     """
-    Globally erases all records of a given cache version and cache mode from
-    `size_dict` and `hash_dict`. Does not remove the version and mode key from either
-    dictionary. Triggers a save of the updated `hash_dict` at the end of the script if
-    called.
+    A set of interchangeable URL roots that serve the same cache collection. Keeps
+    track of how fast and how reliable each root is, and spreads requests over the
+    healthy ones accordingly.
 
     Parameters
     ----------
-    `file_info`: `FileInfo`
-        An object whose `version` and `mode` fields describe the cache version and
-        cache mode to erase the records of, respectively.
+    `roots`: `List[str]`
+        The URL roots, starting with the main root of the cache collection.
     """
-    global hash_dict_updated
 
-    size_dict[file_info.version][file_info.mode]['intact'] = 0
-    size_dict[file_info.version][file_info.mode]['altered'] = 0
-    size_dict[file_info.version][file_info.mode]['total'] = 0
+    def __init__(self, roots: List[str]) -> None:
+        self.roots = list(dict.fromkeys(root.rstrip('/') + '/' for root in roots))
+        self.latency = {root: 0.0 for root in self.roots}
+        self.throughput = {root: 0.0 for root in self.roots}
+        self.active = {root: 0 for root in self.roots}
+        self.failures = {root: 0 for root in self.roots}
 
-    hash_dict[file_info.version][file_info.mode + '_size'] = 0
-    hash_dict[file_info.version][file_info.mode].clear()
-
-    hash_dict_updated = True
+    def url(self, root: str, file_info: 'FileInfo') -> str:
+        """
+        Returns the link of the file pointed to by the given `FileInfo` object on the
+        given mirror.
 
+        Parameters
+        ----------
+        `root`: `str`
+            One of the URL roots of this pool.
+        `file_info`: `FileInfo`
+            An object whose `current_url` is under its `url_root`.
 
-# Hash High-Level Helpers
+        Returns
+        -------
+        The link with the `url_root` of `file_info` swapped for `root`.
+        """
+        suffix = file_info.current_url[len(file_info.url_root.rstrip('/')):]
+        return root + suffix.lstrip('/')
 
+    def cost(self, root: str) -> float:
+        """
+        Estimates how long a new request would take on the given mirror, based on its
+        latency, throughput, and the requests that are already running on it.
 
-async def hash_check_unregistered(
-    writer: asyncio.StreamWriter,
-    file_info_groups: List[FileInfoGroup],
-) -> None:
-    """
-    Handles the hash checking and registering of paths not in `hash_dict`, by
-    traversing the given `FileInfoGroup` objects' current directories, finding files
-    that are not pointed to by the objects in their `file_info_list` fields, and then
-    registering their size and hash into `size_dict` and `hash_dict` by assuming they
-    are intact. Sends updates to the client for each file.
+        Parameters
+        ----------
+        `root`: `str`
+            One of the URL roots of this pool.
 
-    Parameters
-    ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that keep a group of known files and hashes in its `file_info_list`
-        field, within `FileInfo` objects (could be 0 known files), and the current
-        directory in which we should find more files belonging to this cache
-        collection.
-    """
-    for file_info_group in file_info_groups:
-        file_info = file_info_group.default_file_info()
+        Returns
+        -------
+        The estimated time in seconds, for a typical file of `BUF_SIZE << 4` bytes.
+        """
+        transfer_time = (
+            (BUF_SIZE << 4) / self.throughput[root]
+            if self.throughput[root] > 0 else
+            0.0
+        )
+        return (self.active[root] + 1) * (self.latency[root] + transfer_time)
 
-        path_set = {str(fi.current_local_path.resolve())
-                    for fi in file_info_group.file_info_list}
+    def pick(self, exclude: Optional[Set[str]] = None) -> str:
+        """
+        Picks the mirror that should serve the next request. Healthy mirrors are
+        preferred, and among them the one with the lowest `cost`.
 
-        for file_path in file_info.current_local_path.glob('**/*'):
-            if file_path.is_dir() or str(file_path.resolve()) in path_set:
-                continue
+        Parameters
+        ----------
+        `exclude`: `Optional[Set[str]] = None`
+            Roots that should not be picked, like those that already failed for the
+            file at hand. Ignored if all roots are excluded.
 
-            await register_size_and_hash(file_info.resolve_full(file_path))
-            await send_message(writer)
+        Returns
+        -------
+        One of the URL roots of this pool.
+        """
+        candidates = [root for root in self.roots
+                      if root not in (exclude or set())] or self.roots
 
+        return min(candidates,
+                   key=lambda root: (self.failures[root] >= MIRROR_FAILURE_LIMIT,
+                                     self.cost(root)))
 
-async def hash_check_registered(
-    writer: asyncio.StreamWriter,
-    file_info_groups: List[FileInfoGroup],
-    update_freq: int = 50,
-) -> None:
-    """
-    Handles the hash checking of registered paths in the `hash_dict`, for the given
-    `FileInfoGroup` objects.
+    def ordered(self) -> List[str]:
+        """
+        Returns all roots of this pool, from the one that should be tried first to the
+        one that should be tried last.
+        """
+        return sorted(self.roots,
+                      key=lambda root: (self.failures[root] >= MIRROR_FAILURE_LIMIT,
+                                        self.cost(root)))
 
-    Parameters
-    ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that keep a group of known files and hashes in its `file_info_list`
-        field, within `FileInfo` objects. These files will be hash checked in random
-        order, disregarding their original grouping.
-    `update_freq`: `int = 50`
-        The frequency at which to stop running hash checks and give updates to the
-        client. This is the number of files that will be checked before an update is
-        given.
-    """
-    file_info_list = [file_info
-                      for file_info_group in file_info_groups
-                      for file_info in file_info_group.file_info_list]
+    def report(self, root: str, ok: bool, elapsed: float = 0, size: int = 0) -> None:
+        """
+        Updates the statistics of a mirror after a request.
 
-    coroutines = [check_file_hash_and_update(file_info)
-                  for file_info in file_info_list]
-    random.shuffle(coroutines)
+        Parameters
+        ----------
+        `root`: `str`
+            One of the URL roots of this pool.
+        `ok`: `bool`
+            Whether the request succeeded, and its result was valid.
+        `elapsed`: `float = 0`
+            How long the request took in seconds, if it succeeded.
+        `size`: `int = 0`
+            How many bytes the request transferred, if it succeeded.
+        """
+        if not ok:
+            self.failures[root] += 1
+            return
+
+        self.failures[root] = 0
+
+        if size >= (BUF_SIZE << 4):
+            throughput = size / max(elapsed, 1e-3)
+            self.throughput[root] = (
+                0.7 * self.throughput[root] + 0.3 * throughput
+                if self.throughput[root] > 0 else
+                throughput
+            )
+        else:
+            self.latency[root] = (
+                0.7 * self.latency[root] + 0.3 * elapsed
+                if self.latency[root] > 0 else
+                elapsed
+            )
 
-    for i in range(0, len(coroutines), update_freq):
-        await asyncio.gather(*coroutines[i:i+update_freq])
-        await send_message(writer)
+    async def probe(self, client: httpx.AsyncClient) -> None:
+        """
+        Measures the latency of every mirror with a `HEAD` request on its root, so that
+        the first requests already go to the fastest mirrors.
 
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        """
+        async def probe_root(root: str) -> None:
+            start = time.monotonic()
+            try:
+                response = await client.head(root)
+                response.raise_for_status()
+            except asyncio.CancelledError:
+                raise
+            except:
+                # an unreachable mirror is not worth trying before the others
+                self.failures[root] = max(self.failures[root], MIRROR_FAILURE_LIMIT)
+            else:
+                self.report(root, ok=True, elapsed=(time.monotonic() - start))
 
-# Download Helpers
+        await asyncio.gather(*[probe_root(root) for root in self.roots])
 
 
-async def download_unregistered_file_all(
-    writer: asyncio.StreamWriter,
-    file_info: FileInfo,
-) -> None:
+class ChangeCollector:
     """
-    Downloads an unregistered cache collection that uses the `file:///` protocol. Also
-    registers the downloaded files into `size_dict` and `hash_dict` by assuming the
-    files are intact. Sends updates to the client for each file.
+    Receives filesystem change notifications on the thread of a `watchdog` observer,
+    and passes the paths that changed on to the event loop.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info`: `FileInfo`
-        An object which points to the root of the cache collection with its
-        `current_url` and `current_local_path` fields. The `current_url` and `url_root`
-        fields must contain a local file path or a `file:///` link.
+    `loop`: `asyncio.AbstractEventLoop`
+        The event loop to pass the paths on to.
+    `paths_changed`: `Callable[[List[Path]], None]`
+        Called on the event loop with the paths of every notification.
     """
-    remote_path = Path(file_info.current_url.replace('file:', '', 1).lstrip('/'))
 
-    for file_path in remote_path.glob('**/*'):
-        if file_path.is_dir():
-            continue
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        paths_changed: Callable[[List[Path]], None],
+    ) -> None:
+        self.loop = loop
+        self.paths_changed = paths_changed
+
+    def dispatch(self, event: Any) -> None:
+        """
+        Passes on the paths of a notification of the observer. Files being read, like
+        when they are hash checked, and directories whose entries change are ignored,
+        since neither changes any file.
+
+        Parameters
+        ----------
+        `event`: `Any`
+            The `watchdog` event of the notification.
+        """
+        if event.event_type in ['opened', 'closed_no_write']:
+            return
+        if event.is_directory and event.event_type == 'modified':
+            return
+
+        paths = [Path(os.fsdecode(event.src_path))]
+        if getattr(event, 'dest_path', ''):
+            paths.append(Path(os.fsdecode(event.dest_path)))
 
-        new_file_info = file_info.resolve(file_path.relative_to(remote_path).as_posix())
+        self.loop.call_soon_threadsafe(self.paths_changed, paths)
 
-        new_file_info.current_local_path.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy(file_path, new_file_info.current_local_path)
 
-        await register_size_and_hash(new_file_info)
-        await send_message(writer)
+# Hash Helpers
 
 
-async def download_unregistered_http_all(
-    writer: asyncio.StreamWriter,
-    client: httpx.AsyncClient,
-    file_info: FileInfo,
-    retries: int = 5,
-    depth: int = 3,
-) -> None:
+def sample_indices(size: int) -> List[int]:
     """
-    Recursively downloads an unregistered cache collection that uses the `http://`
-    protocol and an NGINX-like directory structure. Also registers the downloaded files
-    into `size_dict` and `hash_dict` by assuming the files are intact. Retries the file
-    download if it fails, for a set amount of times. Sends updates to the client for
-    each file.
+    Decides which `BUF_SIZE` blocks of a file of the given size make up its sample.
+    The first and last blocks are always included, and the rest are spread evenly in
+    between.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `client`: `httpx.AsyncClient`
-        HTTP download client that allows for coroutine byte stream downloads.
-    `file_info`: `FileInfo`
-        An object which points to either a directory or a singular file that belongs to
-        the cache collection. The `current_url` and `url_root` fields must contain an
-        `http://` link that points to an NGINX-like directory.
-    `retries`: `int = 5`
-        In the event that the download of a file fails (but the parent directory is
-        valid), retry this many times before giving up on the download of the file.
-    `depth`: `int = 3`
-        When recursing the cache collection directory, allow at most this level of
-        nesting. A level of 3 means for the cache collection root `a/`, we will be able
-        to download files with paths like `a/b/d.txt` but not files like `a/b/c/d.txt`.
-    """
-    if depth == 0:
-        return
+    `size`: `int`
+        The size of the file in bytes.
 
-    file_info.current_local_path.mkdir(exist_ok=True)
+    Returns
+    -------
+    A sorted list of unique block indices. All blocks are included for small files.
+    """
+    block_count = (size + BUF_SIZE - 1) // BUF_SIZE
 
-    response = await client.get(file_info.current_url)
-    response.raise_for_status()
+    if block_count <= SAMPLE_COUNT:
+        return list(range(block_count))
 
-    bs = BeautifulSoup(response.content, 'html.parser')
-    links = bs.find_all('a', href=True)
+    return sorted({i * (block_count - 1) // (SAMPLE_COUNT - 1)
+                   for i in range(SAMPLE_COUNT)})
 
-    for link in links:
-        file_str = str(link['href'])
-        new_file_info = file_info.resolve(file_str)
 
-        if file_str == '../':
-            continue
+def new_local_digest() -> Any:
+    """
+    Creates a hash object for the `LOCAL_DIGEST` algorithm.
 
-        if file_str.endswith('/'):
-            await download_unregistered_http_all(
-                writer, client, new_file_info, retries=retries, depth=(depth - 1))
-            continue
+    Returns
+    -------
+    A hash object with the `update` and `hexdigest` methods of `hashlib` objects.
+    """
+    if LOCAL_DIGEST == 'blake3':
+        return blake3.blake3()
+    if LOCAL_DIGEST == 'xxh3':
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
 
-        for i in range(retries):
-            try:
-                async with client.stream('GET', new_file_info.current_url) as stream:
-                    stream.raise_for_status()
 
-                    async with aiofiles.open(new_file_info.current_local_path,
-                                             mode='wb') as wb:
-                        async for chunk in stream.aiter_bytes(chunk_size=BUF_SIZE):
-                            await wb.write(chunk)
-                break
-            except:
-                await asyncio.sleep(i + 1)
+# Bandwidth Helpers
 
-        await register_size_and_hash(new_file_info)
-        await send_message(writer)
 
+def preallocate_file(file_path: Path, size: int) -> None:
+    """
+    Creates or overwrites a file with the given size, reserving its disk space at once
+    where the file system allows it, so that it is not fragmented by being written
+    chunk by chunk.
 
-async def download_registered_single(
-    writer: asyncio.StreamWriter,
-    client: httpx.AsyncClient,
-    file_info: FileInfo,
-    retries: int = 5,
-) -> None:
+    Parameters
+    ----------
+    `file_path`: `Path`
+        The local path of the file.
+    `size`: `int`
+        The size of the file in bytes.
+    """
+    with open(file_path, 'wb') as wb:
+        try:
+            os.posix_fallocate(wb.fileno(), 0, size)
+        except (AttributeError, OSError):
+            wb.truncate(size)
+
+
+def partial_path(file_path: Path) -> Path:
     """
-    Downloads (through HTTP) a single, registered file in the cache collection. Retries
-    the file download if it fails, for a set amount of times.  Updates the `size_dict`
-    according to the result of the final hash check. Sends updates to the client for
-    each file.
+    Returns the path that the partially downloaded contents of a file are kept at,
+    until the download completes.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `client`: `httpx.AsyncClient`
-        HTTP download client that allows for coroutine byte stream downloads.
-    `file_info`: `FileInfo`
-        An object which points to either a directory or a singular file that belongs to
-        the cache collection. The `current_url` and `url_root` fields must contain an
-        `http://` link that points to an NGINX-like directory.
-    `retries`: `int = 5`
-        In the event that the download of a file fails (but the parent directory is
-        valid), retry this many times before giving up on the download of the file.
-    """
-    if (await check_file_hash_and_update(file_info, skip_altered_updates=True)):
-        await send_message(writer)
-        return
+    `file_path`: `Path`
+        The local path of the file being downloaded.
 
-    for i in range(retries):
-        try:
-            async with client.stream('GET', file_info.current_url) as stream:
-                stream.raise_for_status()
+    Returns
+    -------
+    The `Path` of the `.part` file next to `file_path`.
+    """
+    return file_path.with_name(file_path.name + '.part')
 
-                async with aiofiles.open(file_info.current_local_path,
-                                         mode='wb') as wb:
-                    async for chunk in stream.aiter_bytes(chunk_size=BUF_SIZE):
-                        await wb.write(chunk)
-        except:
-            await asyncio.sleep(i + 1)
 
-        if (await check_file_hash_and_update(
-            file_info,
-            skip_altered_updates=(i + 1 < retries),
-        )):
-            break
+def lower_process_priority() -> None:
+    """
+    Lowers the CPU and disk I/O priority of this process, so that hashing and writing
+    files does not get in the way of the game or other programs. On Windows, the
+    process enters background processing mode, falling back to the idle priority
+    class. Elsewhere, the process gets a higher niceness, which also lowers its I/O
+    priority under the default Linux I/O schedulers.
+    """
+    if sys.platform == 'win32':
+        import ctypes
 
-    await send_message(writer)
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetCurrentProcess()
 
+        # PROCESS_MODE_BACKGROUND_BEGIN, then IDLE_PRIORITY_CLASS
+        if not kernel32.SetPriorityClass(handle, 0x00100000):
+            kernel32.SetPriorityClass(handle, 0x00000040)
+    else:
+        os.nice(10)
 
-# Download High-Level Helpers
 
+# Retry Helpers
 
-async def download_unregistered(
-    writer: asyncio.StreamWriter,
-    client: httpx.AsyncClient,
-    file_info_groups: List[FileInfoGroup],
-) -> None:
+
+def is_permanent_error(error: Exception) -> bool:
     """
-    Handles the download and registering of files and their paths not in `hash_dict`,
-    by traversing the given `FileInfoGroup` objects' URL directories, finding all
-    files, and then registering their size and hash into `size_dict` and `hash_dict` by
-    assuming they are intact. Sends updates to the client for each file.
+    Decides whether a failed download would fail the same way if it was retried.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `client`: `httpx.AsyncClient`
-        HTTP download client that allows for coroutine byte stream downloads.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that have valid URL and path roots, such that their
-        `default_file_info()` method returns a `FileInfo` object that represents these
-        roots.
-    """
-    for file_info_group in file_info_groups:
-        file_info = file_info_group.default_file_info()
-
-        if file_info_group.url_root.startswith('http'):
-            await download_unregistered_http_all(writer, client, file_info)
-        else:
-            await download_unregistered_file_all(writer, file_info)
+    `error`: `Exception`
+        The error the download failed with.
+
+    Returns
+    -------
+    `True` for client errors like `404`, except for the ones that ask to retry later
+    or that a fresh download fixes, and when no host is available at all. `False` for
+    server and network errors.
+    """
+    if isinstance(error, CircuitOpenError):
+        return True
 
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return 400 <= status_code < 500 and status_code not in [408, 416, 429]
 
-async def download_registered(
-    writer: asyncio.StreamWriter,
-    client: httpx.AsyncClient,
-    file_info_groups: List[FileInfoGroup],
-) -> None:
+    return False
+
+
+def describe_error(error: Exception) -> str:
     """
-    Handles the download (through HTTP) of files that are registered in `hash_dict`,
-    by traversing the given `FileInfoGroup` objects' `file_info_list` fields, making
-    the necessary directories, and initiating file downloads. Updates the `size_dict`
-    for each file according to the result of the final hash check. Sends updates to the
-    client for each file.
+    Returns a short description of the error a download failed with, like `HTTP 404`
+    or `ConnectTimeout`, to be reported to the client.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `client`: `httpx.AsyncClient`
-        HTTP download client that allows for coroutine byte stream downloads.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that keep a group of known files and hashes in its `file_info_list`
-        field, within `FileInfo` objects. These files will be downloded in random
-        order, disregarding their original grouping.
+    `error`: `Exception`
+        The error the download failed with.
     """
-    coroutines = []
-
-    for file_info_group in file_info_groups:
-        for file_info in file_info_group.file_info_list:
-            file_info.current_local_path.parent.mkdir(parents=True, exist_ok=True)
-            coroutines.append(download_registered_single(writer, client, file_info))
+    if isinstance(error, httpx.HTTPStatusError):
+        return f'HTTP {error.response.status_code}'
 
-    random.shuffle(coroutines)
+    if isinstance(error, CircuitOpenError):
+        return 'No host available'
 
-    await asyncio.gather(*coroutines)
+    return type(error).__name__
 
 
-# Delete High-Level Helpers
+def retry_delay(attempt: int) -> float:
+    """
+    Picks the delay before retrying a failed download, with exponential backoff and
+    full jitter, so that many failing downloads do not retry all at once.
 
+    Parameters
+    ----------
+    `attempt`: `int`
+        The number of the failed attempt, starting from 0.
 
-async def delete_unregistered(
-    writer: asyncio.StreamWriter,
-    file_info_groups: List[FileInfoGroup],
-) -> None:
+    Returns
+    -------
+    The delay in seconds.
     """
-    Handles the deletion of the unregistered cache collections, by removing the entire
-    directories in the given `FileInfoGroup` objects' local path roots. Also resets the
-    state of `size_dict` and `hash_dict` by erasing all known hashes and resetting
-    sizes. Sends an update to the client per root directory.
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (1 << attempt)))
+
+
+# HTTP Validator Helpers
 
-    Note that `size_dict` have a tally of 0 for intact and altered sizes at the time of
-    execution, but this does not matter since the sizes will be valid if this coroutine
-    runs properly.
+
+def get_http_validators(headers: httpx.Headers) -> Dict[str, Any]:
+    """
+    Extracts the HTTP cache validators of a remote file from the headers of a response.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that have valid local path roots, such that their
-        `default_file_info()` method returns a `FileInfo` object that represents these
-        roots.
+    `headers`: `httpx.Headers`
+        The headers of a `HEAD` or `GET` response for the remote file.
+
+    Returns
+    -------
+    A `dict` with the `etag`, `last_modified` and `content_length` keys, whose values
+    are empty (or `-1` for `content_length`) if the server did not provide them.
     """
-    for file_info_group in file_info_groups:
-        file_info = file_info_group.default_file_info()
+    content_length = headers.get('content-length', '')
+    if 'content-range' in headers:
+        # partial responses carry the full length after the slash
+        content_length = headers['content-range'].rpartition('/')[2]
+
+    return {
+        'etag': headers.get('etag', ''),
+        'last_modified': headers.get('last-modified', ''),
+        'content_length': int(content_length) if content_length.isdigit() else -1,
+    }
 
-        shutil.rmtree(file_info.current_local_path)
 
-        await unregister_all_size_and_hash(file_info)
-        await send_message(writer)
+def http_validators_match(
+    stored: Dict[str, Any],
+    current: Dict[str, Any],
+) -> bool:
+    """
+    Decides whether the remote file described by `current` validators is the same one
+    that was downloaded when the `stored` validators were recorded. The `ETag` is
+    preferred when both sides have one, otherwise `Last-Modified` is used. In either
+    case, the content lengths must not contradict each other.
 
+    Parameters
+    ----------
+    `stored`: `Dict[str, Any]`
+        The validators recorded in `hash_dict` at the time of the last download.
+    `current`: `Dict[str, Any]`
+        The validators just received from the server.
 
-async def delete_registered(
-    writer: asyncio.StreamWriter,
-    file_info_groups: List[FileInfoGroup],
-) -> None:
+    Returns
+    -------
+    `True` if the remote file can be assumed unchanged, `False` otherwise.
     """
-    Handles the deletion of the registered cache collections, by traversing the given
-    `FileInfoGroup` objects' `file_info_list` fields, removing each mentioned file, and
-    then removing any empty directories that were parents of these files, from the
-    innermost to the outermost. Sends an update to the client per root directory.
+    stored_length = stored.get('content_length', -1)
+    current_length = current.get('content_length', -1)
+
+    if stored_length >= 0 and current_length >= 0 and stored_length != current_length:
+        return False
+
+    if stored.get('etag') and current.get('etag'):
+        return stored['etag'] == current['etag']
+
+    if stored.get('last_modified') and current.get('last_modified'):
+        return stored['last_modified'] == current['last_modified']
+
+    return False
+
+
+# GC Helpers
 
-    Note that `size_dict` will have a tally of 0 for intact and altered sizes, but it
-    will have the proper total cache size at the time of execution. Simply updating the
-    client with this information will make the update valid once the file removal
-    process completes. The coroutine will remove directories only after sending this
-    update.
+
+def scan_collection_dir(
+    collection_dir: Path,
+    registered: Set[str],
+    orphan_unregistered: bool,
+) -> Dict[str, List[Tuple[Path, int]]]:
+    """
+    Walks the directory of a cache collection once, and classifies each file in it by
+    whether it is a registered file, a partial download, an orphan or an unregistered
+    file that should be kept.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that keep a group of known files and hashes in its `file_info_list`
-        field, within `FileInfo` objects. These files will be deleted in the order that
-        they are given.
+    `collection_dir`: `Path`
+        The local root of the cache collection.
+    `registered`: `Set[str]`
+        The relative paths of the registered files of the cache collection.
+    `orphan_unregistered`: `bool`
+        Whether files that are not registered are orphans, like in official offline
+        caches, rather than files that should be kept, like the files written by the
+        Unity Web Player into playable caches.
+
+    Returns
+    -------
+    A `dict` that maps the classes `registered`, `partial`, `orphan` and `unregistered`
+    to the paths and sizes of the files in them.
     """
-    roots = set()
-    for file_info_group in file_info_groups:
-        for file_info in file_info_group.file_info_list:
-            if file_info.current_local_path.parent.is_dir():
-                roots.add(file_info.current_local_path.parent)
-            if file_info.current_local_path.is_file():
-                file_info.current_local_path.unlink()
+    classes: Dict[str, List[Tuple[Path, int]]] = {
+        'registered': [],
+        'partial': [],
+        'orphan': [],
+        'unregistered': [],
+    }
 
-    await send_message(writer)
+    for dir_path, _, file_names in os.walk(collection_dir):
+        for file_name in file_names:
+            file_path = Path(dir_path) / file_name
+            try:
+                size = file_path.stat().st_size
+            except OSError:
+                continue
 
-    roots_list: List[Path] = sorted(roots, key=lambda p: len(p.parts), reverse=True)
-    for root_dir in roots_list:
-        if not any(root_dir.iterdir()):
-            root_dir.rmdir()
+            rel_path = file_path.relative_to(collection_dir).as_posix()
+            if rel_path in registered:
+                file_class = 'registered'
+            elif file_name.endswith('.part'):
+                file_class = 'partial'
+            elif orphan_unregistered:
+                file_class = 'orphan'
+            else:
+                file_class = 'unregistered'
 
+            classes[file_class].append((file_path, size))
 
-# Operations
+    return classes
 
 
-async def hash_check(
-    writer: asyncio.StreamWriter,
-    file_info_groups: List[FileInfoGroup],
-) -> None:
+def scan_orphan_dir(orphan_dir: Path) -> List[Tuple[Path, int]]:
     """
-    Main handler coroutine for the hash check operation.
-
-    Expected behavior, per `FileInfoGroup` in the `file_info_groups` argument, is as
-    follows:
-    - If `FileInfoGroup` is official, then only check hashes of files in (either in the
-    default or current) `hashes.json`.
-    - If `FileInfoGroup` is not official, but has hashes registered in the current
-    `hashes.json`, check hashes of files registered in `hashes.json`, and then run a
-    tree search for more files. If a file unregistered in `hashes.json` is found,
-    calculate its hash and register it into `hashes.json` (assuming intact).
-    - If `FileInfoGroup` is not official, and has no registered hashes in the current
-    `hashes.json`, run a tree search for all files. If a file unregistered in
-    `hashes.json` is found, calculate its hash and register it into `hashes.json`
-    (assuming intact).
+    Walks a directory that belongs to no known cache collection, like a `FusionFall`
+    directory that `.lastver` does not account for, and lists every file in it.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that logically separate cache collections and their registered
-        files under different criteria, such as cache version and cache mode. Each
-        `FileInfoGroup` object can tell if they represent an official cache.
+    `orphan_dir`: `Path`
+        The directory to walk.
+
+    Returns
+    -------
+    A list of the paths and sizes of the files in the directory.
+    """
+    files = []
+
+    for dir_path, _, file_names in os.walk(orphan_dir):
+        for file_name in file_names:
+            file_path = Path(dir_path) / file_name
+            try:
+                files.append((file_path, file_path.stat().st_size))
+            except OSError:
+                pass
+
+    return files
+
+
+def remove_path(path: Path) -> None:
+    """
+    Removes a file, or a directory tree, ignoring errors.
+
+    Parameters
+    ----------
+    `path`: `Path`
+        The path to remove.
+    """
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def remove_empty_dirs(root_dir: Path) -> None:
+    """
+    Removes the empty directories under a directory, from the innermost to the
+    outermost, keeping the directory itself.
+
+    Parameters
+    ----------
+    `root_dir`: `Path`
+        The directory to clean up.
+    """
+    for dir_path, _, _ in sorted(os.walk(root_dir), key=lambda t: len(t[0]),
+                                 reverse=True):
+        if Path(dir_path) != root_dir and not any(Path(dir_path).iterdir()):
+            Path(dir_path).rmdir()
+
+
+# Serve Helpers
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range `Range` header value for a file of the given size.
+
+    Parameters
+    ----------
+    `range_header`: `str`
+        The value of the header, like `bytes=0-99`, `bytes=100-` or `bytes=-100`.
+    `size`: `int`
+        The size of the requested file in bytes.
+
+    Returns
+    -------
+    A `Tuple` of the first and last byte positions of the range, both inclusive, or
+    `None` if the range cannot be satisfied or is not understood.
+    """
+    unit, _, byte_range = range_header.partition('=')
+    start_str, _, end_str = byte_range.strip().partition('-')
+
+    if unit.strip() != 'bytes' or ',' in byte_range:
+        return None
+
+    try:
+        if not start_str:
+            start, end = max(size - int(end_str), 0), size - 1
+        else:
+            start = int(start_str)
+            end = min(int(end_str), size - 1) if end_str else size - 1
+    except ValueError:
+        return None
+
+    if start > end or start >= size:
+        return None
+
+    return start, end
+
+
+def directory_index(url_path: str, entries: Dict[str, Optional[Path]]) -> bytes:
+    """
+    Renders an NGINX-like directory index page, the same kind of page that
+    `download_unregistered_http_all` crawls.
+
+    Parameters
+    ----------
+    `url_path`: `str`
+        The URL path of the directory, ending with a slash.
+    `entries`: `Dict[str, Optional[Path]]`
+        The names of the directory entries, mapped to their local paths for files, or
+        `None` for directories, whose names end with a slash.
+
+    Returns
+    -------
+    The UTF-8 encoded HTML page.
     """
-    registered_groups = [file_info_group
-                         for file_info_group in file_info_groups
-                         if file_info_group.file_info_list]
-    unregistered_groups = [file_info_group
-                           for file_info_group in file_info_groups
-                           if not file_info_group.is_official]
+    title = html.escape(url_path)
+    lines = [f'<html>\r\n<head><title>Index of {title}</title></head>\r\n<body>\r\n'
+             f'<h1>Index of {title}</h1><hr><pre><a href="../">../</a>']
+
+    # directories first, then files, like NGINX does
+    for name in sorted(entries, key=lambda name: (entries[name] is not None, name)):
+        local_path = entries[name]
+        try:
+            stat = local_path.stat() if local_path else None
+        except OSError:
+            continue
+
+        date = time.strftime('%d-%b-%Y %H:%M',
+                             time.gmtime(stat.st_mtime if stat else 0))
+        size = str(stat.st_size) if stat else '-'
+        link = f'<a href="{urllib.parse.quote(name)}">{html.escape(name)}</a>'
+
+        lines.append(link + ' ' * max(51 - len(name), 1) + date + size.rjust(20))
 
-    if registered_groups:
-        await hash_check_registered(writer, registered_groups)
-    if unregistered_groups:
-        await hash_check_unregistered(writer, unregistered_groups)
+    lines.append('</pre><hr></body>\r\n</html>\r\n')
 
+    return '\r\n'.join(lines).encode('utf-8')
 
-async def download(
+
+async def send_response_head(
     writer: asyncio.StreamWriter,
-    file_info_groups: List[FileInfoGroup],
-    max_connections: int = 5,
+    status: str,
+    headers: Dict[str, str],
 ) -> None:
     """
-    Main handler coroutine for the download and fix operations.
-
-    Expected behavior, per `FileInfoGroup` in the `file_info_groups` argument, is as
-    follows:
-    - If `FileInfoGroup` is official, then only download and check hashes of files in
-    (either in the default or current) `hashes.json`.
-    - If `FileInfoGroup` is not official, but has hashes registered in the current
-    `hashes.json`, download and check hashes of files registered in `hashes.json`, then
-    recursively download files from the remote URL of the `FileInfoGroup`. For each
-    file downloaded, calculate its hash and register it into `hashes.json` (assuming
-    intact, and overwriting existing hashes).
-    - If `FileInfoGroup` is not official, and has no registered hashes in the current
-    `hashes.json`, recursively download files from the remote URL of the
-    `FileInfoGroup`. For each file downloaded, calculate its hash and register it into
-    `hashes.json` (assuming intact).
+    Writes the status line and headers of an HTTP/1.1 response.
 
     Parameters
     ----------
     `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that logically separate cache collections and their registered
-        files under different criteria, such as cache version and cache mode. Each
-        `FileInfoGroup` object can tell if they represent an official cache.
-    `max_connections`: `int = 5`
-        The maximum connections an asynchronous client is allowed to make while
-        performing the download tasks.
-    """
-    registered_groups = [file_info_group
-                         for file_info_group in file_info_groups
-                         if file_info_group.file_info_list]
-    unregistered_groups = [file_info_group
-                           for file_info_group in file_info_groups
-                           if not file_info_group.is_official]
-
-    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections),
-                                 timeout=httpx.Timeout(None)) as client:
-        if registered_groups:
-            await download_registered(writer, client, registered_groups)
-        if unregistered_groups:
-            await download_unregistered(writer, client, unregistered_groups)
+        The writer object of the HTTP connection.
+    `status`: `str`
+        The status code and reason, like `200 OK`.
+    `headers`: `Dict[str, str]`
+        The response headers.
+    """
+    head = f'HTTP/1.1 {status}\r\n'
+    head += ''.join(f'{key}: {value}\r\n' for key, value in headers.items())
+    writer.write((head + '\r\n').encode('latin-1'))
+    await writer.drain()
 
 
-async def delete(
-    writer: asyncio.StreamWriter,
-    file_info_groups: List[FileInfoGroup],
+# Archive Helpers
+
+
+def archive_member_name(file_info: FileInfo) -> str:
+    """
+    Returns the name that a file is stored under in a version pack archive.
+
+    Parameters
+    ----------
+    `file_info`: `FileInfo`
+        An object describing the cache version, cache mode and relative path of the
+        file.
+
+    Returns
+    -------
+    A `str` like `beta-20100104/offline/main.unity3d`.
+    """
+    return f'{file_info.version}/{file_info.mode}/{file_info.relative_path()}'
+
+
+def is_safe_member_path(rel_path: str) -> bool:
+    """
+    Checks whether a relative path listed in the manifest of a version pack archive
+    stays inside the cache collection it is listed under, on any platform.
+
+    Parameters
+    ----------
+    `rel_path`: `str`
+        The relative path of a file in the manifest, like `main.unity3d`.
+
+    Returns
+    -------
+    `False` if the path is absolute, drive-qualified, contains backslashes or has an
+    empty, `.` or `..` component, `True` otherwise.
+    """
+    windows_path = PureWindowsPath(rel_path)
+    if not rel_path or '\\' in rel_path or windows_path.drive or windows_path.root:
+        return False
+
+    return all(part not in ['', '.', '..'] for part in rel_path.split('/'))
+
+
+async def add_archive_member(
+    archive: tarfile.TarFile,
+    file_info: FileInfo,
 ) -> None:
     """
-    Main handler coroutine for the delete operation.
+    Appends an intact file to a version pack archive that is being written as a
+    stream.
+
+    Parameters
+    ----------
+    `archive`: `tarfile.TarFile`
+        The archive, opened for stream writing.
+    `file_info`: `FileInfo`
+        An object describing the local path at which we can find the file.
+    """
+    loop = asyncio.get_running_loop()
+    member = archive.gettarinfo(file_info.current_local_path,
+                                arcname=archive_member_name(file_info))
 
-    Expected behavior, per `FileInfoGroup` in the `file_info_groups` argument, is as
-    follows:
-    - If `FileInfoGroup` is official, then only erase files with listed paths in
-    `hashes.json`, and then remove their parent directories, from innermost to
-    outermost, if they happen to be empty.
-    - If `FileInfoGroup` is not official, but has hashes registered in the current
-    `hashes.json`, tree-remove the local root directory, and reset the size and path
-    entries in `hashes.json`.
-    - If `FileInfoGroup` is not official, and has no registered hashes in the current
-    `hashes.json`, tree-remove the local root directory.
+    with open(file_info.current_local_path, 'rb') as rb:
+        await loop.run_in_executor(None, archive.addfile, member, rb)
+
+
+# Watch Helpers
+
+
+def scan_file_stats(collection_dir: Path) -> Dict[str, Tuple[int, int]]:
+    """
+    Walks the directory of a cache collection, and records the size and modification
+    time of every file in it, except for partial downloads.
 
     Parameters
     ----------
-    `writer`: `asyncio.StreamWriter`
-        The writer object that connects to the localhost port listened to by the
-        client.
-    `file_info_groups`: `List[FileInfoGroup]`
-        The objects that logically separate cache collections and their registered
-        files under different criteria, such as cache version and cache mode. Each
-        `FileInfoGroup` object can tell if they represent an official cache.
+    `collection_dir`: `Path`
+        The local root of the cache collection, or any directory in it.
+
+    Returns
+    -------
+    A `dict` that maps the paths of the files relative to `collection_dir` to their
+    sizes and modification times in nanoseconds. Empty if the directory does not exist.
     """
-    registered_groups = [file_info_group
-                         for file_info_group in file_info_groups
-                         if file_info_group.is_official]
-    unregistered_groups = [file_info_group
-                           for file_info_group in file_info_groups
-                           if not file_info_group.is_official]
+    file_stats = {}
+
+    for dir_path, _, file_names in os.walk(collection_dir):
+        for file_name in file_names:
+            if file_name.endswith('.part'):
+                continue
 
-    if registered_groups:
-        await delete_registered(writer, registered_groups)
-    if unregistered_groups:
-        await delete_unregistered(writer, unregistered_groups)
+            file_path = Path(dir_path) / file_name
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
 
+            rel_path = file_path.relative_to(collection_dir).as_posix()
+            file_stats[rel_path] = (stat.st_size, stat.st_mtime_ns)
+
+    return file_stats
+
+
+def stat_known_paths(
+    collection_dir: Path,
+    rel_paths: Set[str],
+) -> Dict[str, Optional[Tuple[int, int]]]:
+    """
+    Records the size and modification time of the given files of a cache collection,
+    and of the directories that hold them, without walking the directories.
+
+    Parameters
+    ----------
+    `collection_dir`: `Path`
+        The local root of the cache collection.
+    `rel_paths`: `Set[str]`
+        The paths of the files to check, relative to `collection_dir`.
+
+    Returns
+    -------
+    A `dict` that maps the paths relative to `collection_dir` to their sizes and
+    modification times in nanoseconds, or to `None` if they do not exist. The root of
+    the cache collection is included as `.`.
+    """
+    dir_paths = {'.'}
+    for rel_path in rel_paths:
+        parts = rel_path.split('/')[:-1]
+        dir_paths.update('/'.join(parts[:i]) for i in range(1, len(parts) + 1))
+
+    path_stats: Dict[str, Optional[Tuple[int, int]]] = {}
+    for rel_path in rel_paths | dir_paths:
+        try:
+            stat = (collection_dir / rel_path).stat()
+            path_stats[rel_path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            path_stats[rel_path] = None
+
+    return path_stats
+
+
+# Lock Helpers
+
+
+def try_lock_file(lock_file: Any) -> bool:
+    """
+    Tries to take an exclusive lock on an open file, without waiting. The lock is
+    released when the file is closed, or when this process exits.
+
+    Parameters
+    ----------
+    `lock_file`: `Any`
+        A file object opened for writing.
+
+    Returns
+    -------
+    A `bool` indicating whether the lock was taken.
+    """
+    try:
+        if sys.platform == 'win32':
+            import msvcrt
+
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+
+    return True
 
-# Main & Helpers
+
+def acquire_lock_file(lock_path: Path) -> Any:
+    """
+    Opens a lock file, creating it if necessary, and waits until an exclusive lock on
+    it can be taken.
+
+    Parameters
+    ----------
+    `lock_path`: `Path`
+        The local path of the lock file.
+
+    Returns
+    -------
+    The open, locked file object, to be passed to `release_lock_file` later.
+    """
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(lock_path, 'a+b')
+
+    while not try_lock_file(lock_file):
+        time.sleep(LOCK_POLL_INTERVAL)
+
+    return lock_file
+
+
+async def acquire_lock_file_async(lock_path: Path) -> Any:
+    """
+    Like `acquire_lock_file`, but waits without blocking the event loop, so that other
+    operations in this process can go on, and release the lock, in the meantime.
+
+    Parameters
+    ----------
+    `lock_path`: `Path`
+        The local path of the lock file.
+
+    Returns
+    -------
+    The open, locked file object, to be passed to `release_lock_file` later.
+    """
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(lock_path, 'a+b')
+
+    try:
+        while not try_lock_file(lock_file):
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+    except:
+        lock_file.close()
+        raise
+
+    return lock_file
+
+
+def release_lock_file(lock_file: Any) -> None:
+    """
+    Releases the lock on a file taken by `acquire_lock_file`, and closes it.
+
+    Parameters
+    ----------
+    `lock_file`: `Any`
+        The open, locked file object.
+    """
+    if sys.platform == 'win32':
+        import msvcrt
+
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    lock_file.close()
+
+
+# Collection Helpers
 
 
 def swapped_path(
@@ -919,168 +1405,4094 @@ def swapped_path(
     return named_cache
 
 
-def manage_initial_file_states(args: Namespace) -> List[FileInfoGroup]:
+def observed_access_order(cache_dir: Path) -> List[str]:
     """
-    Manages the initial states of `size_dict`, `hash_dict`, and constructs
-    `FileInfoGroup` objects that correspond to the different cache collections that
-    this script will operate on, based on the given arguments. Triggers a save of the
-    updated `hash_dict` at the end of the script if the current `versions.json` file
-    has versions that are not present in the current `hashes.json`.
+    Finds the order in which the game has requested the files of a cache collection in
+    the past, by looking at the files the Unity Web Player has written into the given
+    playable cache directory. Files are written the first time the game asks for them,
+    so their modification times reflect the order in which they are needed.
 
     Parameters
     ----------
-    `args`: `Namespace`
-        The arguments given to this script at startup.
+    `cache_dir`: `Path`
+        The playable cache directory for a single cache version.
 
     Returns
     -------
-    A list of `FileInfoGroup` objects that correspond to the different cache
-    collections that this script will operate on.
+    A list of paths relative to `cache_dir`, from the earliest written to the latest.
+    Empty if the directory does not exist.
     """
-    global hash_dict_updated
+    if not cache_dir.is_dir():
+        return []
 
-    # manage `hash_dict` state
-    with open(Path(args.user_dir) / 'hashes.json') as r:
-        hash_dict.update(json.load(r))
-
-    with open(Path(args.user_dir) / 'versions.json') as r:
-        versions = json.load(r)['versions']
+    file_stats = []
+    for file_path in cache_dir.glob('**/*'):
+        try:
+            if file_path.is_file():
+                file_stats.append((file_path.stat().st_mtime,
+                                   file_path.relative_to(cache_dir).as_posix()))
+        except OSError:
+            pass
 
-    for version in versions:
-        if version['name'] not in hash_dict:
-            hash_dict[version['name']] = {
-                'playable_size': 0,
-                'offline_size': 0,
-                'playable': {},
-                'offline': {},
-            }
-            hash_dict_updated = True
+    return [rel_path for _, rel_path in sorted(file_stats)]
 
-    # decide on operating cache modes and versions
-    cache_modes = (
-        ['offline', 'playable']
-        if args.cache_mode == 'all' else
-        [args.cache_mode]
-    )
-    cache_versions = (
-        list(hash_dict)
-        if args.cache_version == 'all' else
-        [args.cache_version]
-    )
 
-    # construct file info groups
-    file_info_groups = []
+# Cache Manager
 
-    for cache_version in cache_versions:
-        for cache_mode in cache_modes:
-            # gather base information
-            local_root = (
-                args.offline_root if cache_mode == 'offline' else args.playable_root
-            )
-            local_dir = swapped_path(
-                local_root, args.user_dir, cache_version, cache_mode)
-            url_dir = (
-                args.cdn_root.rstrip('/') + '/' + cache_version.lstrip('/')
-                if args.cache_version == 'all' else
-                args.cdn_root
-            )
 
-            # construct base file info
-            file_info_version = FileInfo(
-                version=cache_version,
-                mode=cache_mode,
-                local_root=local_dir,
-                url_root=url_dir,
-                current_local_path=local_dir,
-                current_url=url_dir,
-                sha256='',
-            )
+class CacheManager:
+    """
+    Runs cache operations on the cache collections of a single user directory, and owns
+    the state that they share: the registered sizes and hashes of `hashes.json`, the
+    size accounting reported to the client, the HTTP client that downloads reuse, and
+    the thread pool that files are hashed in.
 
-            # manage `size_dict` state
-            if cache_version not in size_dict:
-                size_dict[cache_version] = {}
+    Each operation reports its progress through an async iterator of the changes to
+    `size_dict`, and runs until the iterator is exhausted or closed. Operations on
+    different cache collections can run at once, while operations on the same cache
+    collections wait for each other, just like separate runs of this script.
 
-            size_dict[cache_version][cache_mode] = {
-                'intact': 0,
-                'altered': 0,
-                'total': hash_dict[cache_version][cache_mode + '_size'],
-            }
+    Parameters
+    ----------
+    `user_dir`: `str`
+        The user directory that the client uses, which holds `versions.json` and
+        `hashes.json`.
+    `playable_root`: `str = ''`
+        The local root of the playable caches.
+    `offline_root`: `str = ''`
+        The local root of the offline caches.
+    `official_caches`: `Optional[List[str]] = None`
+        The names of the cache versions whose registered hashes are official.
+    `download_order`: `str = 'random'`
+        The order in which files are downloaded, either `random` or `priority`.
+    `priority_file`: `str = ''`
+        The local path of the priority file, used with the `priority` download order.
+    `bandwidth_limit`: `float = 0`
+        The bandwidth that all downloads can use in total, in KiB/s, or 0 for
+        unlimited.
+    `connection_bandwidth_limit`: `float = 0`
+        The bandwidth that a single download can use, in KiB/s, or 0 for unlimited.
+    `verify_tier`: `str = 'full'`
+        How thoroughly files that have a stat record are checked.
+    `max_connections`: `int = 5`
+        The maximum connections the HTTP client is allowed to make at once.
+    `keepalive_connections`: `int = 20`
+        The maximum idle connections the HTTP client keeps open.
+    `keepalive_expiry`: `float = KEEPALIVE_EXPIRY`
+        The number of seconds that the HTTP client keeps idle connections open for.
+    `http2`: `bool = False`
+        Whether to use HTTP/2 with servers that support it, if the `h2` module is
+        installed.
+    `warm_connections`: `int = WARM_CONNECTIONS`
+        The number of connections opened to each host ahead of a download, or 0 to
+        open connections only when they are needed.
+    `hash_workers`: `Optional[int] = None`
+        The number of threads that files are hashed in, or `None` for the default of
+        `ThreadPoolExecutor`.
+    """
 
-            # construct file info list by resolving from the base file info
-            file_info_list = [
-                file_info_version.resolve(rel_path, sha256=file_hash)
-                for rel_path, file_hash in hash_dict[cache_version][cache_mode].items()
-            ]
+    def __init__(
+        self,
+        user_dir: str,
+        playable_root: str = '',
+        offline_root: str = '',
+        official_caches: Optional[List[str]] = None,
+        download_order: str = 'random',
+        priority_file: str = '',
+        bandwidth_limit: float = 0,
+        connection_bandwidth_limit: float = 0,
+        verify_tier: str = 'full',
+        max_connections: int = 5,
+        keepalive_connections: int = 20,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        http2: bool = False,
+        warm_connections: int = WARM_CONNECTIONS,
+        hash_workers: Optional[int] = None,
+    ) -> None:
+        self.user_dir = user_dir
+        self.playable_root = playable_root or ''
+        self.offline_root = offline_root or ''
+        self.official_caches = official_caches or []
+        self.download_order = download_order
+        self.priority_file = priority_file or ''
+        self.warm_connections = warm_connections
+
+        self.size_dict: VMDict = {}
+        """
+        The dictionary that keeps the most up-to-date version of intact, altered and
+        total cache sizes. This dictionary will only have the keys that are associated
+        with the operations of this manager: not all keys might be present at all
+        times!
+        """
 
-            # construct and append file info group
-            file_info_groups.append(FileInfoGroup(
-                version=cache_version,
-                mode=cache_mode,
-                is_official=(cache_version in args.official_caches),
-                local_root=local_dir,
-                url_root=url_dir,
-                file_info_list=file_info_list,
-            ))
+        self.hash_dict: VMDict = {}
+        """
+        The dictionary that keeps the most up-to-date version of the hashes associated
+        with the caches. This will contain all the keys that should be present in the
+        `hashes.json` file, and its current state might be used to update the
+        `hashes.json` file itself.
+        """
 
-    return file_info_groups
+        self.hash_dict_updated: Set[Tuple[str, str]] = set()
+        """
+        The cache version and cache mode pairs whose entries in `hash_dict` have been
+        updated, and should be merged into `hashes.json` when an operation completes.
+        """
 
+        self.bandwidth_bucket: Optional[TokenBucket] = (
+            TokenBucket(bandwidth_limit * 1024)
+            if bandwidth_limit > 0 else
+            None
+        )
+        """
+        The token bucket that all downloads draw from, limiting the total bandwidth used
+        by this manager. `None` if the total bandwidth is unlimited.
+        """
 
-def write_hash_updates(args: Namespace) -> None:
+        self.connection_bandwidth: float = max(connection_bandwidth_limit, 0) * 1024
+        """
+        The maximum bandwidth, in bytes per second, that a single download can use. A
+        value of 0 means that single downloads are only limited by `bandwidth_bucket`.
+        """
+
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        """
+        The circuit breakers of the hosts that files are downloaded from, keyed by host.
+        """
+
+        self.mirror_pools: Dict[str, MirrorPool] = {}
+        """
+        The mirror pools of the cache collections, keyed by the URL root of the
+        collection that all of its mirrors stand in for.
+        """
+
+        self.verify_tier: str = verify_tier
+        """
+        How thoroughly files that have a stat record in `hash_dict` are checked. `stat`
+        trusts their size and modification time, `sampled` hashes a few blocks of each
+        file, `digest` reads every byte but only calculates the local digest, and `full`
+        calculates the `sha256` hash of every byte, like for files without a stat
+        record.
+        """
+
+        self.transfer_meter: TransferMeter = TransferMeter()
+        """
+        Measures the bytes downloaded since the download throughput was last saved, and
+        how long it took.
+        """
+
+        self.file_plan: VMDict = {}
+        """
+        The plans loaded for download and fix operations, in the layout written by the
+        plan operation. Files whose planned state still holds are not hash checked
+        before downloading.
+        """
+
+        self.recent_throughput: float = 0
+        """
+        The download throughput, in bytes per second, measured by recent operations. A
+        value of 0 means that no throughput has been measured yet.
+        """
+
+        throughput_path = Path(user_dir) / 'throughput.json'
+        if throughput_path.is_file():
+            with open(throughput_path) as r:
+                self.recent_throughput = json.load(r).get('bytes_per_second', 0)
+
+        self.operation_running: asyncio.Event = asyncio.Event()
+        """
+        The event that is set while operations are allowed to run, and cleared while
+        they are paused.
+        """
+        self.operation_running.set()
+
+        self.operations: Dict[asyncio.Future, Set[Tuple[str, str]]] = {}
+        """
+        The main handler tasks of the operations that are running, along with the cache
+        version and cache mode pairs whose objects in `size_dict` each of them reports.
+        """
+
+        self.progress_events: Set[asyncio.Event] = set()
+        """
+        The events that wake up the progress iterators of the running operations when
+        `size_dict` changes.
+        """
+
+        self.http2: bool = http2 and h2 is not None
+        """
+        Whether downloads use HTTP/2 with servers that support it, which multiplexes
+        every request to a host on a single connection.
+        """
+
+        if http2 and h2 is None:
+            print('HTTP/2 was requested, but the h2 module is not available, '
+                  'so HTTP/1.1 is used instead', file=sys.stderr, flush=True)
+
+        self.client: httpx.AsyncClient = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=keepalive_connections,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(None))
+        """
+        The HTTP client that all downloads share, so that connections are reused
+        across operations.
+        """
+
+        self.hash_pool: ThreadPoolExecutor = ThreadPoolExecutor(hash_workers)
+        """
+        The threads that files are read in for hashing, kept apart from the default
+        executor so that hashing cannot starve other file operations.
+        """
+
+    async def __aenter__(self) -> 'CacheManager':
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Cancels the running operations, and releases the HTTP client and the hashing
+        threads.
+        """
+        self.cancel()
+        await self.client.aclose()
+        self.hash_pool.shutdown(wait=False)
+
+    def pause(self) -> None:
+        """
+        Pauses the running operations between chunks of work, until `resume` is called.
+        """
+        self.operation_running.clear()
+
+    def resume(self) -> None:
+        """
+        Resumes the operations paused by `pause`.
+        """
+        self.operation_running.set()
+
+    def cancel(self) -> None:
+        """
+        Cancels the running operations, including the ones still waiting for their
+        cache collections. Whatever they have completed so far is kept, and their
+        progress iterators end after reporting it.
+        """
+        self.operation_running.set()
+
+        for operation in self.operations:
+            operation.cancel()
+
+    async def run(
+        self,
+        operation: str,
+        cache_version: str = 'all',
+        cache_mode: str = 'all',
+        cdn_root: str = DEFAULT_CDN_ROOT,
+        **options: Any,
+    ) -> AsyncIterator[VMDict]:
+        """
+        Runs an operation on the described cache collections, and reports its progress.
+        Waits for the operations of this manager and other runs of this script that use
+        the same cache collections to release them first.
+
+        The sizes saved by earlier operations are reported right away, marked with a
+        `provisional` flag and the `timestamp` they were saved at. For hash checks,
+        which only refresh these sizes, the provisional objects are not reported again
+        until the operation completes, and then only if they changed. The changes
+        completed so far are always reported last, even if the operation fails or is
+        cancelled.
+
+        Parameters
+        ----------
+        `operation`: `str`
+            One of `hash-check`, `download`, `fix`, `delete`, `plan`, `gc`, `serve`,
+            `export`, `import` and `watch`.
+        `cache_version`: `str = 'all'`
+            The name of the cache version to operate on, or `all` for every cache
+            version in `versions.json` and `hashes.json`.
+        `cache_mode`: `str = 'all'`
+            The cache mode to operate on, or `all` for both.
+        `cdn_root`: `str = DEFAULT_CDN_ROOT`
+            The URL of the cache version to operate on, or the URL that holds every
+            cache version by name if `cache_version` is `all`.
+        `**options`: `Any`
+            The keyword arguments of the main handler coroutine of the operation, like
+            the `archive_path` of an export.
+
+        Returns
+        -------
+        An async iterator of the objects of `size_dict` that changed, in the same
+        layout as `size_dict`.
+        """
+        handlers = {
+            'hash-check': self.handle_hash_check,
+            'download': self.handle_download,
+            'fix': self.handle_download,
+            'delete': self.handle_delete,
+            'plan': self.handle_plan,
+            'gc': self.handle_gc,
+            'serve': self.handle_serve,
+            'export': self.handle_export,
+            'import': self.handle_import,
+            'watch': self.handle_watch,
+        }
+
+        held_locks: List[Any] = []
+        file_info_groups: List[FileInfoGroup] = []
+        collections: Set[Tuple[str, str]] = set()
+        sent_sizes: VMDict = {}
+        provisional_sizes: Set[Tuple[str, str]] = set()
+        progress = asyncio.Event()
+        handler: Optional[asyncio.Future] = None
+
+        async def lock_and_handle() -> None:
+            file_info_groups.extend(await self.manage_initial_file_states(
+                held_locks, cache_version, cache_mode, cdn_root,
+                prioritize=(operation in ['download', 'fix'])))
+
+            # watching lasts until cancelled, so it locks only what it is checking
+            if operation == 'watch':
+                for lock_file in held_locks:
+                    release_lock_file(lock_file)
+                held_locks.clear()
+
+            collections.update((file_info_group.version, file_info_group.mode)
+                               for file_info_group in file_info_groups)
+
+            await handlers[operation](file_info_groups, **options)
+
+        # connect while waiting for the cache collections, rather than afterwards
+        warm_up = (
+            asyncio.ensure_future(self.warm_up_connections(cache_version, cdn_root))
+            if operation in ['download', 'fix'] else
+            None
+        )
+
+        try:
+            # registered before waiting for the cache collections, so that it can be
+            # cancelled while it waits
+            self.progress_events.add(progress)
+            handler = asyncio.ensure_future(lock_and_handle())
+            self.operations[handler] = collections
+
+            # report the saved sizes before waiting for other operations to finish
+            provisional = self.read_provisional_sizes(cache_version, cache_mode)
+            if provisional:
+                for version_name, version_sizes in provisional.items():
+                    sent_sizes.setdefault(version_name, {}).update(version_sizes)
+                    if operation == 'hash-check':
+                        provisional_sizes.update((version_name, cache_mode)
+                                                 for cache_mode in version_sizes)
+
+                yield provisional
+
+            while not handler.done():
+                waiter = asyncio.ensure_future(progress.wait())
+                await asyncio.wait([handler, waiter],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                progress.clear()
+
+                changes = self.collect_changes(collections, sent_sizes,
+                                               provisional_sizes)
+                if changes:
+                    yield changes
+
+            # always report the final changes so that the client doesn't get stuck
+            provisional_sizes.clear()
+            changes = self.collect_changes(collections, sent_sizes, provisional_sizes)
+            if changes:
+                yield changes
+
+            # a cancelled operation keeps its progress, anything else is a real error
+            if not handler.cancelled():
+                handler.result()
+        finally:
+            if warm_up:
+                warm_up.cancel()
+
+            self.progress_events.discard(progress)
+
+            if handler:
+                self.operations.pop(handler, None)
+
+                if not handler.done():
+                    handler.cancel()
+                    await asyncio.wait([handler])
+
+                # a cancelled operation leaves sizes more recent than the saved ones
+                if handler.cancelled() or not handler.exception():
+                    self.write_size_snapshot(operation, file_info_groups)
+
+            self.write_hash_updates()
+            self.write_throughput()
+
+            for lock_file in held_locks:
+                release_lock_file(lock_file)
+
+    def hash_check(
+        self,
+        cache_version: str = 'all',
+        cache_mode: str = 'all',
+        cdn_root: str = DEFAULT_CDN_ROOT,
+    ) -> AsyncIterator[VMDict]:
+        """
+        Runs the hash check operation. See `run` and `handle_hash_check`.
+        """
+        return self.run('hash-check', cache_version, cache_mode, cdn_root)
+
+    def download(
+        self,
+        cache_version: str = 'all',
+        cache_mode: str = 'all',
+        cdn_root: str = DEFAULT_CDN_ROOT,
+        plan_path: str = '',
+    ) -> AsyncIterator[VMDict]:
+        """
+        Runs the download operation. See `run` and `handle_download`.
+        """
+        return self.run('download', cache_version, cache_mode, cdn_root,
+                        plan_path=plan_path)
+
+    def fix(
+        self,
+        cache_version: str = 'all',
+        cache_mode: str = 'all',
+        cdn_root: str = DEFAULT_CDN_ROOT,
+        plan_path: str = '',
+    ) -> AsyncIterator[VMDict]:
+        """
+        Runs the fix operation. See `run` and `handle_download`.
+        """
+        return self.run('fix', cache_version, cache_mode, cdn_root,
+                        plan_path=plan_path)
+
+    def delete(
+        self,
+        cache_version: str = 'all',
+        cache_mode: str = 'all',
+        cdn_root: str = DEFAULT_CDN_ROOT,
+    ) -> AsyncIterator[VMDict]:
+        """
+        Runs the delete operation. See `run` and `handle_delete`.
+        """
+        return self.run('delete', cache_version, cache_mode, cdn_root)
+
+    # Progress Helpers
+
+    async def wait_if_paused(self) -> None:
+        """
+        Blocks while the operations are paused. Called between chunks of work, so that
+        a pause takes effect right away.
+        """
+        await self.operation_running.wait()
+
+    def report_progress(self) -> None:
+        """
+        Wakes up the progress iterators of the running operations, so that they report
+        the current changes to `size_dict`.
+        """
+        for progress in self.progress_events:
+            progress.set()
+
+    def claim_collection(self, version_name: str, cache_mode: str) -> None:
+        """
+        Makes the running operation report the object of `size_dict` for a cache
+        version and cache mode that is not one of its cache collections, like the
+        directories that the gc operation finds. Must be called from the main handler
+        coroutine of the operation.
+
+        Parameters
+        ----------
+        `version_name`: `str`
+            The key of the object in `size_dict`.
+        `cache_mode`: `str`
+            The key of the object in the cache version's object in `size_dict`.
+        """
+        self.operations[asyncio.current_task()].add((version_name, cache_mode))
+
+    async def report_download_progress(self) -> None:
+        """
+        Reports progress every `PROGRESS_INTERVAL` seconds, as long as any files are
+        being downloaded, until cancelled.
+        """
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+            if any(sizes.get('downloading')
+                   for version_sizes in self.size_dict.values()
+                   for sizes in version_sizes.values()):
+                self.report_progress()
+
+    def collect_changes(
+        self,
+        collections: Set[Tuple[str, str]],
+        sent_sizes: VMDict,
+        provisional_sizes: Set[Tuple[str, str]],
+    ) -> VMDict:
+        """
+        Collects the objects of `size_dict` that changed since they were last reported,
+        and marks them as reported. Only the cache collections of a single operation
+        are considered, since `size_dict` also holds the ones of other operations.
+
+        Parameters
+        ----------
+        `collections`: `Set[Tuple[str, str]]`
+            The cache version and cache mode pairs of the operation.
+        `sent_sizes`: `VMDict`
+            The objects of `size_dict` as they were last reported, updated in place.
+        `provisional_sizes`: `Set[Tuple[str, str]]`
+            The cache version and cache mode pairs whose objects are held back.
+
+        Returns
+        -------
+        The changed objects, in the same layout as `size_dict`.
+        """
+        changes: VMDict = {}
+        for version_name, version_sizes in self.size_dict.items():
+            for cache_mode, sizes in version_sizes.items():
+                if (
+                    (version_name, cache_mode) in collections and
+                    (version_name, cache_mode) not in provisional_sizes and
+                    sent_sizes.get(version_name, {}).get(cache_mode) != sizes
+                ):
+                    changes.setdefault(version_name, {})[cache_mode] = copy.deepcopy(
+                        sizes)
+
+        for version_name, version_sizes in changes.items():
+            sent_sizes.setdefault(version_name, {}).update(version_sizes)
+
+        return changes
+
+    # Connection Helpers
+
+    async def warm_up_connections(self, cache_version: str, cdn_root: str) -> None:
+        """
+        Opens connections to the hosts that a download operation will download from,
+        so that its first downloads do not wait for DNS resolution and handshakes.
+        Opens `warm_connections` connections to every host, or a single one if HTTP/2
+        is used, since it multiplexes every request to a host on one connection. Hosts
+        that cannot be reached are left to the downloads to find out about.
+
+        Parameters
+        ----------
+        `cache_version`: `str`
+            The name of the cache version to download, or `all`.
+        `cdn_root`: `str`
+            The URL of the cache version, or the URL that holds every cache version by
+            name if `cache_version` is `all`.
+        """
+        if self.warm_connections <= 0:
+            return
+
+        try:
+            with open(Path(self.user_dir) / 'versions.json') as r:
+                versions = json.load(r)['versions']
+        except (OSError, ValueError, KeyError):
+            versions = []
+
+        roots = [cdn_root] + [mirror
+                              for version in versions
+                              if cache_version in ['all', version['name']]
+                              for mirror in version.get('mirrors', [])]
+
+        # one root per host is enough, since connections are pooled by host
+        host_roots: Dict[Tuple[str, str, Optional[int]], str] = {}
+        for root in roots:
+            url = httpx.URL(root)
+            if url.scheme in ['http', 'https']:
+                host_roots.setdefault((url.scheme, url.host, url.port), root)
+
+        async def warm_up(root: str) -> None:
+            try:
+                await self.client.head(root)
+            except asyncio.CancelledError:
+                raise
+            except:
+                pass
+
+        connection_count = 1 if self.http2 else self.warm_connections
+        await asyncio.gather(*[warm_up(root)
+                               for root in host_roots.values()
+                               for _ in range(connection_count)])
+
+    # Hash Helpers
+
+    async def get_file_size_and_hashes(
+        self,
+        file_path: Path,
+    ) -> Tuple[int, str, str, str]:
+        """
+        Asynchronously reads a file, calculates its size, `sha256` hash, the `sha256`
+        hash of its sample blocks, and its local digest, in a single pass.
+
+        Parameters
+        ----------
+        `file_path`: `Path`
+            The local path of the file to calculate size and hashes for.
+
+        Returns
+        -------
+        A `Tuple` of file size, the `sha256` hex digest of the file, the `sha256` hex
+        digest of its sample blocks, and its local digest prefixed with `LOCAL_DIGEST`.
+        If there are any errors while reading the file, we just return the size and
+        hash digests accumulated so far.
+        """
+        size = 0
+        sha256 = hashlib.sha256()
+        sample_sha256 = hashlib.sha256()
+        local_digest = new_local_digest()
+
+        try:
+            indices = set(sample_indices(file_path.stat().st_size))
+
+            async with aiofiles.open(file_path, mode='rb',
+                                     executor=self.hash_pool) as rb:
+                for i in itertools.count():
+                    await self.wait_if_paused()
+                    data = await rb.read(BUF_SIZE)
+                    if not data:
+                        break
+                    sha256.update(data)
+                    local_digest.update(data)
+                    if i in indices:
+                        sample_sha256.update(data)
+                    size += len(data)
+        except asyncio.CancelledError:
+            raise
+        except:
+            pass
+
+        return (size, sha256.hexdigest(), sample_sha256.hexdigest(),
+                f'{LOCAL_DIGEST}:{local_digest.hexdigest()}')
+
+    async def get_file_local_digest(self, file_path: Path) -> str:
+        """
+        Asynchronously reads a file and calculates its local digest, without
+        calculating its `sha256` hash.
+
+        Parameters
+        ----------
+        `file_path`: `Path`
+            The local path of the file to calculate the local digest for.
+
+        Returns
+        -------
+        The local digest of the file, prefixed with `LOCAL_DIGEST`. If there are any
+        errors while reading the file, we just return the digest accumulated so far.
+        """
+        local_digest = new_local_digest()
+
+        try:
+            async with aiofiles.open(file_path, mode='rb',
+                                     executor=self.hash_pool) as rb:
+                while True:
+                    await self.wait_if_paused()
+                    data = await rb.read(BUF_SIZE)
+                    if not data:
+                        break
+                    local_digest.update(data)
+        except asyncio.CancelledError:
+            raise
+        except:
+            pass
+
+        return f'{LOCAL_DIGEST}:{local_digest.hexdigest()}'
+
+    async def get_file_sample_hash(self, file_path: Path, size: int) -> str:
+        """
+        Asynchronously reads the sample blocks of a file and calculates their `sha256`
+        hash, without reading the rest of the file.
+
+        Parameters
+        ----------
+        `file_path`: `Path`
+            The local path of the file to calculate the sample hash for.
+        `size`: `int`
+            The size of the file in bytes, which decides the sample blocks.
+
+        Returns
+        -------
+        The `sha256` hex digest of the sample blocks. If there are any errors while
+        reading the file, we just return the hash digest accumulated so far.
+        """
+        sample_sha256 = hashlib.sha256()
+
+        try:
+            async with aiofiles.open(file_path, mode='rb',
+                                     executor=self.hash_pool) as rb:
+                for i in sample_indices(size):
+                    await self.wait_if_paused()
+                    await rb.seek(i * BUF_SIZE)
+                    sample_sha256.update(await rb.read(BUF_SIZE))
+        except asyncio.CancelledError:
+            raise
+        except:
+            pass
+
+        return sample_sha256.hexdigest()
+
+    def manifest_file_size(self, file_info: FileInfo) -> Optional[int]:
+        """
+        Finds the size that a registered file should have, according to its size record
+        in `hash_dict`.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the version, mode and relative path of the file.
+
+        Returns
+        -------
+        The size of the intact file in bytes, or `None` if the file has no size record
+        yet.
+        """
+        return self.hash_dict[file_info.version][file_info.mode + '_sizes'].get(
+            file_info.relative_path())
+
+    def update_size_record(self, file_info: FileInfo, size: int) -> None:
+        """
+        Records the size of an intact file in `hash_dict`, upgrading manifests written
+        before size records existed. Triggers a save of the updated `hash_dict` when
+        the operation completes if the record changes.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the version, mode and relative path of the file.
+        `size`: `int`
+            The size of the intact file in bytes.
+        """
+        size_records = self.hash_dict[file_info.version][file_info.mode + '_sizes']
+        rel_path = file_info.relative_path()
+
+        if size_records.get(rel_path) != size:
+            size_records[rel_path] = size
+            self.hash_dict_updated.add((file_info.version, file_info.mode))
+
+    def update_stat_record(
+        self,
+        file_info: FileInfo,
+        sample_hash: str = '',
+        local_digest: str = '',
+    ) -> None:
+        """
+        Records the current size and modification time of an intact file in `hash_dict`,
+        along with its sample hash and local digest, so that cheaper verification tiers
+        can be used for it later. Removes the record instead if no sample hash is given.
+        Triggers a save of the updated `hash_dict` when the operation completes if the
+        record changes.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file. Should
+            point to a file and not a directory.
+        `sample_hash`: `str = ''`
+            The `sha256` hex digest of the sample blocks of the intact file, or an empty
+            string if the file is not intact.
+        `local_digest`: `str = ''`
+            The local digest of the intact file, prefixed with its algorithm. Left out
+            of the record if empty.
+        """
+        stat_records = self.hash_dict[file_info.version][file_info.mode + '_stats']
+        rel_path = file_info.relative_path()
+
+        record = None
+        if sample_hash:
+            try:
+                stat = file_info.current_local_path.stat()
+                record = {
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime_ns,
+                    'sample': sample_hash,
+                }
+                if local_digest:
+                    record['digest'] = local_digest
+            except OSError:
+                pass
+
+        if stat_records.get(rel_path) == record:
+            return
+
+        if record:
+            stat_records[rel_path] = record
+        else:
+            stat_records.pop(rel_path, None)
+
+        self.hash_dict_updated.add((file_info.version, file_info.mode))
+
+    async def check_file_tiered(
+        self,
+        file_info: FileInfo,
+        verify_tier: str = '',
+    ) -> Optional[Tuple[int, bool]]:
+        """
+        Tries to verify a file according to a verification tier, using the stat record
+        of the file in `hash_dict`, without calculating its `sha256` hash. Files whose
+        size does not match their size record are found to be altered, whatever the
+        tier.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file. Should
+            point to a file and not a directory.
+        `verify_tier`: `str = ''`
+            The verification tier to use, or an empty string to use `verify_tier`.
+
+        Returns
+        -------
+        A `Tuple` of file size and whether the file is intact, or `None` if the file
+        should be fully hashed to find out.
+        """
+        verify_tier = verify_tier or self.verify_tier
+        record = self.hash_dict[file_info.version][file_info.mode + '_stats'].get(
+            file_info.relative_path())
+        expected_size = self.manifest_file_size(file_info)
+
+        try:
+            stat = file_info.current_local_path.stat()
+        except OSError:
+            return None
+
+        # the file has a different size than when it was intact, so it cannot be intact
+        if expected_size is not None and stat.st_size != expected_size:
+            return stat.st_size, False
+
+        if verify_tier == 'full' or not record:
+            return None
+
+        if stat.st_size != record['size']:
+            return stat.st_size, False
+
+        if verify_tier == 'stat':
+            return (stat.st_size, True) if stat.st_mtime_ns == record['mtime'] else None
+
+        if verify_tier == 'digest':
+            # digests of another algorithm cannot tell, so the file is fully hashed
+            if not record.get('digest', '').startswith(LOCAL_DIGEST + ':'):
+                return None
+
+            local_digest = await self.get_file_local_digest(
+                file_info.current_local_path)
+            return stat.st_size, (local_digest == record['digest'])
+
+        sample_hash = await self.get_file_sample_hash(file_info.current_local_path,
+                                                      stat.st_size)
+
+        return stat.st_size, (sample_hash == record['sample'])
+
+    def registered_local_size(self, file_info: FileInfo) -> int:
+        """
+        Finds the size that a file is currently registered with in `hash_dict`, by
+        looking at the file that is still present in the local file system.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file. Should
+            point to a file and not a directory.
+
+        Returns
+        -------
+        The size of the local file if it is registered in `hash_dict` and present, `0`
+        otherwise.
+        """
+        registered = self.hash_dict[file_info.version][file_info.mode]
+
+        if file_info.relative_path() not in registered:
+            return 0
+
+        try:
+            return file_info.current_local_path.stat().st_size
+        except OSError:
+            return 0
+
+    async def check_file_hash(
+        self,
+        file_info: FileInfo,
+        verify_tier: str = '',
+    ) -> Tuple[int, bool]:
+        """
+        Checks if the file pointed to by a given `FileInfo` object matches the `sha256`
+        hash that it should. Files with a stat record are checked according to the
+        given verification tier, while all other files are fully hashed, and their stat
+        record is updated accordingly.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file, and its
+            `sha256` hash hex digest. Should point to a file and not a directory.
+        `verify_tier`: `str = ''`
+            The verification tier to use, or an empty string to use `verify_tier`.
+
+        Returns
+        -------
+        A `Tuple` of file size and whether the file is intact.
+        """
+        tiered_result = await self.check_file_tiered(file_info, verify_tier)
+        if tiered_result:
+            return tiered_result
+
+        size, hash_str, sample_hash, local_digest = (
+            await self.get_file_size_and_hashes(file_info.current_local_path))
+        file_intact = (hash_str == file_info.sha256)
+
+        if file_intact:
+            self.update_stat_record(file_info, sample_hash, local_digest)
+            self.update_size_record(file_info, size)
+        else:
+            self.update_stat_record(file_info)
+
+        return size, file_intact
+
+    async def check_file_hash_and_update(
+        self,
+        file_info: FileInfo,
+        skip_altered_updates: bool = False,
+    ) -> bool:
+        """
+        Checks if the file pointed to by a given `FileInfo` object matches the `sha256`
+        hash that it should, like `check_file_hash` does with `verify_tier`. The hash
+        information should be available in `hash_dict` beforehand. Also updates the
+        intact or altered size in the associated object in `size_dict`, assuming we are
+        counting up from a size of 0.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file, and its
+            `sha256` hash hex digest. Should point to a file and not a directory.
+        `skip_altered_updates`: `bool = False`
+            Whether or not to add the size of the file to the `size_dict` for files that
+            are not intact.
+
+        Returns
+        -------
+        A `bool` indicating whether the hashes matched and the intact size was
+        incremented by the file size (`True`), or the hashes did not match the altered
+        size was incremented by the file size (`False`).
+        """
+        size, file_intact = await self.check_file_hash(file_info)
+
+        state = 'intact' if file_intact else 'altered'
+
+        if skip_altered_updates and not file_intact:
+            return False
+
+        self.size_dict[file_info.version][file_info.mode][state] += size
+
+        return file_intact
+
+    async def register_size_and_hash(
+        self,
+        file_info: FileInfo,
+        previous_size: int = 0,
+    ) -> None:
+        """
+        Calculates the size and `sha256` hash of a file pointed to by the given
+        `FileInfo` object, then saves it into `size_dict` and `hash_dict`, assuming the
+        file is intact. Triggers a save of the updated `hash_dict` when the operation
+        completes if called.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file to be
+            registered. Should point to a file and not a directory.
+        `previous_size`: `int = 0`
+            If the file was already registered, the size it was registered with. This
+            size is taken out of the total sizes, so that re-registering a file does not
+            count it twice.
+        """
+        size, hash_str, sample_hash, local_digest = (
+            await self.get_file_size_and_hashes(file_info.current_local_path))
+
+        sizes = self.size_dict[file_info.version][file_info.mode]
+        sizes['intact'] += size
+        sizes['total'] += size - previous_size
+
+        version_hashes = self.hash_dict[file_info.version]
+        version_hashes[file_info.mode + '_size'] += size - previous_size
+        version_hashes[file_info.mode][file_info.relative_path()] = hash_str
+        self.update_size_record(file_info, size)
+        self.update_stat_record(file_info, sample_hash, local_digest)
+
+        self.hash_dict_updated.add((file_info.version, file_info.mode))
+
+    async def unregister_all_size_and_hash(self, file_info: FileInfo) -> None:
+        """
+        Globally erases all records of a given cache version and cache mode from
+        `size_dict` and `hash_dict`. Does not remove the version and mode key from
+        either dictionary. Triggers a save of the updated `hash_dict` when the operation
+        completes if called.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object whose `version` and `mode` fields describe the cache version and
+            cache mode to erase the records of, respectively.
+        """
+        self.size_dict[file_info.version][file_info.mode]['intact'] = 0
+        self.size_dict[file_info.version][file_info.mode]['altered'] = 0
+        self.size_dict[file_info.version][file_info.mode]['total'] = 0
+
+        self.hash_dict[file_info.version][file_info.mode + '_size'] = 0
+        self.hash_dict[file_info.version][file_info.mode].clear()
+        for suffix in RECORD_SUFFIXES:
+            self.hash_dict[file_info.version][file_info.mode + suffix].clear()
+
+        self.hash_dict_updated.add((file_info.version, file_info.mode))
+
+    # Hash High-Level Helpers
+
+    async def hash_check_unregistered(
+        self,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Handles the hash checking and registering of paths not in `hash_dict`, by
+        traversing the given `FileInfoGroup` objects' current directories, finding files
+        that are not pointed to by the objects in their `file_info_list` fields, and
+        then registering their size and hash into `size_dict` and `hash_dict` by
+        assuming they are intact. Sends updates to the client for each file.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that keep a group of known files and hashes in its
+            `file_info_list` field, within `FileInfo` objects (could be 0 known files),
+            and the current directory in which we should find more files belonging to
+            this cache collection.
+        """
+        for file_info_group in file_info_groups:
+            file_info = file_info_group.default_file_info()
+
+            path_set = {str(fi.current_local_path.resolve())
+                        for fi in file_info_group.file_info_list}
+
+            for file_path in file_info.current_local_path.glob('**/*'):
+                if (
+                    file_path.is_dir() or
+                    file_path.suffix == '.part' or
+                    str(file_path.resolve()) in path_set
+                ):
+                    continue
+
+                await self.register_size_and_hash(file_info.resolve_full(file_path))
+                self.report_progress()
+
+    async def hash_check_registered(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        update_freq: int = 50,
+    ) -> None:
+        """
+        Handles the hash checking of registered paths in the `hash_dict`, for the given
+        `FileInfoGroup` objects.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that keep a group of known files and hashes in its
+            `file_info_list` field, within `FileInfo` objects. These files will be hash
+            checked in random order, disregarding their original grouping.
+        `update_freq`: `int = 50`
+            The frequency at which to stop running hash checks and give updates to the
+            client. This is the number of files that will be checked before an update is
+            given.
+        """
+        file_info_list = [file_info
+                          for file_info_group in file_info_groups
+                          for file_info in file_info_group.file_info_list]
+
+        coroutines = [self.check_file_hash_and_update(file_info)
+                      for file_info in file_info_list]
+        random.shuffle(coroutines)
+
+        for i in range(0, len(coroutines), update_freq):
+            await asyncio.gather(*coroutines[i:i+update_freq])
+            self.report_progress()
+
+    # Bandwidth Helpers
+
+    def new_connection_bucket(self) -> Optional[TokenBucket]:
+        """
+        Creates the token bucket that enforces the per-download bandwidth limit on a
+        single file, or returns `None` if there is no such limit.
+        """
+        return (
+            TokenBucket(self.connection_bandwidth)
+            if self.connection_bandwidth > 0 else
+            None
+        )
+
+    async def throttled_chunks(
+        self,
+        stream: httpx.Response,
+        on_progress: Optional[Callable[[int], None]] = None,
+        connection_bucket: Optional[TokenBucket] = None,
+        limit: int = -1,
+    ) -> AsyncIterator[bytes]:
+        """
+        Iterates over the body of a streamed response, chunk by chunk, while respecting
+        the total and per-download bandwidth limits, and pausing when asked to.
+
+        Parameters
+        ----------
+        `stream`: `httpx.Response`
+            A successful response opened with `client.stream`, whose body is not read
+            yet.
+        `on_progress`: `Optional[Callable[[int], None]] = None`
+            Called with the size of each chunk once it has been consumed.
+        `connection_bucket`: `Optional[TokenBucket] = None`
+            The bucket of the per-download bandwidth limit, for responses that download
+            parts of the same file. A new one is used if not given.
+        `limit`: `int = -1`
+            The number of bytes to read at most, or -1 to read the whole body. The last
+            chunk is cut down to the limit.
+
+        Returns
+        -------
+        An asynchronous iterator of the body chunks, each at most `BUF_SIZE` bytes long.
+        """
+        connection_bucket = connection_bucket or self.new_connection_bucket()
+        consumed = 0
+
+        async for chunk in stream.aiter_bytes(chunk_size=BUF_SIZE):
+            if limit >= 0:
+                chunk = chunk[:limit - consumed]
+
+            if self.transfer_meter:
+                self.transfer_meter.add(len(chunk))
+
+            yield chunk
+            await self.wait_if_paused()
+
+            if on_progress:
+                on_progress(len(chunk))
+
+            if connection_bucket:
+                await connection_bucket.consume(len(chunk))
+            if self.bandwidth_bucket:
+                await self.bandwidth_bucket.consume(len(chunk))
+
+            # charge the cut chunk before stopping, rather than leaving it unaccounted
+            consumed += len(chunk)
+            if consumed == limit:
+                break
+
+    async def write_stream(
+        self,
+        stream: httpx.Response,
+        file_path: Path,
+        mode: str = 'wb',
+        size: int = 0,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """
+        Writes the body of a streamed response into a local file, chunk by chunk,
+        through `throttled_chunks`.
+
+        Parameters
+        ----------
+        `stream`: `httpx.Response`
+            A successful response opened with `client.stream`, whose body is not read
+            yet.
+        `file_path`: `Path`
+            The local path to write the response body to.
+        `mode`: `str = 'wb'`
+            The mode to open the local file with. `'wb'` overwrites the file, `'ab'`
+            appends to it.
+        `size`: `int = 0`
+            The expected size of the response body in bytes, used to preallocate the
+            file when overwriting it. If the body turns out shorter, the file is cut
+            down to it.
+        `on_progress`: `Optional[Callable[[int], None]] = None`
+            Called with the size of each chunk once it has been written.
+        """
+        if mode == 'wb' and size > 0:
+            preallocate_file(file_path, size)
+            mode = 'r+b'
+
+        async with aiofiles.open(file_path, mode=mode) as wb:
+            try:
+                async for chunk in self.throttled_chunks(stream, on_progress):
+                    await wb.write(chunk)
+            finally:
+                await wb.truncate()
+
+    async def write_segments(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        stream: httpx.Response,
+        file_path: Path,
+        size: int,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """
+        Downloads a large file in `SEGMENT_COUNT` byte ranges at once, each written into
+        place in a preallocated local file. The first range is read from the already
+        open response for the whole file, and the rest are requested separately. The
+        ranges share the per-download bandwidth limit of the file. If any range fails,
+        the local file is cut down to the part that is complete from the start, so that
+        the download can be continued like any other partial download.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `url`: `str`
+            The `http://` link of the file to download.
+        `stream`: `httpx.Response`
+            A successful, full response for the file, whose body is not read yet.
+        `file_path`: `Path`
+            The local path to write the file to. Overwritten if it exists.
+        `size`: `int`
+            The size of the remote file in bytes.
+        `on_progress`: `Optional[Callable[[int], None]] = None`
+            Called with the size of each chunk once it has been written.
+        """
+        segment_size = -(-size // SEGMENT_COUNT)
+        bounds = [(start, min(start + segment_size, size))
+                  for start in range(0, size, segment_size)]
+        progress = [0] * len(bounds)
+        connection_bucket = self.new_connection_bucket()
+
+        preallocate_file(file_path, size)
+
+        async def write_segment(index: int, segment_stream: httpx.Response) -> None:
+            start, end = bounds[index]
+
+            async with aiofiles.open(file_path, mode='r+b') as wb:
+                await wb.seek(start)
+                async for chunk in self.throttled_chunks(segment_stream, on_progress,
+                                                         connection_bucket,
+                                                         limit=(end - start)):
+                    await wb.write(chunk)
+                    progress[index] += len(chunk)
+
+            if progress[index] < end - start:
+                raise httpx.ReadError(f'Segment {start}-{end - 1} ended early.')
+
+        async def download_segment(index: int) -> None:
+            start, end = bounds[index]
+            headers = {'Range': f'bytes={start}-{end - 1}'}
+
+            async with client.stream('GET', url, headers=headers) as segment_stream:
+                segment_stream.raise_for_status()
+                if segment_stream.status_code != 206:
+                    raise httpx.ReadError(f'Segment {start}-{end - 1} was not served.')
+
+                await write_segment(index, segment_stream)
+
+        tasks = [asyncio.ensure_future(write_segment(0, stream))]
+        tasks.extend(asyncio.ensure_future(download_segment(i))
+                     for i in range(1, len(bounds)))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            # keep only the contiguous part from the start, for resuming later
+            complete_size = 0
+            for (start, end), written in zip(bounds, progress):
+                complete_size += written
+                if written < end - start:
+                    break
+
+            async with aiofiles.open(file_path, mode='r+b') as wb:
+                await wb.truncate(complete_size)
+
+            raise
+
+    async def download_file(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        file_path: Path,
+        resume: bool = False,
+        expected_size: Optional[int] = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> httpx.Headers:
+        """
+        Downloads a file into its `.part` file, and moves it into place once the
+        download completes. If the download is interrupted, the `.part` file is left
+        behind, so that a later download can pick up where this one left off. Files of
+        at least `SEGMENT_THRESHOLD` bytes are downloaded in segments, if the server
+        supports range requests.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `url`: `str`
+            The `http://` link of the file to download.
+        `file_path`: `Path`
+            The local path to download the file to.
+        `resume`: `bool = False`
+            Whether to continue from an existing `.part` file with a range request. Only
+            safe when the downloaded file is hash checked afterwards, since the remote
+            file might have changed in the meantime.
+        `expected_size`: `Optional[int] = None`
+            The size the downloaded file should have, if known, used to preallocate it
+            when the server does not tell its size.
+        `on_progress`: `Optional[Callable[[int], None]] = None`
+            Called with the number of bytes of the file that are already on disk, and
+            then with the size of each chunk once it has been written.
+
+        Returns
+        -------
+        The headers of the successful response.
+        """
+        part_path = partial_path(file_path)
+        offset = part_path.stat().st_size if resume and part_path.is_file() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        async with client.stream('GET', url, headers=headers) as stream:
+            if stream.status_code == 416:
+                # the partial file cannot be continued, start over on the next try
+                part_path.unlink()
+
+            stream.raise_for_status()
+
+            if stream.status_code == 206 and on_progress:
+                on_progress(offset)
+
+            size = (
+                int(stream.headers.get('content-length', -1))
+                if 'content-encoding' not in stream.headers else
+                -1
+            )
+
+            if (
+                stream.status_code == 200 and
+                stream.headers.get('accept-ranges') == 'bytes' and
+                size >= SEGMENT_THRESHOLD
+            ):
+                await self.write_segments(client, url, stream, part_path, size,
+                                          on_progress=on_progress)
+            else:
+                await self.write_stream(
+                    stream, part_path,
+                    mode=('ab' if stream.status_code == 206 else 'wb'),
+                    size=(size if size >= 0 else expected_size or 0),
+                    on_progress=on_progress)
+
+        os.replace(part_path, file_path)
+
+        return stream.headers
+
+    def get_mirror_pool(self, file_info: FileInfo) -> MirrorPool:
+        """
+        Finds the mirror pool of the cache collection that the given `FileInfo` object
+        belongs to, creating a pool with only the main root if there is none.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object whose `url_root` field contains an `http://` link.
+
+        Returns
+        -------
+        The `MirrorPool` object registered for `url_root` in `mirror_pools`.
+        """
+        if file_info.url_root not in self.mirror_pools:
+            self.mirror_pools[file_info.url_root] = MirrorPool([file_info.url_root])
+
+        return self.mirror_pools[file_info.url_root]
+
+    async def download_file_mirrored(
+        self,
+        client: httpx.AsyncClient,
+        file_info: FileInfo,
+        tried_roots: Set[str],
+        resume: bool = False,
+        exclude: Optional[Set[str]] = None,
+    ) -> Tuple[str, httpx.Headers]:
+        """
+        Downloads a file from the best mirror of its cache collection that was not tried
+        for it yet, through `download_file`, and reports the outcome to the mirror pool.
+        While the file is downloading, its bytes on disk are counted in the
+        `downloading` size of its cache collection in `size_dict`. Roots on hosts whose
+        circuit breaker is open are skipped, and the outcome is reported to the circuit
+        breaker as well.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `file_info`: `FileInfo`
+            An object which points to a singular file that belongs to the cache
+            collection. The `current_url` and `url_root` fields must contain an
+            `http://` link.
+        `tried_roots`: `Set[str]`
+            The roots already tried for this file. The picked root is added to it.
+            Cleared once every usable root has been tried.
+        `resume`: `bool = False`
+            Whether to continue from an existing `.part` file, see `download_file`.
+        `exclude`: `Optional[Set[str]] = None`
+            Roots that should never be used for this file.
+
+        Returns
+        -------
+        A `Tuple` of the root that was used, and the headers of the successful response.
+        """
+        pool = self.get_mirror_pool(file_info)
+        unusable_roots = (exclude or set()) | {
+            root for root in pool.roots if self.get_circuit_breaker(root).is_open()
+        }
+
+        if not set(pool.roots) - unusable_roots:
+            raise CircuitOpenError(f'No host is available for {file_info.current_url}.')
+
+        # every usable root was tried once, give all of them another chance
+        if not set(pool.roots) - unusable_roots - tried_roots:
+            tried_roots.difference_update(pool.roots)
+
+        root = pool.pick(exclude=(tried_roots | unusable_roots))
+        tried_roots.add(root)
+
+        sizes = self.size_dict[file_info.version][file_info.mode]
+        received = 0
+
+        def on_progress(size: int) -> None:
+            nonlocal received
+            received += size
+            sizes['downloading'] = sizes.get('downloading', 0) + size
+
+        pool.active[root] += 1
+        start = time.monotonic()
+
+        try:
+            headers = await self.download_file(
+                client, pool.url(root, file_info), file_info.current_local_path,
+                resume=resume, expected_size=self.manifest_file_size(file_info),
+                on_progress=on_progress)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            pool.report(root, ok=False)
+            self.get_circuit_breaker(root).report(ok=is_permanent_error(e))
+            raise
+        finally:
+            pool.active[root] -= 1
+            sizes['downloading'] = sizes.get('downloading', 0) - received
+
+        self.get_circuit_breaker(root).report(ok=True)
+
+        pool.report(root, ok=True, elapsed=(time.monotonic() - start),
+                    size=file_info.current_local_path.stat().st_size)
+
+        return root, headers
+
+    # Retry Helpers
+
+    def get_circuit_breaker(self, url: str) -> CircuitBreaker:
+        """
+        Finds the circuit breaker of the host of a link, creating it if there is none.
+
+        Parameters
+        ----------
+        `url`: `str`
+            An `http://` link.
+
+        Returns
+        -------
+        The `CircuitBreaker` object registered for the host in `circuit_breakers`.
+        """
+        host = urllib.parse.urlsplit(url).netloc
+
+        if host not in self.circuit_breakers:
+            self.circuit_breakers[host] = CircuitBreaker()
+
+        return self.circuit_breakers[host]
+
+    def record_failure(self, file_info: FileInfo, reason: str) -> None:
+        """
+        Counts a file that could not be downloaded in the `failed_files` field of the
+        associated object in `size_dict`, and the reason in its `errors` field, so that
+        the client can tell the user what went wrong.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the version and mode of the file.
+        `reason`: `str`
+            A short description of why the download failed.
+        """
+        sizes = self.size_dict[file_info.version][file_info.mode]
+        sizes['failed_files'] = sizes.get('failed_files', 0) + 1
+        errors = sizes.setdefault('errors', {})
+        errors[reason] = errors.get(reason, 0) + 1
+
+    # HTTP Validator Helpers
+
+    async def check_remote_unchanged(
+        self,
+        client: httpx.AsyncClient,
+        file_info: FileInfo,
+        validators: Dict[str, Any],
+    ) -> bool:
+        """
+        Probes a remote file with a conditional `HEAD` request, using the validators
+        recorded during its last download. No file contents are transferred.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `file_info`: `FileInfo`
+            An object which points to a singular file that belongs to the cache
+            collection. The `current_url` field must contain an `http://` link.
+        `validators`: `Dict[str, Any]`
+            The validators recorded in `hash_dict` at the time of the last download.
+
+        Returns
+        -------
+        `True` if the server reports the file as not modified, or reports validators
+        that match the recorded ones. `False` if the file changed, or if the probe
+        failed in any way, in which case the file should simply be downloaded again.
+        """
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        pool = self.get_mirror_pool(file_info)
+
+        try:
+            response = await client.head(pool.url(pool.pick(), file_info),
+                                         headers=headers)
+        except asyncio.CancelledError:
+            raise
+        except:
+            return False
+
+        if response.status_code == 304:
+            return True
+
+        if response.is_success:
+            return http_validators_match(validators,
+                                         get_http_validators(response.headers))
+
+        return False
+
+    # Download Helpers
+
+    async def download_unregistered_file_all(
+        self,
+        file_info: FileInfo,
+    ) -> None:
+        """
+        Downloads an unregistered cache collection that uses the `file:///` protocol.
+        Also registers the downloaded files into `size_dict` and `hash_dict` by assuming
+        the files are intact. Sends updates to the client for each file.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object which points to the root of the cache collection with its
+            `current_url` and `current_local_path` fields. The `current_url` and
+            `url_root` fields must contain a local file path or a `file:///` link.
+        """
+        remote_path = Path(file_info.current_url.replace('file:', '', 1).lstrip('/'))
+
+        for file_path in remote_path.glob('**/*'):
+            if file_path.is_dir():
+                continue
+
+            new_file_info = file_info.resolve(
+                file_path.relative_to(remote_path).as_posix())
+            previous_size = self.registered_local_size(new_file_info)
+
+            new_file_info.current_local_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(file_path, new_file_info.current_local_path)
+
+            await self.register_size_and_hash(new_file_info,
+                                              previous_size=previous_size)
+            self.report_progress()
+
+    async def download_unregistered_http_all(
+        self,
+        client: httpx.AsyncClient,
+        file_info: FileInfo,
+        retries: int = 5,
+        depth: int = 3,
+    ) -> None:
+        """
+        Recursively downloads an unregistered cache collection that uses the `http://`
+        protocol and an NGINX-like directory structure. Also registers the downloaded
+        files into `size_dict` and `hash_dict` by assuming the files are intact, along
+        with the HTTP validators (`ETag`, `Last-Modified` and `Content-Length`) the
+        server sent for them. Retries the file download if it fails, for a set amount of
+        times. Sends updates to the client for each file.
+
+        Files that were registered in an earlier run are first probed with a conditional
+        `HEAD` request. If the server reports them as unchanged and the local copy still
+        matches its registered hash, they are not downloaded again.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `file_info`: `FileInfo`
+            An object which points to either a directory or a singular file that belongs
+            to the cache collection. The `current_url` and `url_root` fields must
+            contain an `http://` link that points to an NGINX-like directory.
+        `retries`: `int = 5`
+            In the event that the download of a file fails (but the parent directory is
+            valid), retry this many times before giving up on the download of the file.
+        `depth`: `int = 3`
+            When recursing the cache collection directory, allow at most this level of
+            nesting. A level of 3 means for the cache collection root `a/`, we will be
+            able to download files with paths like `a/b/d.txt` but not files like
+            `a/b/c/d.txt`.
+        """
+        if depth == 0:
+            return
+
+        file_info.current_local_path.mkdir(exist_ok=True)
+
+        # list the directory on the first mirror that manages to
+        pool = self.get_mirror_pool(file_info)
+        for i, root in enumerate(pool.ordered()):
+            try:
+                response = await client.get(pool.url(root, file_info))
+                response.raise_for_status()
+                break
+            except asyncio.CancelledError:
+                raise
+            except:
+                pool.report(root, ok=False)
+                if i + 1 == len(pool.roots):
+                    raise
+
+        bs = BeautifulSoup(response.content, 'html.parser')
+        links = bs.find_all('a', href=True)
+
+        for link in links:
+            file_str = str(link['href'])
+            new_file_info = file_info.resolve(file_str)
+
+            if file_str == '../':
+                continue
+
+            if file_str.endswith('/'):
+                await self.download_unregistered_http_all(
+                    client, new_file_info, retries=retries, depth=(depth - 1))
+                continue
+
+            rel_path = new_file_info.relative_path()
+            version_hashes = self.hash_dict[file_info.version]
+            registered_hash = version_hashes[file_info.mode].get(rel_path, '')
+            all_validators = version_hashes[file_info.mode + '_validators']
+            validators = all_validators.get(rel_path, {})
+
+            if (
+                registered_hash and
+                validators and
+                new_file_info.current_local_path.is_file() and
+                (await self.check_remote_unchanged(client, new_file_info,
+                                                   validators)) and
+                (await self.check_file_hash_and_update(
+                    replace(new_file_info, sha256=registered_hash),
+                    skip_altered_updates=True,
+                ))
+            ):
+                self.report_progress()
+                continue
+
+            previous_size = (
+                validators.get('content_length', -1)
+                if validators.get('content_length', -1) >= 0 else
+                self.registered_local_size(new_file_info)
+            )
+            headers = None
+            error = ''
+            tried_roots = set()
+
+            for i in range(retries):
+                try:
+                    _, headers = await self.download_file_mirrored(
+                        client, new_file_info, tried_roots)
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    error = describe_error(e)
+                    if is_permanent_error(e):
+                        break
+
+                if i + 1 < retries:
+                    await asyncio.sleep(retry_delay(i))
+
+            # keep whatever was registered before, rather than an incomplete file
+            if headers is None:
+                self.record_failure(new_file_info, error)
+
+                # the registered file still counts towards the total, so count it
+                if registered_hash and new_file_info.current_local_path.is_file():
+                    await self.check_file_hash_and_update(
+                        replace(new_file_info, sha256=registered_hash))
+                elif registered_hash:
+                    sizes = self.size_dict[file_info.version][file_info.mode]
+                    sizes['altered'] += previous_size
+
+                self.report_progress()
+                continue
+
+            new_validators = get_http_validators(headers)
+            await self.register_size_and_hash(new_file_info,
+                                              previous_size=previous_size)
+
+            if (
+                new_validators['etag'] or
+                new_validators['last_modified'] or
+                new_validators['content_length'] >= 0
+            ):
+                all_validators[rel_path] = new_validators
+            else:
+                all_validators.pop(rel_path, None)
+            self.hash_dict_updated.add((file_info.version, file_info.mode))
+
+            self.report_progress()
+
+    async def download_registered_single(
+        self,
+        client: httpx.AsyncClient,
+        file_info: FileInfo,
+        retries: int = 5,
+    ) -> bool:
+        """
+        Downloads (through HTTP) a single, registered file in the cache collection.
+        Retries the file download if it fails with a transient error, for a set amount
+        of times, on a different mirror if there is one, with exponential backoff.
+        Permanent errors give up right away, and a file that does not match its hash is
+        not downloaded from the same mirror again, unless it was continued from a
+        partial download. Updates the `size_dict` according to the result, and counts
+        the file as failed if it does not end up intact. Sends updates to the client for
+        each file. Continues from the partial download of an earlier run, if there is
+        one.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `file_info`: `FileInfo`
+            An object which points to either a directory or a singular file that belongs
+            to the cache collection. The `current_url` and `url_root` fields must
+            contain an `http://` link that points to an NGINX-like directory.
+        `retries`: `int = 5`
+            In the event that the download of a file fails (but the parent directory is
+            valid), retry this many times before giving up on the download of the file.
+
+        Returns
+        -------
+        A `bool` indicating whether the file is intact at the end of the download.
+        """
+        state = self.planned_state(file_info)
+
+        if state == 'intact':
+            size = file_info.current_local_path.stat().st_size
+            self.size_dict[file_info.version][file_info.mode]['intact'] += size
+            self.report_progress()
+            return True
+
+        if (
+            state not in ['missing', 'partial', 'altered'] and
+            (await self.check_file_hash_and_update(file_info,
+                                                   skip_altered_updates=True))
+        ):
+            self.report_progress()
+            return True
+
+        pool = self.get_mirror_pool(file_info)
+        file_intact = False
+        error = ''
+        tried_roots = set()
+        mismatched_roots = set()
+
+        for i in range(retries):
+            resumed = partial_path(file_info.current_local_path).is_file()
+
+            try:
+                root, _ = await self.download_file_mirrored(
+                    client, file_info, tried_roots,
+                    resume=True,
+                    exclude=mismatched_roots)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = describe_error(e)
+                if is_permanent_error(e):
+                    break
+
+                if i + 1 < retries:
+                    await asyncio.sleep(retry_delay(i))
+                continue
+
+            file_intact = await self.check_file_hash_and_update(
+                file_info, skip_altered_updates=True)
+            if file_intact:
+                break
+
+            # a mirror that serves the wrong file should not be trusted with others
+            error = 'Hash mismatch'
+            pool.report(root, ok=False)
+
+            # the same object would be served again, unless it was only partly new
+            if not resumed:
+                mismatched_roots.add(root)
+                if len(mismatched_roots) == len(pool.roots):
+                    break
+
+        if not file_intact:
+            self.size_dict[file_info.version][file_info.mode]['altered'] += (
+                self.registered_local_size(file_info))
+            self.record_failure(file_info, error)
+
+        self.report_progress()
+
+        return file_intact
+
+    # Download High-Level Helpers
+
+    async def download_unregistered(
+        self,
+        client: httpx.AsyncClient,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Handles the download and registering of files and their paths not in
+        `hash_dict`, by traversing the given `FileInfoGroup` objects' URL directories,
+        finding all files, and then registering their size and hash into `size_dict` and
+        `hash_dict` by assuming they are intact. Sends updates to the client for each
+        file.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that have valid URL and path roots, such that their
+            `default_file_info()` method returns a `FileInfo` object that represents
+            these roots.
+        """
+        for file_info_group in file_info_groups:
+            file_info = file_info_group.default_file_info()
+
+            if file_info_group.url_root.startswith('http'):
+                await self.download_unregistered_http_all(client, file_info)
+            else:
+                await self.download_unregistered_file_all(file_info)
+
+    async def download_registered(
+        self,
+        client: httpx.AsyncClient,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Handles the download (through HTTP) of files that are registered in `hash_dict`,
+        by traversing the given `FileInfoGroup` objects' `file_info_list` fields, making
+        the necessary directories, and initiating file downloads. Updates the
+        `size_dict` for each file according to the result of the final hash check. Sends
+        updates to the client for each file.
+
+        Files listed in the `priority_list` fields of the groups are downloaded first,
+        in order. When all of them are intact for a group, the `min_playable` flag of
+        the associated object in `size_dict` is set, and an update is sent to the client
+        right away, so that the cache can be used before the rest of the files arrive.
+
+        Parameters
+        ----------
+        `client`: `httpx.AsyncClient`
+            HTTP download client that allows for coroutine byte stream downloads.
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that keep a group of known files and hashes in its
+            `file_info_list` field, within `FileInfo` objects. These files will be
+            downloded in random order, disregarding their original grouping, after the
+            prioritized files of every group.
+        """
+        priority_groups = []
+        priority_coroutines = []
+        coroutines = []
+
+        for file_info_group in file_info_groups:
+            file_info_dict = {file_info.relative_path(): file_info
+                              for file_info in file_info_group.file_info_list}
+
+            for file_info in file_info_group.file_info_list:
+                file_info.current_local_path.parent.mkdir(parents=True, exist_ok=True)
+
+            priority_list = [rel_path
+                             for rel_path in file_info_group.priority_list
+                             if rel_path in file_info_dict]
+
+            if priority_list:
+                priority_groups.append((file_info_group, len(priority_list)))
+
+            for rel_path in priority_list:
+                priority_coroutines.append(self.download_registered_single(
+                    client, file_info_dict.pop(rel_path)))
+
+            for file_info in file_info_dict.values():
+                coroutines.append(self.download_registered_single(client, file_info))
+
+        random.shuffle(coroutines)
+
+        results = await asyncio.gather(*priority_coroutines)
+
+        for file_info_group, count in priority_groups:
+            group_results, results = results[:count], results[count:]
+
+            if all(group_results):
+                sizes = self.size_dict[file_info_group.version][file_info_group.mode]
+                sizes['min_playable'] = True
+                self.report_progress()
+
+        await asyncio.gather(*coroutines)
+
+    # Delete High-Level Helpers
+
+    async def delete_unregistered(
+        self,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Handles the deletion of the unregistered cache collections, by removing the
+        entire directories in the given `FileInfoGroup` objects' local path roots. Also
+        resets the state of `size_dict` and `hash_dict` by erasing all known hashes and
+        resetting sizes. Sends an update to the client per root directory.
+
+        Note that `size_dict` have a tally of 0 for intact and altered sizes at the time
+        of execution, but this does not matter since the sizes will be valid if this
+        coroutine runs properly.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that have valid local path roots, such that their
+            `default_file_info()` method returns a `FileInfo` object that represents
+            these roots.
+        """
+        for file_info_group in file_info_groups:
+            file_info = file_info_group.default_file_info()
+
+            shutil.rmtree(file_info.current_local_path)
+
+            await self.unregister_all_size_and_hash(file_info)
+            self.report_progress()
+
+    async def delete_registered(
+        self,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Handles the deletion of the registered cache collections, by traversing the
+        given `FileInfoGroup` objects' `file_info_list` fields, removing each mentioned
+        file along with its partial download, and then removing any empty directories
+        that were parents of these files, from the innermost to the outermost. Sends an
+        update to the client per root directory.
+
+        Note that `size_dict` will have a tally of 0 for intact and altered sizes, but
+        it will have the proper total cache size at the time of execution. Simply
+        updating the client with this information will make the update valid once the
+        file removal process completes. The coroutine will remove directories only after
+        sending this update.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that keep a group of known files and hashes in its
+            `file_info_list` field, within `FileInfo` objects. These files will be
+            deleted in the order that they are given.
+        """
+        roots = set()
+        for file_info_group in file_info_groups:
+            version_hashes = self.hash_dict[file_info_group.version]
+            version_hashes[file_info_group.mode + '_stats'].clear()
+            self.hash_dict_updated.add((file_info_group.version, file_info_group.mode))
+
+            for file_info in file_info_group.file_info_list:
+                if file_info.current_local_path.parent.is_dir():
+                    roots.add(file_info.current_local_path.parent)
+                if file_info.current_local_path.is_file():
+                    file_info.current_local_path.unlink()
+                if partial_path(file_info.current_local_path).is_file():
+                    partial_path(file_info.current_local_path).unlink()
+
+        self.report_progress()
+
+        roots_list: List[Path] = sorted(roots, key=lambda p: len(p.parts), reverse=True)
+        for root_dir in roots_list:
+            if not any(root_dir.iterdir()):
+                root_dir.rmdir()
+
+    # Plan Helpers
+
+    def plan_file(self, file_info: FileInfo) -> Dict[str, Any]:
+        """
+        Decides what a download would have to do for a registered file, using only the
+        stat data of the local file and the records in `hash_dict`, without reading it.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file. Should
+            point to a file and not a directory.
+
+        Returns
+        -------
+        A `dict` with the following keys:
+        - `state`: `intact` if the file is unchanged since it was found intact,
+        `unverified` if it has to be hash checked to find out, `altered` if its size is
+        wrong, `partial` if only part of it is downloaded, or `missing`.
+        - `size` and `mtime`: The stat data the state was decided with, or `None` if the
+        file does not exist.
+        - `transfer`: The bytes that have to be downloaded, or `None` if unknown.
+        - `reusable`: The bytes that are already on disk and can be kept.
+        """
+        expected_size = self.manifest_file_size(file_info)
+        record = self.hash_dict[file_info.version][file_info.mode + '_stats'].get(
+            file_info.relative_path())
+
+        try:
+            stat = file_info.current_local_path.stat()
+        except OSError:
+            stat = None
+
+        if stat is None:
+            part_path = partial_path(file_info.current_local_path)
+            part_size = part_path.stat().st_size if part_path.is_file() else 0
+            if expected_size is not None:
+                part_size = min(part_size, expected_size)
+
+            return {
+                'state': 'partial' if part_size else 'missing',
+                'size': None,
+                'mtime': None,
+                'transfer': (
+                    expected_size - part_size if expected_size is not None else None
+                ),
+                'reusable': part_size,
+            }
+
+        state = 'unverified'
+        if expected_size is not None and stat.st_size != expected_size:
+            state = 'altered'
+        elif record and (record['size'], record['mtime']) == (stat.st_size,
+                                                              stat.st_mtime_ns):
+            state = 'intact'
+
+        return {
+            'state': state,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'transfer': expected_size if state == 'altered' else 0,
+            'reusable': 0 if state == 'altered' else stat.st_size,
+        }
+
+    def planned_state(self, file_info: FileInfo) -> Optional[str]:
+        """
+        Finds the state of a file in `file_plan`, if the file has not changed since the
+        plan was made.
+
+        Parameters
+        ----------
+        `file_info`: `FileInfo`
+            An object describing the local path at which we can find the file. Should
+            point to a file and not a directory.
+
+        Returns
+        -------
+        The planned state of the file, see `plan_file`, or `None` if the file is not in
+        the plan or has changed since.
+        """
+        entry = self.file_plan.get(file_info.version, {}).get(file_info.mode, {}).get(
+            'files', {}).get(file_info.relative_path())
+
+        if not entry:
+            return None
+
+        try:
+            stat = file_info.current_local_path.stat()
+            current = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            current = (None, None)
+
+        return entry['state'] if current == (entry['size'], entry['mtime']) else None
+
+    def summarize_plan(
+        self,
+        file_info_group: FileInfoGroup,
+        file_plans: Dict[str, Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Sums up the plans of the files of a cache collection. The sizes of files without
+        a size record are estimated from the total size of the cache collection.
+
+        Parameters
+        ----------
+        `file_info_group`: `FileInfoGroup`
+            The cache collection.
+        `file_plans`: `Dict[str, Dict[str, Any]]`
+            The plans of its registered files by relative path, as returned by
+            `plan_file`.
+
+        Returns
+        -------
+        A `dict` with the number of files in each state, the bytes to transfer and the
+        bytes to reuse, and the estimated download time in seconds, or `None` if no
+        throughput has been measured yet.
+        """
+        summary: Dict[str, Any] = {
+            state + '_files': 0
+            for state in ['intact', 'unverified', 'altered', 'partial', 'missing']
+        }
+
+        transfer_size = 0
+        reusable_size = 0
+        unsized_size = (
+            self.hash_dict[file_info_group.version][file_info_group.mode + '_size'])
+
+        for file_info in file_info_group.file_info_list:
+            file_plan_entry = file_plans[file_info.relative_path()]
+            summary[file_plan_entry['state'] + '_files'] += 1
+            reusable_size += file_plan_entry['reusable']
+
+            expected_size = self.manifest_file_size(file_info)
+            if expected_size is not None:
+                unsized_size -= expected_size
+                transfer_size += file_plan_entry['transfer']
+            else:
+                unsized_size -= file_plan_entry['size'] or 0
+
+        transfer_size += max(unsized_size, 0)
+
+        summary['transfer_size'] = transfer_size
+        summary['reusable_size'] = reusable_size
+        summary['estimated_seconds'] = (
+            round(transfer_size / self.recent_throughput, 1)
+            if self.recent_throughput > 0 else
+            None
+        )
+
+        return summary
+
+    # GC Helpers
+
+    def find_duplicates(
+        self,
+        file_info_groups: List[FileInfoGroup],
+    ) -> List[Tuple[FileInfo, FileInfo]]:
+        """
+        Finds registered files that have the same contents as another registered file on
+        the same file system, but are stored separately. Only files that are known to be
+        intact from their stat records are considered, so no file is read.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The cache collections to look for duplicates in.
+
+        Returns
+        -------
+        A list of pairs of a duplicate file and the file it duplicates.
+        """
+        sources: Dict[Tuple[str, int], Tuple[FileInfo, int]] = {}
+        duplicates = []
+
+        for file_info_group in file_info_groups:
+            for file_info in file_info_group.file_info_list:
+                if self.plan_file(file_info)['state'] != 'intact':
+                    continue
+
+                stat = file_info.current_local_path.stat()
+                key = (file_info.sha256, stat.st_dev)
+
+                if key not in sources:
+                    sources[key] = (file_info, stat.st_ino)
+                elif sources[key][1] != stat.st_ino:
+                    duplicates.append((file_info, sources[key][0]))
+
+        return duplicates
+
+    # Serve Helpers
+
+    async def build_serve_tree(
+        self,
+        file_info_groups: List[FileInfoGroup],
+    ) -> Dict[str, Dict[str, Optional[Path]]]:
+        """
+        Hash checks the registered files of the given `FileInfoGroup` objects, and
+        arranges the intact ones into a directory tree, as it should appear over HTTP.
+        Every cache version gets its own top-level directory, merging the files of its
+        offline and playable caches, with offline files taking precedence. Sends updates
+        to the client for each group.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that keep a group of known files and hashes in its
+            `file_info_list` field, within `FileInfo` objects.
+
+        Returns
+        -------
+        A `dict` that maps each directory's URL path, like `/beta-20100104/`, to the
+        names of its entries, mapped to their local paths for files, or `None` for
+        directories.
+        """
+        serve_tree: Dict[str, Dict[str, Optional[Path]]] = {'/': {}}
+
+        # offline files are added last, so that they overwrite playable files
+        for file_info_group in sorted(file_info_groups,
+                                      key=lambda g: g.mode == 'offline'):
+            for file_info in file_info_group.file_info_list:
+                if not (await self.check_file_hash_and_update(
+                    file_info, skip_altered_updates=True
+                )):
+                    continue
+
+                parts = [file_info_group.version] + file_info.relative_path().split('/')
+
+                for i, name in enumerate(parts[:-1]):
+                    dir_path = '/' + ''.join(part + '/' for part in parts[:i])
+                    serve_tree.setdefault(dir_path, {})[name + '/'] = None
+                    serve_tree.setdefault(dir_path + name + '/', {})
+
+                dir_path = '/' + ''.join(part + '/' for part in parts[:-1])
+                serve_tree[dir_path][parts[-1]] = file_info.current_local_path
+
+            self.report_progress()
+
+        return serve_tree
+
+    async def send_file(
+        self,
+        writer: asyncio.StreamWriter,
+        request_headers: Dict[str, str],
+        file_path: Path,
+        send_body: bool,
+    ) -> None:
+        """
+        Serves a local file over an HTTP connection, answering conditional and range
+        requests like NGINX does. The upload respects the total bandwidth limit.
+
+        Parameters
+        ----------
+        `writer`: `asyncio.StreamWriter`
+            The writer object of the HTTP connection.
+        `request_headers`: `Dict[str, str]`
+            The request headers, with lowercase names.
+        `file_path`: `Path`
+            The local path of the intact file to serve.
+        `send_body`: `bool`
+            Whether to send the file contents, `False` for `HEAD` requests.
+        """
+        stat = file_path.stat()
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'ETag': etag,
+            'Last-Modified': last_modified,
+        }
+
+        if (
+            request_headers.get('if-none-match') == etag or
+            request_headers.get('if-modified-since') == last_modified
+        ):
+            await send_response_head(writer, '304 Not Modified', headers)
+            return
+
+        start, end = 0, stat.st_size - 1
+        status = '200 OK'
+
+        if 'range' in request_headers:
+            byte_range = parse_range(request_headers['range'], stat.st_size)
+            if not byte_range:
+                headers['Content-Range'] = f'bytes */{stat.st_size}'
+                headers['Content-Length'] = '0'
+                await send_response_head(writer, '416 Range Not Satisfiable', headers)
+                return
+
+            start, end = byte_range
+            status = '206 Partial Content'
+            headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+        headers['Content-Length'] = str(end - start + 1)
+        headers['Content-Type'] = 'application/octet-stream'
+        await send_response_head(writer, status, headers)
+
+        if not send_body:
+            return
+
+        async with aiofiles.open(file_path, mode='rb') as rb:
+            await rb.seek(start)
+            remaining = end - start + 1
+
+            while remaining > 0:
+                data = await rb.read(min(BUF_SIZE, remaining))
+                if not data:
+                    break
+
+                writer.write(data)
+                await writer.drain()
+                remaining -= len(data)
+
+                if self.bandwidth_bucket:
+                    await self.bandwidth_bucket.consume(len(data))
+
+    async def handle_serve_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        serve_tree: Dict[str, Dict[str, Optional[Path]]],
+        semaphore: asyncio.Semaphore,
+    ) -> None:
+        """
+        Answers the HTTP/1.1 requests that arrive on a single, persistent connection,
+        until the peer closes it. Only `GET` and `HEAD` requests are supported.
+
+        Parameters
+        ----------
+        `reader`: `asyncio.StreamReader`
+            The reader object of the HTTP connection.
+        `writer`: `asyncio.StreamWriter`
+            The writer object of the HTTP connection.
+        `serve_tree`: `Dict[str, Dict[str, Optional[Path]]]`
+            The directory tree to serve, as returned by `build_serve_tree`.
+        `semaphore`: `asyncio.Semaphore`
+            Limits how many requests are answered at once, across all connections.
+        """
+        try:
+            while True:
+                request_line = (await reader.readline()).decode('latin-1').strip()
+                if not request_line:
+                    break
+
+                request_headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(':')
+                    request_headers[key.strip().lower()] = value.strip()
+
+                method, target, *_ = request_line.split(' ') + ['']
+                url_path = urllib.parse.unquote(urllib.parse.urlsplit(target).path)
+                parent_path, _, name = url_path.rpartition('/')
+                entries = serve_tree.get(parent_path + '/', {})
+
+                async with semaphore:
+                    if method not in ['GET', 'HEAD']:
+                        await send_response_head(writer, '405 Method Not Allowed',
+                                                 {'Allow': 'GET, HEAD',
+                                                  'Content-Length': '0'})
+                    elif url_path in serve_tree and url_path.endswith('/'):
+                        body = directory_index(url_path, serve_tree[url_path])
+                        await send_response_head(writer, '200 OK', {
+                            'Content-Type': 'text/html',
+                            'Content-Length': str(len(body)),
+                        })
+                        if method == 'GET':
+                            writer.write(body)
+                            await writer.drain()
+                    elif url_path + '/' in serve_tree:
+                        await send_response_head(writer, '301 Moved Permanently', {
+                            'Location': urllib.parse.quote(url_path + '/'),
+                            'Content-Length': '0',
+                        })
+                    elif entries.get(name) and entries[name].is_file():
+                        await self.send_file(writer, request_headers, entries[name],
+                                             send_body=(method == 'GET'))
+                    else:
+                        await send_response_head(writer, '404 Not Found',
+                                                 {'Content-Length': '0'})
+
+                if request_headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Archive Helpers
+
+    async def extract_archive_member(
+        self,
+        archive: tarfile.TarFile,
+        member: tarfile.TarInfo,
+        file_info: FileInfo,
+    ) -> bool:
+        """
+        Extracts a file from a version pack archive that is being read as a stream,
+        hashing it on the fly. Reading the next chunk from the archive overlaps with
+        writing the current one. The file is written to its partial download path, and
+        only moved into place if its hash matches.
+
+        Parameters
+        ----------
+        `archive`: `tarfile.TarFile`
+            The archive, opened for stream reading.
+        `member`: `tarfile.TarInfo`
+            The archive member to extract, which must be the current member of the
+            stream.
+        `file_info`: `FileInfo`
+            An object describing the local path to extract the file to, and its `sha256`
+            hash hex digest.
+
+        Returns
+        -------
+        A `bool` indicating whether the extracted file was intact and moved into place.
+        """
+        loop = asyncio.get_running_loop()
+        file_path = file_info.current_local_path
+        part_path = partial_path(file_path)
+        sha256 = hashlib.sha256()
+        local_digest = new_local_digest()
+
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        member_file = archive.extractfile(member)
+
+        async with aiofiles.open(part_path, mode='wb') as wb:
+            data = await loop.run_in_executor(None, member_file.read, BUF_SIZE)
+            while data:
+                sha256.update(data)
+                local_digest.update(data)
+                next_data = loop.run_in_executor(None, member_file.read, BUF_SIZE)
+                await wb.write(data)
+                await self.wait_if_paused()
+                data = await next_data
+
+        if sha256.hexdigest() != file_info.sha256:
+            part_path.unlink()
+            return False
+
+        os.replace(part_path, file_path)
+        self.update_size_record(file_info, member.size)
+        self.update_stat_record(file_info,
+                                await self.get_file_sample_hash(file_path, member.size),
+                                f'{LOCAL_DIGEST}:{local_digest.hexdigest()}')
+
+        return True
+
+    def adopt_archive_manifest(
+        self,
+        manifest: VMDict,
+        file_info_groups: List[FileInfoGroup],
+    ) -> Tuple[Dict[str, FileInfo], Set[Tuple[str, str]]]:
+        """
+        Registers the hashes of the archived cache collections that are not official
+        and have no registered hashes yet into `size_dict` and `hash_dict`, and finds
+        the files that can be extracted from the archive. Registered hashes are never
+        replaced by the ones in the archive, and official cache collections only accept
+        files that match their official hashes, since the archive cannot be trusted to
+        decide what an official cache contains. Files that would end up outside of
+        their cache collection are never extracted. Triggers a save of the updated
+        `hash_dict` when the operation completes if any hashes are registered.
+
+        Parameters
+        ----------
+        `manifest`: `VMDict`
+            The manifest of the archive, in the same layout as `hash_dict`.
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that describe the cache collections to extract files into.
+
+        Returns
+        -------
+        A `dict` that maps archive member names to `FileInfo` objects describing where
+        to extract them, and the hashes they should have, along with the versions and
+        modes of the adopted cache collections whose total size is missing from the
+        manifest, and needs to be recomputed from the extracted files.
+
+        Raises
+        ------
+        `ValueError`
+            If the manifest lists a path that is not inside its cache collection.
+        """
+        targets = {}
+        unsized_collections = set()
+
+        for file_info_group in file_info_groups:
+            version, mode = file_info_group.version, file_info_group.mode
+            archived_hashes = manifest.get(version, {}).get(mode, {})
+
+            for rel_path in archived_hashes:
+                if not is_safe_member_path(rel_path):
+                    raise ValueError(f'{rel_path} is not a path inside a cache.')
+
+            if (
+                archived_hashes and
+                not file_info_group.is_official and
+                not self.hash_dict[version][mode]
+            ):
+                self.hash_dict[version][mode].update(archived_hashes)
+                archived_size = manifest[version].get(mode + '_size', 0)
+                self.hash_dict[version][mode + '_size'] = archived_size
+                self.size_dict[version][mode]['total'] = archived_size
+                self.hash_dict_updated.add((version, mode))
+
+                if mode + '_size' not in manifest[version]:
+                    unsized_collections.add((version, mode))
+
+            file_info = file_info_group.default_file_info()
+            collection_root = file_info.local_root.resolve()
+
+            for rel_path, file_hash in self.hash_dict[version][mode].items():
+                new_file_info = file_info.resolve(rel_path, sha256=file_hash)
+
+                try:
+                    new_file_info.current_local_path.resolve().relative_to(
+                        collection_root)
+                except ValueError:
+                    continue
+
+                targets[archive_member_name(new_file_info)] = new_file_info
+
+        return targets, unsized_collections
+
+    # Watch Helpers
+
+    def collection_dir(self, file_info_group: FileInfoGroup) -> Path:
+        """
+        Finds the directory that the files of a cache collection are currently in,
+        which changes when playable caches are swapped.
+
+        Parameters
+        ----------
+        `file_info_group`: `FileInfoGroup`
+            The object that represents the cache collection.
+
+        Returns
+        -------
+        The current local root of the cache collection.
+        """
+        local_root = (
+            self.offline_root
+            if file_info_group.mode == 'offline' else
+            self.playable_root
+        )
+
+        return swapped_path(local_root, self.user_dir,
+                            file_info_group.version, file_info_group.mode)
+
+    def start_observer(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        paths_changed: Callable[[List[Path]], None],
+    ) -> Optional[Any]:
+        """
+        Starts watching the local cache roots of the given cache collections for
+        changes with a `watchdog` observer. The roots are watched rather than the cache
+        collections themselves, so that swapping playable caches is noticed as well.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that represent the cache collections to watch.
+        `paths_changed`: `Callable[[List[Path]], None]`
+            Called on the event loop with the paths that changed.
+
+        Returns
+        -------
+        The running observer, to be stopped by the caller, or `None` if filesystem
+        notifications are not available, and changes should be polled for instead.
+        """
+        roots = list(dict.fromkeys(
+            self.offline_root if file_info_group.mode == 'offline' else
+            self.playable_root
+            for file_info_group in file_info_groups
+        ))
+
+        if watchdog is None or not all(root and Path(root).is_dir() for root in roots):
+            return None
+
+        observer = watchdog.observers.Observer()
+        collector = ChangeCollector(asyncio.get_running_loop(), paths_changed)
+
+        try:
+            for root in roots:
+                observer.schedule(collector, root, recursive=True)
+            observer.start()
+        except:
+            # the system might not allow that many watches, but polling still works
+            return None
+
+        return observer
+
+    async def poll_changes(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        paths_changed: Callable[[List[Path]], None],
+        poll_interval: float,
+    ) -> None:
+        """
+        Watches the given cache collections for changes by comparing the sizes and
+        modification times of their registered files every `poll_interval` seconds,
+        for when filesystem notifications are not available. Runs until cancelled.
+
+        Only the registered files and the directories that hold them are checked, one
+        `stat` each, rather than walking the cache collections. Files added to these
+        directories change their modification times, so they are noticed as well.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that represent the cache collections to watch.
+        `paths_changed`: `Callable[[List[Path]], None]`
+            Called with the paths that changed.
+        `poll_interval`: `float`
+            The number of seconds between checks.
+        """
+        loop = asyncio.get_running_loop()
+        checks: Dict[Path, Dict[str, Optional[Tuple[int, int]]]] = {}
+        collection_dirs: Dict[Tuple[str, str], Path] = {}
+
+        while True:
+            for file_info_group in file_info_groups:
+                key = (file_info_group.version, file_info_group.mode)
+                collection_dir = self.collection_dir(file_info_group)
+                last_collection_dir = collection_dirs.get(key, collection_dir)
+                collection_dirs[key] = collection_dir
+                records = self.hash_dict[file_info_group.version]
+                rel_paths = (set(records[file_info_group.mode]) |
+                             set(records[file_info_group.mode + '_stats']))
+                path_stats = await loop.run_in_executor(None, stat_known_paths,
+                                                        collection_dir, rel_paths)
+
+                # the first check of a path is what later checks are compared to
+                last_path_stats = checks.get(collection_dir, path_stats)
+                checks[collection_dir] = path_stats
+
+                changed_paths = [
+                    collection_dir / rel_path
+                    for rel_path, path_stat in path_stats.items()
+                    if last_path_stats.get(rel_path, path_stat) != path_stat
+                ]
+
+                # swapped playable caches are checked as a whole
+                if collection_dir != last_collection_dir:
+                    changed_paths.append(collection_dir)
+
+                if changed_paths:
+                    paths_changed(changed_paths)
+
+            await asyncio.sleep(poll_interval)
+
+    async def check_watched_collection(
+        self,
+        file_info_group: FileInfoGroup,
+        collection_dir: Path,
+        rel_paths: Optional[Set[str]],
+        file_states: Dict[str, Tuple[int, bool]],
+        update_freq: int = 50,
+    ) -> None:
+        """
+        Checks the given files of a watched cache collection, like a hash check that
+        trusts file stats, and then sets its object in `size_dict` to the sizes of the
+        files at their last check. Files that other operations verified since they
+        changed are not read again. In cache collections that are not official, files
+        that are not registered are registered, assuming they are intact.
+
+        Parameters
+        ----------
+        `file_info_group`: `FileInfoGroup`
+            The object that represents the cache collection.
+        `collection_dir`: `Path`
+            The current local root of the cache collection.
+        `rel_paths`: `Optional[Set[str]]`
+            The relative paths of the files and directories that changed, or `None` to
+            check every file of the cache collection.
+        `file_states`: `Dict[str, Tuple[int, bool]]`
+            The size of each registered file at its last check, and whether it was
+            intact, by relative path. Updated in place.
+        `update_freq`: `int = 50`
+            The number of files that are checked at once.
+        """
+        loop = asyncio.get_running_loop()
+        version_name, cache_mode = file_info_group.version, file_info_group.mode
+        registered = self.hash_dict[version_name][cache_mode]
+
+        # expand changed directories into their files, present and past
+        if rel_paths is None:
+            rel_paths = set(registered) | set(file_states) | set(
+                await loop.run_in_executor(None, scan_file_stats, collection_dir))
+        else:
+            for rel_path in list(rel_paths):
+                path = collection_dir / rel_path
+                if path.is_file() or rel_path in registered or rel_path in file_states:
+                    continue
+
+                if path.is_dir():
+                    dir_file_stats = await loop.run_in_executor(None, scan_file_stats,
+                                                                path)
+                    rel_paths.update(rel_path + '/' + dir_rel_path
+                                     for dir_rel_path in dir_file_stats)
+
+                rel_paths.update(known_path
+                                 for known_path in itertools.chain(registered,
+                                                                   file_states)
+                                 if known_path.startswith(rel_path + '/'))
+
+        file_info = replace(file_info_group.default_file_info(),
+                            local_root=collection_dir,
+                            current_local_path=collection_dir)
+
+        async def check(rel_path: str) -> None:
+            if rel_path not in registered:
+                if (
+                    file_info_group.is_official or
+                    rel_path.endswith('.part') or
+                    not (collection_dir / rel_path).is_file()
+                ):
+                    return
+
+                await self.register_size_and_hash(file_info.resolve(rel_path))
+
+            file_states[rel_path] = await self.check_file_hash(
+                file_info.resolve(rel_path, sha256=registered[rel_path]),
+                verify_tier='stat')
+
+        coroutines = [check(rel_path) for rel_path in rel_paths]
+        for i in range(0, len(coroutines), update_freq):
+            await asyncio.gather(*coroutines[i:i+update_freq])
+
+        # files might have been unregistered by other operations in the meantime
+        for rel_path in [rel_path for rel_path in file_states
+                         if rel_path not in registered]:
+            del file_states[rel_path]
+
+        sizes = self.size_dict[version_name][cache_mode]
+        sizes['intact'] = sum(size for size, intact in file_states.values() if intact)
+        sizes['altered'] = sum(size
+                               for size, intact in file_states.values()
+                               if not intact)
+        sizes['total'] = self.hash_dict[version_name][cache_mode + '_size']
+
+    async def check_watched_changes(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        changed_paths: Set[Path],
+        collection_dirs: Dict[Tuple[str, str], Path],
+        file_states: Dict[Tuple[str, str], Dict[str, Tuple[int, bool]]],
+    ) -> List[FileInfoGroup]:
+        """
+        Checks the files of the watched cache collections that changed. A cache
+        collection is checked as a whole the first time, and whenever its directory
+        changes, like when playable caches are swapped.
+
+        The cache collections with changes are locked only while they are checked, so
+        that other operations and runs of this script can use them in the meantime.
+        Their entries in `hash_dict` are reloaded beforehand, and saved afterwards.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that represent the watched cache collections.
+        `changed_paths`: `Set[Path]`
+            The paths that changed since the last check.
+        `collection_dirs`: `Dict[Tuple[str, str], Path]`
+            The local root of each cache collection at the last check, by cache version
+            and cache mode. Updated in place.
+        `file_states`: `Dict[Tuple[str, str], Dict[str, Tuple[int, bool]]]`
+            The states of the registered files at their last check, as described in
+            `check_watched_collection`, by cache version and cache mode. Updated in
+            place.
+
+        Returns
+        -------
+        The objects that represent the cache collections that were checked.
+        """
+        checks: List[Tuple[FileInfoGroup, Path, Optional[Set[str]]]] = []
+
+        for file_info_group in file_info_groups:
+            key = (file_info_group.version, file_info_group.mode)
+            collection_dir = self.collection_dir(file_info_group)
+
+            if collection_dirs.get(key) != collection_dir:
+                collection_dirs[key] = collection_dir
+                checks.append((file_info_group, collection_dir, None))
+                continue
+
+            rel_paths = set()
+            for path in changed_paths:
+                try:
+                    rel_paths.add(path.relative_to(collection_dir).as_posix())
+                except ValueError:
+                    pass
+
+            if rel_paths:
+                # the directory itself changed, so anything in it might have
+                checks.append((file_info_group, collection_dir,
+                               None if '.' in rel_paths else rel_paths))
+
+        held_locks: List[Any] = []
+
+        try:
+            for file_info_group, _, _ in sorted(
+                checks, key=lambda check: (check[0].version, check[0].mode)
+            ):
+                await self.acquire_collection_locks(
+                    held_locks, [file_info_group.version], [file_info_group.mode])
+
+            self.reload_collection_records([
+                (file_info_group.version, file_info_group.mode)
+                for file_info_group, _, _ in checks
+            ])
+
+            for file_info_group, collection_dir, rel_paths in checks:
+                await self.check_watched_collection(
+                    file_info_group, collection_dir, rel_paths,
+                    file_states.setdefault(
+                        (file_info_group.version, file_info_group.mode), {}))
+
+            self.write_hash_updates()
+        finally:
+            for lock_file in held_locks:
+                release_lock_file(lock_file)
+
+        return [file_info_group for file_info_group, _, _ in checks]
+
+    # Lock Helpers
+
+    def read_hash_file(self) -> VMDict:
+        """
+        Reads `hashes.json` while no other run of this script is writing it.
+
+        Returns
+        -------
+        The contents of `hashes.json`.
+        """
+        manifest_lock = acquire_lock_file(Path(self.user_dir) / 'hashes.json.lock')
+
+        try:
+            with open(Path(self.user_dir) / 'hashes.json') as r:
+                return json.load(r)
+        finally:
+            release_lock_file(manifest_lock)
+
+    async def acquire_collection_locks(
+        self,
+        held_locks: List[Any],
+        cache_versions: List[str],
+        cache_modes: List[str],
+    ) -> None:
+        """
+        Waits until the given cache collections are not used by any other operation or
+        run of this script, and locks them. Locks are taken in the same order by every
+        operation, so that operations with overlapping cache collections cannot
+        deadlock.
+
+        Parameters
+        ----------
+        `held_locks`: `List[Any]`
+            The list to add the open lock files to, to be released by the caller.
+        `cache_versions`: `List[str]`
+            The names of the cache versions to lock.
+        `cache_modes`: `List[str]`
+            The cache modes to lock, for each cache version.
+        """
+        for cache_version, cache_mode in sorted(itertools.product(cache_versions,
+                                                                  cache_modes)):
+            lock_name = (
+                f'{urllib.parse.quote(cache_version, safe="")}.{cache_mode}.lock')
+            held_locks.append(await acquire_lock_file_async(
+                Path(self.user_dir) / 'locks' / lock_name))
+
+    def reload_collection_records(self, collections: List[Tuple[str, str]]) -> None:
+        """
+        Reloads the hashes and per-file records of the given cache collections in
+        `hash_dict` from `hashes.json`, since whoever held them last might have updated
+        them. Cache versions that are not in `hash_dict` yet are loaded as a whole.
+        Should only be called while the cache collections are locked.
+
+        Parameters
+        ----------
+        `collections`: `List[Tuple[str, str]]`
+            The cache version and cache mode pairs of the cache collections to reload.
+        """
+        for version_name, version_hashes in self.read_hash_file().items():
+            if version_name not in self.hash_dict:
+                self.hash_dict[version_name] = version_hashes
+                continue
+
+            for cache_mode in [mode for version, mode in collections
+                               if version == version_name]:
+                for key in [cache_mode + '_size', cache_mode] + [
+                    cache_mode + suffix for suffix in RECORD_SUFFIXES
+                ]:
+                    if key in version_hashes:
+                        self.hash_dict[version_name][key] = version_hashes[key]
+
+    # Operations
+
+    async def handle_hash_check(
+        self,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Main handler coroutine for the hash check operation.
+
+        Expected behavior, per `FileInfoGroup` in the `file_info_groups` argument, is as
+        follows:
+        - If `FileInfoGroup` is official, then only check hashes of files in (either in
+        the default or current) `hashes.json`.
+        - If `FileInfoGroup` is not official, but has hashes registered in the current
+        `hashes.json`, check hashes of files registered in `hashes.json`, and then run a
+        tree search for more files. If a file unregistered in `hashes.json` is found,
+        calculate its hash and register it into `hashes.json` (assuming intact).
+        - If `FileInfoGroup` is not official, and has no registered hashes in the
+        current `hashes.json`, run a tree search for all files. If a file unregistered
+        in `hashes.json` is found, calculate its hash and register it into `hashes.json`
+        (assuming intact).
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode. Each
+            `FileInfoGroup` object can tell if they represent an official cache.
+        """
+        registered_groups = [file_info_group
+                             for file_info_group in file_info_groups
+                             if file_info_group.file_info_list]
+        unregistered_groups = [file_info_group
+                               for file_info_group in file_info_groups
+                               if not file_info_group.is_official]
+
+        if registered_groups:
+            await self.hash_check_registered(registered_groups)
+        if unregistered_groups:
+            await self.hash_check_unregistered(unregistered_groups)
+
+    async def handle_download(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        plan_path: str = '',
+    ) -> None:
+        """
+        Main handler coroutine for the download and fix operations.
+
+        Expected behavior, per `FileInfoGroup` in the `file_info_groups` argument, is as
+        follows:
+        - If `FileInfoGroup` is official, then only download and check hashes of files
+        in (either in the default or current) `hashes.json`.
+        - If `FileInfoGroup` is not official, but has hashes registered in the current
+        `hashes.json`, recursively download files from the remote URL of the
+        `FileInfoGroup`, skipping registered files that are intact and unchanged on the
+        server. For each file downloaded, calculate its hash and register it into
+        `hashes.json` (assuming intact, and overwriting existing hashes).
+        - If `FileInfoGroup` is not official, and has no registered hashes in the
+        current `hashes.json`, recursively download files from the remote URL of the
+        `FileInfoGroup`. For each file downloaded, calculate its hash and register it
+        into `hashes.json` (assuming intact).
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode. Each
+            `FileInfoGroup` object can tell if they represent an official cache.
+        `plan_path`: `str = ''`
+            The local path of a plan saved by the plan operation. Files whose planned
+            state still holds are not hash checked before downloading. Not used if
+            empty.
+        """
+        if plan_path and Path(plan_path).is_file():
+            with open(plan_path) as r:
+                self.file_plan.update(json.load(r))
+
+        registered_groups = [file_info_group
+                             for file_info_group in file_info_groups
+                             if file_info_group.is_official and
+                             file_info_group.file_info_list]
+        unregistered_groups = [file_info_group
+                               for file_info_group in file_info_groups
+                               if not file_info_group.is_official]
+
+        mirror_pools = {self.mirror_pools[file_info_group.url_root]
+                        for file_info_group in file_info_groups
+                        if file_info_group.url_root in self.mirror_pools}
+        await asyncio.gather(*[mirror_pool.probe(self.client)
+                               for mirror_pool in mirror_pools
+                               if len(mirror_pool.roots) > 1])
+
+        progress = asyncio.ensure_future(self.report_download_progress())
+
+        try:
+            if registered_groups:
+                await self.download_registered(self.client, registered_groups)
+            if unregistered_groups:
+                await self.download_unregistered(self.client, unregistered_groups)
+        finally:
+            progress.cancel()
+
+    async def handle_delete(
+        self,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Main handler coroutine for the delete operation.
+
+        Expected behavior, per `FileInfoGroup` in the `file_info_groups` argument, is as
+        follows:
+        - If `FileInfoGroup` is official, then only erase files with listed paths in
+        `hashes.json`, and then remove their parent directories, from innermost to
+        outermost, if they happen to be empty.
+        - If `FileInfoGroup` is not official, but has hashes registered in the current
+        `hashes.json`, tree-remove the local root directory, and reset the size and path
+        entries in `hashes.json`.
+        - If `FileInfoGroup` is not official, and has no registered hashes in the
+        current `hashes.json`, tree-remove the local root directory.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode. Each
+            `FileInfoGroup` object can tell if they represent an official cache.
+        """
+        registered_groups = [file_info_group
+                             for file_info_group in file_info_groups
+                             if file_info_group.is_official]
+        unregistered_groups = [file_info_group
+                               for file_info_group in file_info_groups
+                               if not file_info_group.is_official]
+
+        if registered_groups:
+            await self.delete_registered(registered_groups)
+        if unregistered_groups:
+            await self.delete_unregistered(unregistered_groups)
+
+    async def handle_plan(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        plan_path: str = '',
+    ) -> None:
+        """
+        Main handler coroutine for the plan operation.
+
+        Decides what a download or fix operation would do for the registered files of
+        every `FileInfoGroup` in the `file_info_groups` argument, using only stat data
+        and the records in `hash_dict`, without reading or downloading any files. The
+        summary of each group is sent to the client in the `plan` field of its object in
+        `size_dict`, along with the intact and altered sizes that the stat data tells.
+        Unregistered files of unofficial groups cannot be known without crawling, and
+        are left out.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode.
+        `plan_path`: `str = ''`
+            The local path to save the plan to, so that a later download or fix
+            operation can reuse it through `--plan-file`. Not saved if empty.
+        """
+        saved_plan: VMDict = {}
+
+        for file_info_group in file_info_groups:
+            sizes = self.size_dict[file_info_group.version][file_info_group.mode]
+            file_plans = {file_info.relative_path(): self.plan_file(file_info)
+                          for file_info in file_info_group.file_info_list}
+
+            for file_plan_entry in file_plans.values():
+                if file_plan_entry['state'] == 'intact':
+                    sizes['intact'] += file_plan_entry['size']
+                elif file_plan_entry['state'] == 'altered':
+                    sizes['altered'] += file_plan_entry['size']
+
+            sizes['plan'] = self.summarize_plan(file_info_group, file_plans)
+
+            saved_plan.setdefault(file_info_group.version, {})[file_info_group.mode] = {
+                'summary': sizes['plan'],
+                'files': {
+                    rel_path: {key: file_plan_entry[key]
+                               for key in ['state', 'size', 'mtime']}
+                    for rel_path, file_plan_entry in file_plans.items()
+                },
+            }
+
+            self.report_progress()
+
+        if plan_path:
+            with open(plan_path, 'w') as w:
+                json.dump(saved_plan, w, indent=4)
+
+    async def handle_gc(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        reclaim: bool = False,
+    ) -> None:
+        """
+        Main handler coroutine for the gc operation.
+
+        Scans both cache roots once, and classifies every file in them as follows:
+        - Files in the directories of the `FileInfoGroup` objects in the
+        `file_info_groups` argument are either registered, partial downloads, orphans
+        (for official offline caches only), or unregistered files that are kept.
+        - Registered files with the same contents as another registered file on the same
+        file system are duplicates.
+        - A `FusionFall` directory in the playable root is an orphan as a whole only if
+        `.lastver` names a cache version that is not in `hash_dict`. If `.lastver` is
+        missing or empty, the directory might still be the live cache of the game, so
+        it is unknown.
+        - Other directories in the roots that belong to no cache version in `hash_dict`
+        are unknown. The playable root is shared with every other Unity Web Player
+        game, and the offline root can be any directory, so these were not necessarily
+        created by the client.
+
+        The classification is sent to the client in the `gc` field of the objects in
+        `size_dict`, where orphan and unknown directories get an object of their own.
+        The intact and altered sizes of the cache collections are the ones that the
+        stat data tells, like in a plan, since no file is read.
+        If asked to reclaim space, partial downloads and orphans are removed in
+        parallel. Duplicates are only reported, since linking them would make writes
+        into one of the files change the other, and unknown directories are only
+        reported as well. Directories of known cache versions that are not in
+        `file_info_groups` are left alone, since they might be in use.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode.
+        `reclaim`: `bool = False`
+            Whether to reclaim space, rather than only reporting what could be
+            reclaimed.
+        """
+        loop = asyncio.get_running_loop()
+        roots = [(root, cache_mode)
+                 for root, cache_mode in [(self.playable_root, 'playable'),
+                                          (self.offline_root, 'offline')]
+                 if root and Path(root).is_dir()]
+
+        record_path = Path(self.user_dir) / '.lastver'
+        last_version = (
+            record_path.read_text(encoding='utf-8').strip()
+            if record_path.is_file() else
+            ''
+        )
+
+        fusionfall_dir = Path(self.playable_root) / 'FusionFall'
+        known_dirs = {Path(root) / version_name
+                      for root, _ in roots
+                      for version_name in self.hash_dict}
+        if last_version in self.hash_dict:
+            known_dirs.add(fusionfall_dir)
+
+        group_dirs = {file_info_group.local_root: file_info_group
+                      for file_info_group in file_info_groups}
+        stray_dirs = [(entry, cache_mode)
+                      for root, cache_mode in roots
+                      for entry in Path(root).iterdir()
+                      if entry.is_dir() and entry not in known_dirs]
+
+        # only a swap directory left behind by a removed version is certain to be ours
+        orphan_dirs = [(stray_dir, cache_mode)
+                       for stray_dir, cache_mode in stray_dirs
+                       if stray_dir == fusionfall_dir and last_version]
+        unknown_dirs = [(stray_dir, cache_mode)
+                        for stray_dir, cache_mode in stray_dirs
+                        if (stray_dir, cache_mode) not in orphan_dirs]
+
+        # scan every directory at once
+        group_scans = await asyncio.gather(*[
+            loop.run_in_executor(
+                None, scan_collection_dir, collection_dir,
+                set(self.hash_dict[file_info_group.version][file_info_group.mode]),
+                file_info_group.is_official and file_info_group.mode == 'offline')
+            for collection_dir, file_info_group in group_dirs.items()
+        ])
+        orphan_scans = await asyncio.gather(*[
+            loop.run_in_executor(None, scan_orphan_dir, orphan_dir)
+            for orphan_dir, _ in orphan_dirs
+        ])
+        unknown_scans = await asyncio.gather(*[
+            loop.run_in_executor(None, scan_orphan_dir, unknown_dir)
+            for unknown_dir, _ in unknown_dirs
+        ])
+        duplicates = self.find_duplicates(file_info_groups)
+
+        for file_info_group in file_info_groups:
+            sizes = self.size_dict[file_info_group.version][file_info_group.mode]
+
+            for file_info in file_info_group.file_info_list:
+                file_plan_entry = self.plan_file(file_info)
+                if file_plan_entry['state'] in ['intact', 'altered']:
+                    sizes[file_plan_entry['state']] += file_plan_entry['size']
+
+        removals: List[Path] = []
+
+        def report(version_name: str, cache_mode: str) -> Dict[str, Any]:
+            self.claim_collection(version_name, cache_mode)
+            sizes = self.size_dict.setdefault(version_name, {}).setdefault(cache_mode, {
+                'intact': 0,
+                'altered': 0,
+                'total': 0,
+            })
+            return sizes.setdefault('gc', {
+                file_class + suffix: 0
+                for file_class in ['registered', 'partial', 'orphan', 'unregistered',
+                                   'duplicate', 'unknown']
+                for suffix in ['_files', '_size']
+            })
+
+        for file_info_group, classes in zip(group_dirs.values(), group_scans):
+            gc_report = report(file_info_group.version, file_info_group.mode)
+
+            for file_class, files in classes.items():
+                gc_report[file_class + '_files'] += len(files)
+                gc_report[file_class + '_size'] += sum(size for _, size in files)
+
+                if file_class in ['partial', 'orphan']:
+                    removals.extend(file_path for file_path, _ in files)
+
+        for (orphan_dir, cache_mode), files in zip(orphan_dirs, orphan_scans):
+            gc_report = report(orphan_dir.name, cache_mode)
+            gc_report['orphan_files'] += len(files)
+            gc_report['orphan_size'] += sum(size for _, size in files)
+            removals.append(orphan_dir)
+
+        for (unknown_dir, cache_mode), files in zip(unknown_dirs, unknown_scans):
+            gc_report = report(unknown_dir.name, cache_mode)
+            gc_report['unknown_files'] += len(files)
+            gc_report['unknown_size'] += sum(size for _, size in files)
+
+        for file_info, _ in duplicates:
+            gc_report = report(file_info.version, file_info.mode)
+            gc_report['duplicate_files'] += 1
+            gc_report['duplicate_size'] += file_info.current_local_path.stat().st_size
+
+        self.report_progress()
+
+        if not reclaim:
+            return
+
+        await asyncio.gather(*[loop.run_in_executor(None, remove_path, path)
+                               for path in removals])
+
+        for collection_dir in group_dirs:
+            await loop.run_in_executor(None, remove_empty_dirs, collection_dir)
+
+        for version_sizes in self.size_dict.values():
+            for sizes in version_sizes.values():
+                if 'gc' in sizes:
+                    sizes['gc']['reclaimed_size'] = sum(
+                        sizes['gc'][file_class + '_size']
+                        for file_class in ['partial', 'orphan'])
+
+        self.report_progress()
+
+    async def handle_serve(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        host: str = '0.0.0.0',
+        port: int = 8080,
+        max_connections: int = 16,
+    ) -> None:
+        """
+        Main handler coroutine for the serve operation.
+
+        Hash checks the registered files of every `FileInfoGroup` in the
+        `file_info_groups` argument, and then serves the intact ones over HTTP, under an
+        NGINX-like directory structure with one directory per cache version, until the
+        operation is cancelled. Another client can then use
+        `http://<host>:<port>/<version>/` as the URL of a version, or
+        `http://<host>:<port>` as its CDN root.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode.
+        `host`: `str = '0.0.0.0'`
+            The address to listen on.
+        `port`: `int = 8080`
+            The port to listen on.
+        `max_connections`: `int = 16`
+            The maximum number of requests that are answered at once.
+        """
+        serve_tree = await self.build_serve_tree(file_info_groups)
+        semaphore = asyncio.Semaphore(max_connections)
+
+        server = await asyncio.start_server(
+            lambda r, w: self.handle_serve_connection(r, w, serve_tree, semaphore),
+            host, port)
+
+        try:
+            await server.serve_forever()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    async def handle_export(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        archive_path: str = '',
+    ) -> None:
+        """
+        Main handler coroutine for the export operation.
+
+        Hash checks the registered files of every `FileInfoGroup` in the
+        `file_info_groups` argument, and then streams the intact ones into a single tar
+        archive, after a manifest that lists their sizes and hashes. Sends updates to
+        the client for each group while hash checking.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode.
+        `archive_path`: `str = ''`
+            The local path to write the archive to. Overwritten if it exists.
+        """
+        manifest: VMDict = {}
+        intact_file_infos = []
+
+        for file_info_group in file_info_groups:
+            version, mode = file_info_group.version, file_info_group.mode
+            version_manifest = manifest.setdefault(version, {})
+            version_manifest.setdefault(mode + '_size', 0)
+            version_manifest.setdefault(mode, {})
+
+            for file_info in file_info_group.file_info_list:
+                if not (await self.check_file_hash_and_update(file_info)):
+                    continue
+
+                file_size = file_info.current_local_path.stat().st_size
+                version_manifest[mode + '_size'] += file_size
+                version_manifest[mode][file_info.relative_path()] = file_info.sha256
+                intact_file_infos.append(file_info)
+
+            self.report_progress()
+
+        manifest_data = json.dumps(manifest, indent=4).encode('utf-8')
+        manifest_member = tarfile.TarInfo(ARCHIVE_MANIFEST)
+        manifest_member.size = len(manifest_data)
+        manifest_member.mtime = int(time.time())
+
+        # written to a partial path first, so that a cancelled export leaves no archive
+        part_path = partial_path(Path(archive_path))
+
+        with tarfile.open(part_path, mode='w|') as archive:
+            archive.addfile(manifest_member, io.BytesIO(manifest_data))
+
+            for file_info in intact_file_infos:
+                await add_archive_member(archive, file_info)
+                await self.wait_if_paused()
+
+        os.replace(part_path, archive_path)
+
+    async def handle_import(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        archive_path: str = '',
+    ) -> None:
+        """
+        Main handler coroutine for the import operation.
+
+        Streams the files of a tar archive written by the export operation into the
+        cache collections of the `FileInfoGroup` objects in the `file_info_groups`
+        argument, hashing them on the fly, without staging the archive. Unofficial cache
+        collections with no registered hashes adopt the hashes in the manifest of the
+        archive, while others only accept archived files that match their registered
+        hashes. Registered files that are not in the archive are hash checked in place.
+        Sends updates to the client for each file.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode.
+        `archive_path`: `str = ''`
+            The local path of the archive to read.
+        """
+        loop = asyncio.get_running_loop()
+
+        with tarfile.open(archive_path, mode='r|') as archive:
+            member = await loop.run_in_executor(None, archive.next)
+            if not member or member.name != ARCHIVE_MANIFEST:
+                raise ValueError(f'{archive_path} is not a version pack archive.')
+
+            manifest = json.load(archive.extractfile(member))
+            targets, unsized_collections = self.adopt_archive_manifest(
+                manifest, file_info_groups)
+            extracted_sizes: Dict[Tuple[str, str], int] = {}
+
+            while True:
+                member = await loop.run_in_executor(None, archive.next)
+                if not member:
+                    break
+
+                file_info = targets.get(member.name)
+                if not file_info or not member.isfile():
+                    continue
+
+                if await self.extract_archive_member(archive, member, file_info):
+                    del targets[member.name]
+                    sizes = self.size_dict[file_info.version][file_info.mode]
+                    sizes['intact'] += member.size
+                    collection = (file_info.version, file_info.mode)
+                    extracted_sizes[collection] = (
+                        extracted_sizes.get(collection, 0) + member.size)
+                    self.report_progress()
+
+        for version, mode in unsized_collections:
+            extracted_size = extracted_sizes.get((version, mode), 0)
+            self.hash_dict[version][mode + '_size'] = extracted_size
+            self.size_dict[version][mode]['total'] = extracted_size
+
+        for file_info in targets.values():
+            if file_info.current_local_path.is_file():
+                await self.check_file_hash_and_update(file_info)
+
+        self.report_progress()
+
+    async def handle_watch(
+        self,
+        file_info_groups: List[FileInfoGroup],
+        polling: bool = False,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        settle_delay: float = WATCH_SETTLE_DELAY,
+    ) -> None:
+        """
+        Main handler coroutine for the watch operation.
+
+        Checks every `FileInfoGroup` in the `file_info_groups` argument once, like a
+        hash check that trusts file stats, and then watches their files until the
+        operation is cancelled. Files that change, whether the game, the user or
+        another operation changes them, are marked as dirty, and once no more changes
+        come in for `settle_delay` seconds, only the dirty files are checked again,
+        and the changed objects of `size_dict` are reported.
+
+        Changes are noticed through filesystem notifications if `watchdog` is
+        installed, and by comparing file stats every `poll_interval` seconds
+        otherwise. See `check_watched_changes` for how the cache collections are
+        shared with other operations.
+
+        Parameters
+        ----------
+        `file_info_groups`: `List[FileInfoGroup]`
+            The objects that logically separate cache collections and their registered
+            files under different criteria, such as cache version and cache mode.
+        `polling`: `bool = False`
+            Whether to poll for changes even if filesystem notifications are available,
+            like for network drives that do not send them.
+        `poll_interval`: `float = WATCH_POLL_INTERVAL`
+            The number of seconds between checks, if changes are polled for.
+        `settle_delay`: `float = WATCH_SETTLE_DELAY`
+            The number of seconds without changes to wait for before checking files.
+        """
+        dirty_paths: Set[Path] = set()
+        changed = asyncio.Event()
+        collection_dirs: Dict[Tuple[str, str], Path] = {}
+        file_states: Dict[Tuple[str, str], Dict[str, Tuple[int, bool]]] = {}
+
+        def paths_changed(paths: List[Path]) -> None:
+            dirty_paths.update(paths)
+            changed.set()
+
+        observer = (
+            None
+            if polling else
+            self.start_observer(file_info_groups, paths_changed)
+        )
+        poller = (
+            asyncio.ensure_future(
+                self.poll_changes(file_info_groups, paths_changed, poll_interval))
+            if observer is None else
+            None
+        )
+
+        # the client shows this in its console, to tell why changes might come in late
+        print('Watching for changes with ' + (
+            'filesystem notifications'
+            if observer else
+            f'stat checks every {poll_interval} seconds'
+        ), file=sys.stderr, flush=True)
+
+        try:
+            while True:
+                changed_paths = set(dirty_paths)
+                dirty_paths.clear()
+
+                checked_groups = await self.check_watched_changes(
+                    file_info_groups, changed_paths, collection_dirs, file_states)
+
+                if checked_groups:
+                    self.write_size_snapshot('watch', checked_groups)
+                    self.report_progress()
+
+                # wait for a change, and then for the changes to stop coming in
+                await changed.wait()
+                while changed.is_set():
+                    changed.clear()
+                    await asyncio.sleep(settle_delay)
+        finally:
+            if poller:
+                poller.cancel()
+
+            if observer:
+                observer.stop()
+                await asyncio.get_running_loop().run_in_executor(None, observer.join)
+
+    # State Helpers
+
+    def build_priority_list(
+        self,
+        priorities: Dict[str, List[str]],
+        cache_version: str,
+    ) -> List[str]:
+        """
+        Constructs the ordered list of relative paths that make a cache version
+        minimally playable. The paths listed for the version in the priority file come
+        first (or the `default` list, if the version has none), followed by the first
+        `OBSERVED_PRIORITY_COUNT` files the game was observed to access in the playable
+        cache, in the order they were accessed. A cache that has been played for a
+        while holds most of its files, so the rest of them do not tell what is needed
+        to start playing.
+
+        Parameters
+        ----------
+        `priorities`: `Dict[str, List[str]]`
+            The contents of the priority file, mapping cache version names to ordered
+            lists of relative paths.
+        `cache_version`: `str`
+            The name of the cache version to construct the list for.
+
+        Returns
+        -------
+        A list of unique relative paths, in download order. Some paths might not be
+        registered for the cache version.
+        """
+        explicit_list = priorities.get(cache_version, priorities.get('default', []))
+        observed_list = observed_access_order(
+            swapped_path(self.playable_root, self.user_dir, cache_version, 'playable'))
+
+        return list(dict.fromkeys(explicit_list +
+                                  observed_list[:OBSERVED_PRIORITY_COUNT]))
+
+    def decide_collections(
+        self,
+        cache_version: str,
+        cache_mode: str,
+        saved_hash_dict: VMDict,
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Decides on the cache versions and cache modes that an operation will operate on.
+
+        Parameters
+        ----------
+        `cache_version`: `str`
+            The name of the cache version to operate on, or `all` for every cache
+            version in `versions.json` and `hashes.json`.
+        `cache_mode`: `str`
+            The cache mode to operate on, or `all` for both.
+        `saved_hash_dict`: `VMDict`
+            The contents of `hashes.json`.
+
+        Returns
+        -------
+        A `Tuple` of the names of the cache versions, and the cache modes.
+        """
+        cache_modes = (
+            ['offline', 'playable']
+            if cache_mode == 'all' else
+            [cache_mode]
+        )
+
+        if cache_version != 'all':
+            return [cache_version], cache_modes
+
+        with open(Path(self.user_dir) / 'versions.json') as r:
+            versions = json.load(r)['versions']
+
+        cache_versions = list(dict.fromkeys(
+            list(saved_hash_dict) + [version['name'] for version in versions]))
+
+        return cache_versions, cache_modes
+
+    async def manage_initial_file_states(
+        self,
+        held_locks: List[Any],
+        cache_version: str,
+        cache_mode: str,
+        cdn_root: str,
+        prioritize: bool = False,
+    ) -> List[FileInfoGroup]:
+        """
+        Manages the initial states of `size_dict`, `hash_dict`, and constructs
+        `FileInfoGroup` objects that correspond to the different cache collections that
+        an operation will operate on. Triggers a save of the updated `hash_dict` when
+        the operation completes if the current `versions.json` file has versions that
+        are not present in the current `hashes.json`, among the ones that the operation
+        will operate on.
+
+        Waits for other operations and runs of this script to release the cache
+        collections the operation will operate on, and locks them. The entries of these
+        cache collections in `hash_dict` are then reloaded from `hashes.json`, since
+        whoever held them last might have updated them.
+
+        Parameters
+        ----------
+        `held_locks`: `List[Any]`
+            The list to add the open lock files to, to be released by the caller.
+        `cache_version`: `str`
+            The name of the cache version to operate on, or `all`.
+        `cache_mode`: `str`
+            The cache mode to operate on, or `all`.
+        `cdn_root`: `str`
+            The URL of the cache version, or the URL that holds every cache version by
+            name if `cache_version` is `all`.
+        `prioritize`: `bool = False`
+            Whether to construct the download priorities of the cache collections, if
+            `download_order` asks for them. Only downloads use them.
+
+        Returns
+        -------
+        A list of `FileInfoGroup` objects that correspond to the different cache
+        collections that the operation will operate on.
+        """
+        prioritize = prioritize and self.download_order == 'priority'
+
+        with open(Path(self.user_dir) / 'versions.json') as r:
+            versions = json.load(r)['versions']
+
+        version_mirrors = {version['name']: version.get('mirrors', [])
+                           for version in versions}
+
+        # decide on operating cache modes and versions
+        cache_versions, cache_modes = self.decide_collections(
+            cache_version, cache_mode, self.read_hash_file())
+
+        # manage `hash_dict` state, as other operations and runs left it
+        await self.acquire_collection_locks(held_locks, cache_versions, cache_modes)
+        self.reload_collection_records(
+            list(itertools.product(cache_versions, cache_modes)))
+
+        for version in versions:
+            if version['name'] not in self.hash_dict:
+                self.hash_dict[version['name']] = {
+                    'playable_size': 0,
+                    'offline_size': 0,
+                    'playable': {},
+                    'offline': {},
+                }
+
+                if version['name'] in cache_versions:
+                    self.hash_dict_updated.update((version['name'], mode)
+                                                  for mode in cache_modes)
+
+        for version_name in self.hash_dict:
+            for mode in ['playable', 'offline']:
+                for suffix in RECORD_SUFFIXES:
+                    self.hash_dict[version_name].setdefault(mode + suffix, {})
+
+        # load download priorities, if asked to
+        priorities = {}
+        if (
+            prioritize and
+            self.priority_file and
+            Path(self.priority_file).is_file()
+        ):
+            with open(self.priority_file) as r:
+                priorities = json.load(r)
+
+        # construct file info groups
+        file_info_groups = []
+
+        for version_name in cache_versions:
+            for mode in cache_modes:
+                # gather base information
+                local_root = (
+                    self.offline_root if mode == 'offline' else self.playable_root
+                )
+                local_dir = swapped_path(
+                    local_root, self.user_dir, version_name, mode)
+                url_dir = (
+                    cdn_root.rstrip('/') + '/' + version_name.lstrip('/')
+                    if cache_version == 'all' else
+                    cdn_root
+                )
+
+                # manage `mirror_pools` state, keeping what earlier operations learned
+                if url_dir.startswith('http') and url_dir not in self.mirror_pools:
+                    self.mirror_pools[url_dir] = MirrorPool(
+                        [url_dir] + version_mirrors.get(version_name, []))
+
+                # construct base file info
+                file_info_version = FileInfo(
+                    version=version_name,
+                    mode=mode,
+                    local_root=local_dir,
+                    url_root=url_dir,
+                    current_local_path=local_dir,
+                    current_url=url_dir,
+                    sha256='',
+                )
+
+                # manage `size_dict` state
+                if version_name not in self.size_dict:
+                    self.size_dict[version_name] = {}
+
+                self.size_dict[version_name][mode] = {
+                    'intact': 0,
+                    'altered': 0,
+                    'total': self.hash_dict[version_name][mode + '_size'],
+                }
+
+                # construct file info list by resolving from the base file info
+                file_info_list = [
+                    file_info_version.resolve(rel_path, sha256=file_hash)
+                    for rel_path, file_hash
+                    in self.hash_dict[version_name][mode].items()
+                ]
+
+                # construct the download priorities, if asked to
+                priority_list = (
+                    self.build_priority_list(priorities, version_name)
+                    if prioritize else
+                    []
+                )
+
+                # construct and append file info group
+                file_info_groups.append(FileInfoGroup(
+                    version=version_name,
+                    mode=mode,
+                    is_official=(version_name in self.official_caches),
+                    local_root=local_dir,
+                    url_root=url_dir,
+                    file_info_list=file_info_list,
+                    priority_list=priority_list,
+                ))
+
+        return file_info_groups
+
+    def write_hash_updates(self) -> None:
+        """
+        If `hash_dict` has been updated since the last call, merges the updated cache
+        collections of `hash_dict` into `hashes.json`, sorting paths and hashes if
+        necessary. The entries of other cache collections are kept as they are in
+        `hashes.json`, since other runs of this script might have updated them.
+        """
+        if not self.hash_dict_updated:
+            return
+
+        hash_path = Path(self.user_dir) / 'hashes.json'
+        manifest_lock = acquire_lock_file(Path(self.user_dir) / 'hashes.json.lock')
+
+        try:
+            with open(hash_path) as r:
+                saved_hash_dict = json.load(r)
+
+            for version_name, cache_mode in sorted(self.hash_dict_updated):
+                for suffix in RECORD_SUFFIXES:
+                    self.hash_dict[version_name][cache_mode + suffix] = dict(sorted(
+                        self.hash_dict[version_name][cache_mode + suffix].items()))
+
+                if version_name not in self.official_caches:
+                    self.hash_dict[version_name][cache_mode] = dict(sorted(
+                        self.hash_dict[version_name][cache_mode].items()))
+
+                if version_name not in saved_hash_dict:
+                    saved_hash_dict[version_name] = self.hash_dict[version_name]
+                    continue
+
+                for key in [cache_mode + '_size', cache_mode] + [
+                    cache_mode + suffix for suffix in RECORD_SUFFIXES
+                ]:
+                    saved_hash_dict[version_name][key] = (
+                        self.hash_dict[version_name][key])
+
+            # replace the file at once, so that it is never seen half-written
+            temp_path = hash_path.with_name(hash_path.name + '.tmp')
+            with open(temp_path, 'w') as w:
+                json.dump(saved_hash_dict, w, indent=4)
+            os.replace(temp_path, hash_path)
+
+            self.hash_dict_updated.clear()
+        finally:
+            release_lock_file(manifest_lock)
+
+    def write_throughput(self) -> None:
+        """
+        If enough was downloaded since the last call to measure the download
+        throughput, blends it into the throughput saved in `throughput.json`, which is
+        used to estimate download times.
+        """
+        rate = self.transfer_meter.rate()
+        if rate <= 0:
+            return
+
+        self.recent_throughput = (
+            0.7 * self.recent_throughput + 0.3 * rate
+            if self.recent_throughput > 0 else
+            rate
+        )
+        self.transfer_meter = TransferMeter()
+
+        with open(Path(self.user_dir) / 'throughput.json', 'w') as w:
+            json.dump({'bytes_per_second': round(self.recent_throughput)}, w, indent=4)
+
+    def read_size_snapshot(self) -> VMDict:
+        """
+        Reads the sizes saved by earlier operations from `sizes.json`.
+
+        Returns
+        -------
+        A `dict` in the same layout as `size_dict`, whose objects have the sizes under
+        `sizes`, and the time they were saved at under `timestamp`. Empty if there are
+        no saved sizes.
+        """
+        snapshot_path = Path(self.user_dir) / 'sizes.json'
+        if not snapshot_path.is_file():
+            return {}
+
+        manifest_lock = acquire_lock_file(Path(self.user_dir) / 'hashes.json.lock')
+
+        try:
+            with open(snapshot_path) as r:
+                return json.load(r)
+        except ValueError:
+            return {}
+        finally:
+            release_lock_file(manifest_lock)
+
+    def read_provisional_sizes(self, cache_version: str, cache_mode: str) -> VMDict:
+        """
+        Finds the sizes saved by earlier operations for the described cache
+        collections, if they still have the total size registered in `hashes.json`.
+        Does not wait for the cache collections to be released by other operations, so
+        that their sizes can be reported in the meantime.
+
+        Parameters
+        ----------
+        `cache_version`: `str`
+            The name of the cache version an operation is about to operate on, or
+            `all`.
+        `cache_mode`: `str`
+            The cache mode an operation is about to operate on, or `all`.
+
+        Returns
+        -------
+        The saved objects, in the same layout as `size_dict`, marked with a
+        `provisional` flag and the `timestamp` they were saved at.
+        """
+        snapshot = self.read_size_snapshot()
+        if not snapshot:
+            return {}
+
+        saved_hash_dict = self.read_hash_file()
+        cache_versions, cache_modes = self.decide_collections(
+            cache_version, cache_mode, saved_hash_dict)
+        provisional: VMDict = {}
+
+        for version_name, mode in itertools.product(cache_versions, cache_modes):
+            total = saved_hash_dict.get(version_name, {}).get(mode + '_size', 0)
+
+            entry = snapshot.get(version_name, {}).get(mode)
+            if not entry or entry['sizes'].get('total') != total:
+                continue
+
+            provisional.setdefault(version_name, {})[mode] = dict(
+                entry['sizes'], provisional=True, timestamp=entry['timestamp'])
+
+        return provisional
+
+    def write_size_snapshot(
+        self,
+        operation: str,
+        file_info_groups: List[FileInfoGroup],
+    ) -> None:
+        """
+        Merges the final sizes of the cache collections an operation operated on into
+        `sizes.json`, along with the current time, so that later operations can report
+        them before they are done. Also called for cancelled operations. Operations
+        that do not verify every file, like plan and gc, leave the snapshot alone.
+
+        Parameters
+        ----------
+        `operation`: `str`
+            The operation that completed or was cancelled.
+        `file_info_groups`: `List[FileInfoGroup]`
+            The cache collections the operation operated on, or an empty list if it was
+            cancelled before it locked them.
+        """
+        if operation in ['plan', 'gc']:
+            return
+
+        snapshot_path = Path(self.user_dir) / 'sizes.json'
+        manifest_lock = acquire_lock_file(Path(self.user_dir) / 'hashes.json.lock')
+
+        try:
+            snapshot = {}
+            if snapshot_path.is_file():
+                try:
+                    with open(snapshot_path) as r:
+                        snapshot = json.load(r)
+                except ValueError:
+                    pass
+
+            for file_info_group in file_info_groups:
+                version_name, cache_mode = file_info_group.version, file_info_group.mode
+                sizes = self.size_dict[version_name][cache_mode]
+                snapshot.setdefault(version_name, {})[cache_mode] = {
+                    'timestamp': time.time(),
+                    'sizes': {key: sizes[key] for key in SNAPSHOT_KEYS if key in sizes},
+                }
+
+            temp_path = snapshot_path.with_name(snapshot_path.name + '.tmp')
+            with open(temp_path, 'w') as w:
+                json.dump(snapshot, w, indent=4)
+            os.replace(temp_path, snapshot_path)
+        finally:
+            release_lock_file(manifest_lock)
+
+
+# IPC
+
+
+async def receive_commands(
+    reader: asyncio.StreamReader,
+    manager: CacheManager,
+) -> None:
     """
-    If the `hash_dict` has been updated during the run of this script, saves the
-    current `hash_dict` into `hashes.json`, sorting paths and hashes if necessary.
+    Listens for commands from the client, one per line, until the connection closes.
+    `pause`, `resume` and `cancel` are passed on to the given `CacheManager`. Whatever
+    a cancelled operation has completed so far is kept.
 
     Parameters
     ----------
-    `args`: `Namespace`
-        The arguments given to this script at startup.
+    `reader`: `asyncio.StreamReader`
+        The reader object that connects to the localhost port listened to by the
+        client.
+    `manager`: `CacheManager`
+        The manager that runs the operation.
+    """
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+
+        command = line.decode('utf-8').strip()
+
+        if command == 'pause':
+            manager.pause()
+        elif command == 'resume':
+            manager.resume()
+        elif command == 'cancel':
+            manager.cancel()
+
+
+async def send_message(
+    writer: Optional[asyncio.StreamWriter],
+    changes: VMDict,
+) -> None:
     """
-    if not hash_dict_updated:
+    Sends an update of the objects of `size_dict` that changed over to the client, in
+    the same layout as `size_dict`.
+
+    Parameters
+    ----------
+    `writer`: `Optional[asyncio.StreamWriter]`
+        The writer object that connects to the localhost port listened to by the
+        client, or `None` if this script runs without a client.
+    `changes`: `VMDict`
+        The changed objects of `size_dict`.
+    """
+    if writer is None:
         return
 
-    for version_name in hash_dict:
-        if version_name in args.official_caches:
-            continue
+    message = (json.dumps(changes) + '\n').encode('utf-8')
+    writer.write(message)
+    await writer.drain()
 
-        for cache_mode in ['playable', 'offline']:
-            hash_dict[version_name][cache_mode] = dict(sorted(
-                hash_dict[version_name][cache_mode].items()))
 
-    with open(Path(args.user_dir) / 'hashes.json', 'w') as w:
-        json.dump(hash_dict, w, indent=4)
+# Main & Helpers
 
 
 async def prep_and_run_coroutine(args: Namespace) -> None:
     """
-    Main handler of the program. Takes the script's arguments, runs the script and
-    manages the necessary state and connections.
+    Main handler of the program. Takes the script's arguments, runs the operation on a
+    `CacheManager` and relays its progress and the commands of the client.
 
     Parameters
     ----------
     `args`: `Namespace`
         The arguments given to this script at startup.
     """
-    file_info_groups = manage_initial_file_states(args)
+    if args.process_priority == 'low':
+        lower_process_priority()
+
+    options = {
+        'download': {'plan_path': args.plan_file},
+        'fix': {'plan_path': args.plan_file},
+        'plan': {'plan_path': args.plan_file},
+        'gc': {'reclaim': args.gc_reclaim},
+        'serve': {'host': args.serve_host,
+                  'port': args.serve_port,
+                  'max_connections': args.serve_connections},
+        'export': {'archive_path': args.archive_path},
+        'import': {'archive_path': args.archive_path},
+        'watch': {'polling': args.watch_polling,
+                  'poll_interval': args.watch_poll_interval},
+    }
 
-    _, writer = await asyncio.open_connection('localhost', args.port)
+    manager = CacheManager(
+        user_dir=args.user_dir,
+        playable_root=args.playable_root,
+        offline_root=args.offline_root,
+        official_caches=args.official_caches,
+        download_order=args.download_order,
+        priority_file=args.priority_file,
+        bandwidth_limit=args.bandwidth_limit,
+        connection_bandwidth_limit=args.connection_bandwidth_limit,
+        verify_tier=args.verify_tier,
+        keepalive_connections=args.keepalive_connections,
+        keepalive_expiry=args.keepalive_expiry,
+        http2=args.http2,
+        warm_connections=args.warm_connections,
+    )
 
-    coroutines = {
-        'hash-check': hash_check,
-        'download': download,
-        'fix': download,
-        'delete': delete,
-    }
+    async with manager:
+        # without a client to report to, run silently
+        reader, writer = (
+            await asyncio.open_connection('localhost', args.port)
+            if args.port else
+            (None, None)
+        )
 
-    # always send a message no matter what so that the client doesn't get stuck
-    try:
-        await coroutines[args.operation](writer, file_info_groups)
-    finally:
-        await send_message(writer)
+        commands = asyncio.ensure_future(
+            receive_commands(reader, manager) if reader else asyncio.sleep(0))
 
-    writer.close()
-    await writer.wait_closed()
+        # nobody is left to report changes to once the client goes away
+        if args.operation == 'watch' and reader:
+            commands.add_done_callback(lambda _: manager.cancel())
+
+        try:
+            async for changes in manager.run(args.operation,
+                                             args.cache_version,
+                                             args.cache_mode,
+                                             args.cdn_root,
+                                             **options.get(args.operation, {})):
+                await send_message(writer, changes)
+        finally:
+            commands.cancel()
 
-    write_hash_updates(args)
+            if writer:
+                writer.close()
+                await writer.wait_closed()
 
 
 def parse_args() -> Namespace:
@@ -1092,16 +5504,39 @@ def parse_args() -> Namespace:
     A `Namespace` object that contains the below arguments.
     """
     parser = ArgumentParser('Python executable for tasks relating to OpenFusionClient.')
-    parser.add_argument('--operation', type=str, required=True, choices=['hash-check', 'download', 'delete'])
+    parser.add_argument('--operation', type=str, required=True, choices=['hash-check', 'download', 'fix', 'delete', 'plan', 'gc', 'serve', 'export', 'import', 'watch'])
     parser.add_argument('--playable-root', dest='playable_root', type=str)
     parser.add_argument('--offline-root', dest='offline_root', type=str)
     parser.add_argument('--user-dir', dest='user_dir', type=str, required=True)
-    parser.add_argument('--cdn-root', dest='cdn_root', type=str, default='http://cdn.dexlabs.systems/ff/big')
+    parser.add_argument('--cdn-root', dest='cdn_root', type=str, default=DEFAULT_CDN_ROOT)
     parser.add_argument('--cache-mode', dest='cache_mode', type=str, default='all', choices=['all', 'offline', 'playable'])
     parser.add_argument('--cache-version', dest='cache_version', type=str, default='all')
-    parser.add_argument('--port', type=str, required=True)
+    parser.add_argument('--port', type=str)
     parser.add_argument('--official-caches', dest='official_caches', nargs='*', type=str, default=[])
-    return parser.parse_args()
+    parser.add_argument('--download-order', dest='download_order', type=str, default='random', choices=['random', 'priority'])
+    parser.add_argument('--priority-file', dest='priority_file', type=str)
+    parser.add_argument('--bandwidth-limit', dest='bandwidth_limit', type=float, default=0, help='KiB/s, 0 for unlimited')
+    parser.add_argument('--connection-bandwidth-limit', dest='connection_bandwidth_limit', type=float, default=0, help='KiB/s, 0 for unlimited')
+    parser.add_argument('--verify-tier', dest='verify_tier', type=str, default='full', choices=['stat', 'sampled', 'digest', 'full'])
+    parser.add_argument('--plan-file', dest='plan_file', type=str)
+    parser.add_argument('--gc-reclaim', dest='gc_reclaim', action='store_true')
+    parser.add_argument('--archive-path', dest='archive_path', type=str)
+    parser.add_argument('--serve-host', dest='serve_host', type=str, default='0.0.0.0')
+    parser.add_argument('--serve-port', dest='serve_port', type=int, default=8080)
+    parser.add_argument('--serve-connections', dest='serve_connections', type=int, default=16)
+    parser.add_argument('--watch-polling', dest='watch_polling', action='store_true')
+    parser.add_argument('--watch-poll-interval', dest='watch_poll_interval', type=float, default=WATCH_POLL_INTERVAL, help='seconds')
+    parser.add_argument('--http2', dest='http2', action='store_true')
+    parser.add_argument('--keepalive-connections', dest='keepalive_connections', type=int, default=20)
+    parser.add_argument('--keepalive-expiry', dest='keepalive_expiry', type=float, default=KEEPALIVE_EXPIRY, help='seconds')
+    parser.add_argument('--warm-connections', dest='warm_connections', type=int, default=WARM_CONNECTIONS, help='per host, 0 to disable')
+    parser.add_argument('--process-priority', dest='process_priority', type=str, default='normal', choices=['normal', 'low'])
+    args = parser.parse_args()
+
+    if args.operation in ['export', 'import'] and not args.archive_path:
+        parser.error(f'--archive-path is required for the {args.operation} operation')
+
+    return args
 
 
 if __name__ == '__main__':
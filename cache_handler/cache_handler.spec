@@ -7,7 +7,9 @@ a = Analysis(['cache_handler.py'],
              pathex=['Z:\\src'],
              binaries=[],
              datas=[],
-             hiddenimports=[],
+             hiddenimports=['watchdog.observers.read_directory_changes',
+                            'watchdog.observers.winapi',
+                            'watchdog.observers.polling'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
@@ -0,0 +1,363 @@
+import io
+import os
+import json
+import asyncio
+import tarfile
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from cache_handler import (
+    ARCHIVE_MANIFEST,
+    OBSERVED_PRIORITY_COUNT,
+    RETRY_MAX_DELAY,
+    CacheManager,
+    CircuitOpenError,
+    VMDict,
+    acquire_lock_file,
+    is_permanent_error,
+    is_safe_member_path,
+    parse_range,
+    release_lock_file,
+    retry_delay,
+)
+
+
+# Helpers
+
+
+def make_user_dir(tmp_path: Path, version_names: List[str]) -> Path:
+    """
+    Creates a user directory whose `versions.json` lists the given cache versions, and
+    whose `hashes.json` has no hashes registered yet.
+    """
+    user_dir = tmp_path / 'user'
+    user_dir.mkdir()
+    (user_dir / 'hashes.json').write_text('{}')
+
+    with open(user_dir / 'versions.json', 'w') as w:
+        json.dump({'versions': [{'name': name, 'url': 'http://localhost/' + name}
+                                for name in version_names]}, w)
+
+    return user_dir
+
+
+def make_manager(tmp_path: Path, version_names: List[str], **kwargs: Any) -> CacheManager:
+    """
+    Creates a `CacheManager` for a fresh user directory and fresh cache roots.
+    """
+    return CacheManager(
+        user_dir=str(make_user_dir(tmp_path, version_names)),
+        playable_root=str(tmp_path / 'playable'),
+        offline_root=str(tmp_path / 'offline'),
+        **kwargs,
+    )
+
+
+def write_archive(
+    archive_path: Path,
+    manifest: VMDict,
+    members: Dict[str, bytes],
+) -> None:
+    """
+    Writes a version pack archive with the given manifest and member contents.
+    """
+    with tarfile.open(archive_path, mode='w') as archive:
+        manifest_data = json.dumps(manifest).encode('utf-8')
+        members = {ARCHIVE_MANIFEST: manifest_data, **members}
+
+        for name, data in members.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            archive.addfile(member, io.BytesIO(data))
+
+
+async def run_operation(
+    manager: CacheManager,
+    operation: str,
+    *args: Any,
+    **kwargs: Any,
+) -> List[VMDict]:
+    """
+    Runs an operation on the manager to completion, and returns everything it reported.
+    """
+    async with manager:
+        return [changes async for changes in manager.run(operation, *args, **kwargs)]
+
+
+# Retries
+
+
+def status_error(status_code: int) -> httpx.HTTPStatusError:
+    """
+    Creates the error that `raise_for_status` raises for the given status code.
+    """
+    request = httpx.Request('GET', 'http://localhost/main.unity3d')
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError('', request=request, response=response)
+
+
+@pytest.mark.parametrize('error, permanent', [
+    (status_error(404), True),
+    (status_error(403), True),
+    (status_error(408), False),
+    (status_error(416), False),
+    (status_error(429), False),
+    (status_error(500), False),
+    (status_error(503), False),
+    (httpx.ConnectTimeout(''), False),
+    (CircuitOpenError(), True),
+])
+def test_permanent_errors(error: Exception, permanent: bool) -> None:
+    assert is_permanent_error(error) == permanent
+
+
+def test_retry_delay_is_bounded() -> None:
+    assert all(0 <= retry_delay(attempt) <= RETRY_MAX_DELAY for attempt in range(20))
+
+
+# Serve
+
+
+@pytest.mark.parametrize('range_header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=900-5000', (900, 999)),
+    ('bytes=1000-', None),
+    ('bytes=-0', None),
+    ('bytes=99-0', None),
+    ('bytes=0-1,5-9', None),
+    ('lines=0-1', None),
+    ('bytes=a-b', None),
+])
+def test_parse_range(range_header: str, expected: Any) -> None:
+    assert parse_range(range_header, 1000) == expected
+
+
+# Import
+
+
+@pytest.mark.parametrize('rel_path', [
+    'main.unity3d',
+    'assets/level.unity3d',
+])
+def test_safe_member_paths(rel_path: str) -> None:
+    assert is_safe_member_path(rel_path)
+
+
+@pytest.mark.parametrize('rel_path', [
+    '',
+    '../pwned.txt',
+    'assets/../../pwned.txt',
+    './main.unity3d',
+    'assets//main.unity3d',
+    '/etc/pwned.txt',
+    'C:/pwned.txt',
+    'C:pwned.txt',
+    '..\\pwned.txt',
+])
+def test_unsafe_member_paths(rel_path: str) -> None:
+    assert not is_safe_member_path(rel_path)
+
+
+def test_import_rejects_paths_outside_cache(tmp_path: Path) -> None:
+    data = b'pwned'
+    rel_path = '../../pwned.txt'
+    archive_path = tmp_path / 'pack.tar'
+    write_archive(
+        archive_path,
+        {'v1': {'offline_size': len(data),
+                'offline': {rel_path: hashlib.sha256(data).hexdigest()}}},
+        {f'v1/offline/{rel_path}': data},
+    )
+
+    manager = make_manager(tmp_path, ['v1'])
+    with pytest.raises(ValueError):
+        asyncio.run(run_operation(manager, 'import', 'v1', 'offline',
+                                  archive_path=str(archive_path)))
+
+    assert not (tmp_path / 'pwned.txt').exists()
+    assert not (tmp_path / 'offline' / 'pwned.txt').exists()
+    assert not manager.hash_dict['v1']['offline']
+
+
+def test_import_recomputes_missing_size(tmp_path: Path) -> None:
+    data = b'cache file contents'
+    archive_path = tmp_path / 'pack.tar'
+    write_archive(
+        archive_path,
+        {'v1': {'offline': {'main.unity3d': hashlib.sha256(data).hexdigest()}}},
+        {'v1/offline/main.unity3d': data},
+    )
+
+    manager = make_manager(tmp_path, ['v1'])
+    asyncio.run(run_operation(manager, 'import', 'v1', 'offline',
+                              archive_path=str(archive_path)))
+
+    assert (tmp_path / 'offline' / 'v1' / 'main.unity3d').read_bytes() == data
+    assert manager.size_dict['v1']['offline']['total'] == len(data)
+
+    with open(tmp_path / 'user' / 'hashes.json') as r:
+        assert json.load(r)['v1']['offline_size'] == len(data)
+
+
+# Priorities
+
+
+def test_priority_list_takes_first_observed_files(tmp_path: Path) -> None:
+    cache_dir = tmp_path / 'playable' / 'v1'
+    cache_dir.mkdir(parents=True)
+    for i in range(OBSERVED_PRIORITY_COUNT * 2):
+        file_path = cache_dir / f'{i:03}.unity3d'
+        file_path.write_bytes(b'')
+        os.utime(file_path, ns=(i * 10 ** 9, i * 10 ** 9))
+
+    manager = make_manager(tmp_path, ['v1'], download_order='priority')
+    priority_list = manager.build_priority_list({'default': ['main.unity3d']}, 'v1')
+
+    assert priority_list == ['main.unity3d'] + [
+        f'{i:03}.unity3d' for i in range(OBSERVED_PRIORITY_COUNT)]
+
+
+# Cancellation
+
+
+def test_cancel_while_waiting_for_locks(tmp_path: Path) -> None:
+    manager = make_manager(tmp_path, ['v1'])
+    lock_file = acquire_lock_file(tmp_path / 'user' / 'locks' / 'v1.offline.lock')
+
+    async def cancel_while_locked() -> List[VMDict]:
+        async with manager:
+            asyncio.get_running_loop().call_later(0.2, manager.cancel)
+            return [changes
+                    async for changes in manager.run('hash-check', 'v1', 'offline')]
+
+    try:
+        reported = asyncio.run(asyncio.wait_for(cancel_while_locked(), timeout=5))
+    finally:
+        release_lock_file(lock_file)
+
+    assert reported == []
+    assert 'v1' not in manager.size_dict
+
+
+def test_cancelled_operation_saves_sizes(tmp_path: Path) -> None:
+    data = b'cache file contents'
+    file_path = tmp_path / 'offline' / 'v1' / 'main.unity3d'
+    file_path.parent.mkdir(parents=True)
+    file_path.write_bytes(data)
+
+    manager = make_manager(tmp_path, ['v1'])
+    (tmp_path / 'user' / 'hashes.json').write_text(json.dumps({'v1': {
+        'playable_size': 0,
+        'offline_size': len(data),
+        'playable': {},
+        'offline': {'main.unity3d': hashlib.sha256(data).hexdigest()},
+    }}))
+
+    async def cancel_while_paused() -> None:
+        async with manager:
+            manager.pause()
+            asyncio.get_running_loop().call_later(0.2, manager.cancel)
+            async for _ in manager.run('hash-check', 'v1', 'offline'):
+                pass
+
+    asyncio.run(cancel_while_paused())
+
+    with open(tmp_path / 'user' / 'sizes.json') as r:
+        assert json.load(r)['v1']['offline']['sizes']['total'] == len(data)
+
+
+# Progress
+
+
+def test_progress_only_reports_own_collections(tmp_path: Path) -> None:
+    manager = make_manager(tmp_path, ['v1', 'v2'])
+
+    async def run_both() -> List[VMDict]:
+        async with manager:
+            async for _ in manager.run('hash-check', 'v1', 'offline'):
+                pass
+
+            return [changes
+                    async for changes in manager.run('hash-check', 'v2', 'offline')]
+
+    reported = asyncio.run(run_both())
+
+    assert reported
+    assert all(set(changes) == {'v2'} for changes in reported)
+
+
+def test_gc_reports_unknown_directories(tmp_path: Path) -> None:
+    other_dir = tmp_path / 'playable' / 'SomeOtherUnityGame'
+    other_dir.mkdir(parents=True)
+    (other_dir / 'data.unity3d').write_bytes(b'not ours')
+
+    reported = asyncio.run(run_operation(make_manager(tmp_path, ['v1']), 'gc', 'v1',
+                                         'playable', reclaim=True))
+
+    gc_report = reported[-1]['SomeOtherUnityGame']['playable']['gc']
+    assert gc_report['unknown_files'] == 1
+    assert (other_dir / 'data.unity3d').is_file()
+
+
+@pytest.mark.parametrize('last_version', [None, '', 'v1'])
+def test_gc_keeps_live_fusionfall_dir(tmp_path: Path, last_version: Any) -> None:
+    fusionfall_dir = tmp_path / 'playable' / 'FusionFall'
+    fusionfall_dir.mkdir(parents=True)
+    (fusionfall_dir / 'main.unity3d').write_bytes(b'live cache')
+
+    manager = make_manager(tmp_path, ['v1'])
+    if last_version is not None:
+        (tmp_path / 'user' / '.lastver').write_text(last_version)
+
+    asyncio.run(run_operation(manager, 'gc', 'v1', 'playable', reclaim=True))
+
+    assert (fusionfall_dir / 'main.unity3d').is_file()
+
+
+def test_gc_removes_fusionfall_dir_of_removed_version(tmp_path: Path) -> None:
+    fusionfall_dir = tmp_path / 'playable' / 'FusionFall'
+    fusionfall_dir.mkdir(parents=True)
+    (fusionfall_dir / 'main.unity3d').write_bytes(b'stale cache')
+
+    manager = make_manager(tmp_path, ['v1'])
+    (tmp_path / 'user' / '.lastver').write_text('v0')
+
+    reported = asyncio.run(run_operation(manager, 'gc', 'v1', 'playable', reclaim=True))
+
+    assert reported[-1]['FusionFall']['playable']['gc']['orphan_files'] == 1
+    assert not fusionfall_dir.exists()
+
+
+# Verification
+
+
+def test_digest_of_another_algorithm_is_not_a_mismatch(tmp_path: Path) -> None:
+    data = b'cache file contents'
+    file_path = tmp_path / 'offline' / 'v1' / 'main.unity3d'
+    file_path.parent.mkdir(parents=True)
+    file_path.write_bytes(data)
+    stat = file_path.stat()
+
+    manager = make_manager(tmp_path, ['v1'], verify_tier='digest')
+    (tmp_path / 'user' / 'hashes.json').write_text(json.dumps({'v1': {
+        'playable_size': 0,
+        'offline_size': len(data),
+        'playable': {},
+        'offline': {'main.unity3d': hashlib.sha256(data).hexdigest()},
+        'offline_stats': {'main.unity3d': {'size': stat.st_size,
+                                           'mtime': stat.st_mtime_ns,
+                                           'sample': '',
+                                           'digest': 'unknown:0123'}},
+    }}))
+
+    reported = asyncio.run(run_operation(manager, 'hash-check', 'v1', 'offline'))
+
+    assert reported[-1]['v1']['offline']['intact'] == len(data)
+    assert manager.hash_dict['v1']['offline_stats']['main.unity3d']['digest'] != (
+        'unknown:0123')